@@ -0,0 +1,185 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+
+from django.conf import settings
+
+# smaller bodies are answered from memory, a file would cost more than it saves
+BLOB_STORE_MIN_BYTES = 256 * 1024
+BLOB_STORE_MAX_BYTES = 1024 * 1024 * 1024
+# the store is pruned each time this fraction of its size was written, down to (1 - fraction) of its size
+BLOB_STORE_PRUNE_FRACTION = 0.1
+TEMPORARY_FILE_EXTENSION = '.tmp'
+DIGEST_CHUNK_BYTES = 64 * 1024
+
+RANGE_REGEX = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class StoredBody(object):
+    """
+    A representation body kept in a file, the cache entries keep it instead of the bytes.
+    'digest' is the sha256 of the content, when it is known
+    """
+    def __init__(self, path, size, digest=None):
+        self.path = path
+        self.size = size
+        self.digest = digest
+
+    def __len__(self):
+        return self.size
+
+    def exists(self):
+        return os.path.isfile(self.path)
+
+    def open(self):
+        a_file = open(self.path, 'rb')
+        # the modification time is the last use, the least recently used bodies are pruned first
+        os.utime(a_file.fileno())
+        return a_file
+
+    def sha256(self):
+        if self.digest is None:
+            digest = hashlib.sha256()
+            with open(self.path, 'rb') as a_file:
+                for chunk in iter(lambda: a_file.read(DIGEST_CHUNK_BYTES), b''):
+                    digest.update(chunk)
+            self.digest = digest.hexdigest()
+        return self.digest
+
+
+class FileRange(object):
+    """
+    A file-like of 'length' bytes of 'a_file' from 'first', a FileResponse streams it and closes the file
+    """
+    def __init__(self, a_file, first, length):
+        a_file.seek(first)
+        self.file = a_file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+class ContentAddressedStore(object):
+    """
+    Binary representation bodies on local disk, named by the sha256 of their content: <root>/<2 first hex digits>/<sha256>.
+    A body is written once however many representations share it and a file is never changed, so a removed file
+    only turns the cache entries referring it into misses. When settings.HYPER_RESOURCE_BLOB_STORE_MAX_BYTES (1GB)
+    is exceeded, the least recently used files are removed.
+    The root is settings.HYPER_RESOURCE_BLOB_STORE_DIR, a directory in the temporary directory by default
+    """
+    _instance = None
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(ContentAddressedStore, cls).__new__(cls, *args, **kwargs)
+            cls._instance.initialize()
+        return cls._instance
+
+    def initialize(self):
+        self.root = getattr(settings, 'HYPER_RESOURCE_BLOB_STORE_DIR', os.path.join(tempfile.gettempdir(), 'hyper_resource_blobs'))
+        self.min_bytes = getattr(settings, 'HYPER_RESOURCE_BLOB_STORE_MIN_BYTES', BLOB_STORE_MIN_BYTES)
+        self.max_bytes = getattr(settings, 'HYPER_RESOURCE_BLOB_STORE_MAX_BYTES', BLOB_STORE_MAX_BYTES)
+        self.bytes_written = 0 # since the last prune, by this process
+        self.lock = threading.Lock()
+
+    def path_of(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, body):
+        '''
+        Answers the StoredBody of 'body', it is written only if no body with the same content was stored
+        '''
+        digest = hashlib.sha256(body).hexdigest()
+        path = self.path_of(digest)
+        if os.path.isfile(path):
+            os.utime(path)
+            return StoredBody(path, len(body), digest)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # readers never see a half written body: it is written aside and renamed
+        temporary_path = '{0}.{1}.{2}{3}'.format(path, os.getpid(), threading.get_ident(), TEMPORARY_FILE_EXTENSION)
+        with open(temporary_path, 'wb') as body_file:
+            body_file.write(body)
+        os.replace(temporary_path, path)
+        self.written(len(body))
+        return StoredBody(path, len(body), digest)
+
+    def written(self, size):
+        with self.lock:
+            self.bytes_written += size
+            must_prune = self.bytes_written >= self.max_bytes * BLOB_STORE_PRUNE_FRACTION
+            if must_prune:
+                self.bytes_written = 0
+        if must_prune:
+            self.prune()
+
+    def prune(self):
+        '''
+        Removes the least recently used files until the store fits in (1 - BLOB_STORE_PRUNE_FRACTION) of max_bytes.
+        Every process sharing the store prunes it, a file removed by another one is skipped
+        '''
+        files = []
+        for directory_name in self.directory_names(self.root):
+            directory_path = os.path.join(self.root, directory_name)
+            for file_name in self.directory_names(directory_path):
+                if file_name.endswith(TEMPORARY_FILE_EXTENSION):
+                    continue
+                path = os.path.join(directory_path, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        total_bytes = sum(size for _, size, _ in files)
+        if total_bytes <= self.max_bytes:
+            return
+
+        for _, size, path in sorted(files):
+            if total_bytes <= self.max_bytes * (1 - BLOB_STORE_PRUNE_FRACTION):
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+    def directory_names(self, path):
+        try:
+            return os.listdir(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return []
+
+
+def byte_range(range_header, size):
+    '''
+    Answers (first, last) of the single byte range of 'range_header' for a body of 'size' bytes, or None when the whole
+    body must be answered (no header, several ranges or an invalid header).
+    Raises ValueError when the range is not satisfiable
+    '''
+    match = RANGE_REGEX.match(range_header.strip()) if range_header else None
+    if match is None or match.groups() == ('', ''):
+        return None
+
+    first, last = match.groups()
+    if first == '':
+        # bytes=-<n> are the last n bytes
+        if int(last) == 0 or size == 0:
+            raise ValueError('"' + range_header + '" is not satisfiable')
+        return max(size - int(last), 0), size - 1
+
+    if last != '' and int(last) < int(first):
+        return None
+    if int(first) >= size:
+        raise ValueError('"' + range_header + '" is not satisfiable')
+    return int(first), size - 1 if last == '' else min(int(last), size - 1)
@@ -10,9 +10,12 @@ from django.contrib.gis.db.models import PolygonField
 from django.contrib.gis.gdal import OGRGeometry
 from django.contrib.gis.gdal import SpatialReference
 from django.contrib.gis.geos import GEOSGeometry, Point, Polygon, MultiPolygon,LineString, MultiLineString, MultiPoint, GeometryCollection
+import json
 from datetime import date, datetime
 from time import *
 from copy import deepcopy
+from functools import lru_cache
+from types import MappingProxyType
 
 from django.contrib.gis.geos.prepared import PreparedGeometry
 from django.db.models import *
@@ -26,11 +29,14 @@ from hyper_resource.resources import FeatureResource
 from hyper_resource.resources.AbstractResource import *
 from hyper_resource.resources.AbstractCollectionResource import GROUP_BY_SUM_PROPERTY_NAME
 from django.db.models.fields import NOT_PROVIDED
+from django.conf import settings
 
 from hyper_resource.resources.FeatureResource import FEATURE_RESOURCE_TYPE
 from hyper_resource.utils import IMAGE_RESOURCE_TYPE
+from hyper_resource.response_cache import LRUCache
 
 HYPER_RESOURCE_SUPPORTED_OPERATIONS_LABEL = "hydra:supportedOperations" #todo: change to something like "hyper:supportedOperations" when created hyper vocab
+CONTEXT_CACHE_MAX_BYTES = 16 * 1024 * 1024
 
 class Reflection:
 
@@ -45,6 +51,8 @@ class Reflection:
                 callable ( getattr ( a_class, method ) ) and a_class.is_not_private ( method )]
 
 
+# built once, the same read only dict is answered to every caller
+@lru_cache(maxsize=None)
 def vocabularyDict():
     dict = {}
     dict[BooleanField] = 'http://schema.org/Boolean'
@@ -138,6 +146,12 @@ def vocabularyDict():
     dict['count_elements'] = 'http://opengis.org/operations/count_elements'
     #dict['offset_limit'] = 'http://opengis.org/operations/offset_limit'
     dict['offset-limit'] = "http://ggt-des.ibge.gov.br/api/operations-list/collection-operation-interface-list/4"
+    dict['cursor-limit'] = 'http://opengis.org/operations/cursor-limit'
+    dict['tiles'] = 'http://opengis.org/operations/tiles'
+    dict['map-image'] = 'http://opengis.org/operations/map-image'
+    dict['png-tiles'] = 'http://opengis.org/operations/png-tiles'
+    dict['window'] = 'http://opengis.org/operations/window'
+    dict['bbox'] = 'http://opengis.org/operations/bbox'
     dict['distance_lte'] = 'http://opengis.org/operations/distance_lte'
     #dict['area'] = 'http://opengis.org/operations/area'
     dict['area'] = "http://ggt-des.ibge.gov.br/api/operations-list/spatial-operation-interface-list/77"
@@ -249,8 +263,10 @@ def vocabularyDict():
     dict[GDALRaster] = "https://schema.org/ImageObject"
     dict[RasterField] = "https://schema.org/ImageObject"
 
-    return dict
+    return MappingProxyType(dict)
 
+# built once, the same read only dict is answered to every caller
+@lru_cache(maxsize=None)
 def OperationVocabularyDict():
     dic = {}
     #dic[int] = ["http://ggt-des.ibge.gov.br/api/operations-list/integer-operations-interface/"]
@@ -279,8 +295,10 @@ def OperationVocabularyDict():
     dic[MultiPolygonField] = ["http://ggt-des.ibge.gov.br/api/operations-list/spatial-operation-interface-list"]
     dic[MultiPolygon] = ["http://ggt-des.ibge.gov.br/api/operations-list/spatial-operation-interface-list"]
 
-    return dic
+    return MappingProxyType(dic)
 
+# built once, the same read only dict is answered to every caller
+@lru_cache(maxsize=None)
 def mediaTypeDict():
     dicti = {}
     geometric_media_types = [CONTENT_TYPE_GEOJSON, CONTENT_TYPE_OCTET_STREAM, CONTENT_TYPE_IMAGE_PNG]
@@ -290,16 +308,42 @@ def mediaTypeDict():
     dicti[FeatureCollection] = geometric_media_types
     dicti['Feature'] = geometric_media_types
     dicti[FeatureModel] = geometric_media_types
-    return dicti
+    return MappingProxyType(dicti)
 
 def vocabulary(a_key):
-    return vocabularyDict()[a_key] if a_key in vocabularyDict() else None
+    return vocabularyDict().get(a_key)
 
 def operation_vocabulary(a_key):
-    return OperationVocabularyDict()[a_key] if a_key in OperationVocabularyDict() else None
+    return OperationVocabularyDict().get(a_key)
 
 def media_type_for_resource_type(resource_type):
-    return mediaTypeDict()[resource_type] if resource_type in mediaTypeDict() else None
+    return mediaTypeDict().get(resource_type)
+
+
+class ContextCache(object):
+    """
+    The parts of the contexts that do not depend on the request are compiled once and kept as JSON,
+    each request decodes its own (mutable) copy instead of building and deep copying the context again
+    """
+    _instance = None
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(ContextCache, cls).__new__(cls, *args, **kwargs)
+            cls._instance.initialize()
+        return cls._instance
+
+    def initialize(self):
+        self.encoded_contexts = LRUCache(getattr(settings, 'HYPER_RESOURCE_CONTEXT_CACHE_MAX_BYTES', CONTEXT_CACHE_MAX_BYTES))
+
+    def context_for(self, key, build_context):
+        '''
+        Answers a new copy of the context identified by 'key', build_context() is called only if it is not compiled yet
+        '''
+        encoded_context = self.encoded_contexts.get(key)
+        if encoded_context is None:
+            encoded_context = json.dumps(build_context())
+            self.encoded_contexts.set(key, encoded_context)
+        return json.loads(encoded_context)
 
 
 class SupportedProperty():
@@ -381,6 +425,8 @@ class SupportedOperator():
             "@id": self.link
         }
 
+# built once, the same read only dict is answered to every caller
+@lru_cache(maxsize=None)
 def initialize_dict():
     dict = {}
     oc = BaseOperationController()
@@ -419,7 +465,7 @@ def initialize_dict():
 
     epoc = EntryPointResourceOperationController()
     dict['EntryPoint'] = epoc.collection_operations_dict()
-    return dict
+    return MappingProxyType(dict)
 
 class ContextResource:
 
@@ -599,8 +645,11 @@ class ContextResource:
         return [supportedAttribute.context() for supportedAttribute in arr_dict]
 
     def supportedOperationsFor(self, object, object_type=None):
-        dict = initialize_dict()
         a_type = object_type or type(object)
+        return ContextCache().context_for(('hydra:supportedOperations', a_type), lambda: self.supported_operations_for_type(a_type))
+
+    def supported_operations_for_type(self, a_type):
+        dict = initialize_dict()
         dict_operations = dict[a_type] if a_type in dict else {}
 
         arr = []
@@ -713,23 +762,32 @@ class ContextResource:
             dicti['availableFormats'].append({ "format": media_type })
         return dicti
 
-    def initalize_context(self, resource_type):
-        self.dict_context = {}
-        self.dict_context["@context"] = self.attributes_contextualized_dict()
-        self.dict_context["hydra:supportedProperties"] = self.supportedProperties()
-        self.dict_context["hydra:supportedOperations"] = self.supportedOperationsFor(self.resource.object_model, resource_type)
-        self.dict_context["hydra:representationName"] = self.representationName()
-        self.dict_context["hydra:iriTemplate"] = self.iriTemplates()
-        self.dict_context.update(self.get_default_context_superclass())
-        self.dict_context.update(self.get_default_resource_type_identification())
-        #self.dict_context.update(self.available_formats_for(resource_type)) #todo: future hypermidia control
+    def request_independent_context(self, resource_type):
+        dict_context = {}
+        dict_context["@context"] = self.attributes_contextualized_dict()
+        dict_context["hydra:supportedProperties"] = self.supportedProperties()
+        dict_context["hydra:supportedOperations"] = self.supportedOperationsFor(self.resource.object_model, resource_type)
+        dict_context["hydra:representationName"] = self.representationName()
+        dict_context["hydra:iriTemplate"] = None # depends on the host and path of the request
+        dict_context.update(self.get_default_context_superclass())
+        dict_context.update(self.get_default_resource_type_identification())
+        #dict_context.update(self.available_formats_for(resource_type)) #todo: future hypermidia control
+        return dict_context
+
+    def compiled_context(self, resource_type):
+        context_key = (type(self), type(self.resource), resource_type)
+        dict_context = ContextCache().context_for(context_key, lambda: self.request_independent_context(resource_type))
+        dict_context["hydra:iriTemplate"] = self.iriTemplates()
+        return dict_context
 
+    def initalize_context(self, resource_type):
+        self.dict_context = self.compiled_context(resource_type)
         return deepcopy(self.dict_context)
 
     def context(self, resource_type=None):
         if self.dict_context is None:
             resource_type = resource_type if resource_type is not None else self.resource.default_resource_type()
-            self.initalize_context(resource_type)
+            return self.initalize_context(resource_type)
         return deepcopy(self.dict_context)
 
 class FeatureResourceContext(ContextResource):
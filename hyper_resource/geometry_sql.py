@@ -0,0 +1,203 @@
+from django.contrib.gis.db.models.functions import Centroid, Difference, Envelope, GeoFunc, GeomOutputGeoFunc,\
+    Intersection, IsValid, NumPoints, PointOnSurface, SymDifference, Transform, Union
+from django.contrib.gis.geos import GEOSGeometry
+from django.db import connections
+from django.db.models import BooleanField, FloatField, IntegerField, TextField
+
+from hyper_resource.models import ConverterType
+
+
+# GEOS measures in the units of the geometry's spatial reference, the django's Area, Length and Distance
+# answer Measure objects (geodetic for geographic srids), so the planar PostGIS routines are called directly
+
+class PlanarArea(GeoFunc):
+    function = 'ST_Area'
+    output_field = FloatField()
+
+
+class PlanarLength(GeoFunc):
+    function = 'ST_Length'
+    output_field = FloatField()
+
+
+class PlanarDistance(GeoFunc):
+    function = 'ST_Distance'
+    geom_param_pos = (0, 1)
+    output_field = FloatField()
+
+
+class Buffer(GeomOutputGeoFunc):
+    function = 'ST_Buffer'
+
+
+class Simplify(GeomOutputGeoFunc):
+    function = 'ST_Simplify'
+
+
+class SimplifyPreserveTopology(GeomOutputGeoFunc):
+    function = 'ST_SimplifyPreserveTopology'
+
+
+class ConvexHull(GeomOutputGeoFunc):
+    function = 'ST_ConvexHull'
+
+
+class Boundary(GeomOutputGeoFunc):
+    function = 'ST_Boundary'
+
+
+class IsEmpty(GeoFunc):
+    function = 'ST_IsEmpty'
+    output_field = BooleanField()
+
+
+class IsSimple(GeoFunc):
+    function = 'ST_IsSimple'
+    output_field = BooleanField()
+
+
+class Srid(GeoFunc):
+    function = 'ST_SRID'
+    output_field = IntegerField()
+
+
+# unlike django's AsGeoJSON, no precision is sent: the database default is the same used by the collections
+class GeoJSON(GeoFunc):
+    function = 'ST_AsGeoJSON'
+    output_field = TextField()
+
+
+class SpatialPredicate(GeoFunc):
+    geom_param_pos = (0, 1)
+    output_field = BooleanField()
+
+
+class Contains(SpatialPredicate):
+    function = 'ST_Contains'
+
+
+class Crosses(SpatialPredicate):
+    function = 'ST_Crosses'
+
+
+class Disjoint(SpatialPredicate):
+    function = 'ST_Disjoint'
+
+
+class Equals(SpatialPredicate):
+    function = 'ST_Equals'
+
+
+class Intersects(SpatialPredicate):
+    function = 'ST_Intersects'
+
+
+class Overlaps(SpatialPredicate):
+    function = 'ST_Overlaps'
+
+
+class Touches(SpatialPredicate):
+    function = 'ST_Touches'
+
+
+class Within(SpatialPredicate):
+    function = 'ST_Within'
+
+
+class GeometryOperationCompiler(object):
+    """
+    Translates the GEOSGeometry operations of a path (like 'buffer/0.2' or 'area') into the equivalent
+    database functions, so they are computed by the database for the whole queryset at once.
+    compile() answers None when an operation has no equivalent, the caller should then execute it in python
+    """
+    _instance = None
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(GeometryOperationCompiler, cls).__new__(cls, *args, **kwargs)
+            cls._instance.initialize()
+        return cls._instance
+
+    def initialize(self):
+        # operation name => (function, types of the parameters, how many parameters are optional)
+        self.functions_by_operation_name = {
+            'area':             (PlanarArea, [], 0),
+            'boundary':         (Boundary, [], 0),
+            'buffer':           (Buffer, [float, int], 1),
+            'centroid':         (Centroid, [], 0),
+            'contains':         (Contains, [GEOSGeometry], 0),
+            'convex_hull':      (ConvexHull, [], 0),
+            'crosses':          (Crosses, [GEOSGeometry], 0),
+            'difference':       (Difference, [GEOSGeometry], 0),
+            'disjoint':         (Disjoint, [GEOSGeometry], 0),
+            'distance':         (PlanarDistance, [GEOSGeometry], 0),
+            'empty':            (IsEmpty, [], 0),
+            'envelope':         (Envelope, [], 0),
+            'equals':           (Equals, [GEOSGeometry], 0),
+            'intersection':     (Intersection, [GEOSGeometry], 0),
+            'intersects':       (Intersects, [GEOSGeometry], 0),
+            'length':           (PlanarLength, [], 0),
+            'num_coords':       (NumPoints, [], 0),
+            'num_points':       (NumPoints, [], 0),
+            'overlaps':         (Overlaps, [GEOSGeometry], 0),
+            'point_on_surface': (PointOnSurface, [], 0),
+            'simple':           (IsSimple, [], 0),
+            'simplify':         (Simplify, [float], 1),
+            'srid':             (Srid, [], 0),
+            'sym_difference':   (SymDifference, [GEOSGeometry], 0),
+            'touches':          (Touches, [GEOSGeometry], 0),
+            'transform':        (Transform, [int], 0),
+            'union':            (Union, [GEOSGeometry], 0),
+            'valid':            (IsValid, [], 0),
+            'within':           (Within, [GEOSGeometry], 0),
+        }
+
+    def database_supports(self, alias):
+        return getattr(connections[alias].ops, 'postgis', False)
+
+    def operation_is_supported(self, operation_name):
+        return operation_name in self.functions_by_operation_name
+
+    def converted_parameters(self, parameter_types, parameters):
+        converted_parameters = []
+        for parameter_type, parameter in zip(parameter_types, parameters):
+            if parameter_type is GEOSGeometry:
+                parameter = ConverterType().convert_to_geometry(parameter)
+                # geometries without srid can not be sent to the database
+                if parameter is None or not parameter.srid:
+                    return None
+                converted_parameters.append(parameter)
+            else:
+                converted_parameters.append(parameter_type(parameter))
+        return converted_parameters
+
+    def compile(self, expression, operation_name, parameters):
+        '''
+        Answers the database function applying 'operation_name' to 'expression' (a field name or another
+        function) with the parameters as they are in the path, or None if it can not be done in the database
+        '''
+        if not self.operation_is_supported(operation_name):
+            return None
+
+        function, parameter_types, optional_count = self.functions_by_operation_name[operation_name]
+        if not len(parameter_types) - optional_count <= len(parameters) <= len(parameter_types):
+            return None
+
+        try:
+            converted_parameters = self.converted_parameters(parameter_types, parameters)
+        except (TypeError, ValueError):
+            return None
+        if converted_parameters is None:
+            return None
+
+        return function(expression, *converted_parameters)
+
+    def compile_chain(self, expression, operations):
+        '''
+        Answers one nested database function applying, in order, the operations (pairs of operation name and
+        parameters as they are in the path) to 'expression', or None if any of them can not be done in the database
+        '''
+        for operation_name, parameters in operations:
+            expression = self.compile(expression, operation_name, parameters)
+            if expression is None:
+                return None
+        return expression
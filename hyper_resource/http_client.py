@@ -0,0 +1,159 @@
+import http.cookiejar
+import re
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from hyper_resource.response_cache import LRUCache
+
+HTTP_CONNECT_TIMEOUT_SECONDS = 3.05
+HTTP_READ_TIMEOUT_SECONDS = 30
+# keep-alive connections kept by host, each worker thread has its own pool
+HTTP_POOL_MAXSIZE = 4
+HTTP_CACHE_MAX_BYTES = 32 * 1024 * 1024
+HTTP_CACHE_MAX_ENTRY_BYTES = 4 * 1024 * 1024
+
+MAX_AGE_REGEX = re.compile(r'(?:^|,)\s*(s-maxage|max-age)\s*=\s*"?(\d+)"?', re.IGNORECASE)
+
+
+class CachedResponse(object):
+    """
+    The parts of a requests.Response needed to answer it again, with its freshness and validators
+    """
+    def __init__(self, response, fresh_until):
+        self.status_code = response.status_code
+        self.reason = response.reason
+        self.headers = dict(response.headers)
+        self.content = response.content
+        self.encoding = response.encoding
+        self.fresh_until = fresh_until
+
+    def __len__(self):
+        return len(self.content)
+
+    def is_fresh(self):
+        return time.time() < self.fresh_until
+
+    def etag(self):
+        return CaseInsensitiveDict(self.headers).get('ETag')
+
+    def last_modified(self):
+        return CaseInsensitiveDict(self.headers).get('Last-Modified')
+
+    def conditional_headers(self):
+        headers = {}
+        if self.etag() is not None:
+            headers['If-None-Match'] = self.etag()
+        if self.last_modified() is not None:
+            headers['If-Modified-Since'] = self.last_modified()
+        return headers
+
+    def revalidated(self, not_modified_response, fresh_until):
+        # a 304 answers the headers that changed (ETag, Cache-Control, Expires ...)
+        self.headers.update(not_modified_response.headers)
+        self.fresh_until = fresh_until
+        return self
+
+    def response(self, url):
+        response = requests.models.Response()
+        response.status_code = self.status_code
+        response.reason = self.reason
+        response.headers = CaseInsensitiveDict(self.headers)
+        response._content = self.content
+        response.encoding = self.encoding
+        response.url = url
+        return response
+
+
+class HttpClient(object):
+    """
+    HTTP client for the remote resources used as operation parameters (geometries, join and complex request sources).
+    Connections are kept alive by host, every request has a timeout and the responses with validators
+    (ETag/Last-Modified) or a max-age are cached: a fresh response is answered without a request and
+    a stale one is revalidated with a conditional request
+    """
+    _instance = None
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(HttpClient, cls).__new__(cls, *args, **kwargs)
+            cls._instance.initialize()
+        return cls._instance
+
+    def initialize(self):
+        self.timeout = (getattr(settings, 'HYPER_RESOURCE_HTTP_CONNECT_TIMEOUT', HTTP_CONNECT_TIMEOUT_SECONDS),
+                        getattr(settings, 'HYPER_RESOURCE_HTTP_READ_TIMEOUT', HTTP_READ_TIMEOUT_SECONDS))
+        self.pool_maxsize = getattr(settings, 'HYPER_RESOURCE_HTTP_POOL_MAXSIZE', HTTP_POOL_MAXSIZE)
+        self.responses = LRUCache(getattr(settings, 'HYPER_RESOURCE_HTTP_CACHE_MAX_BYTES', HTTP_CACHE_MAX_BYTES),
+                                  HTTP_CACHE_MAX_ENTRY_BYTES)
+        # requests.Session is not thread safe (cookies, adapters), so each thread has its own
+        self.sessions = threading.local()
+
+    def session(self):
+        session = getattr(self.sessions, 'session', None)
+        if session is None:
+            session = requests.Session()
+            # the session is shared by the requests of every user, a cookie set for one must not be sent for another
+            session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+            adapter = HTTPAdapter(pool_maxsize=self.pool_maxsize)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self.sessions.session = session
+        return session
+
+    def freshness_seconds(self, response):
+        '''
+        Answers for how many seconds 'response' can be used without revalidation or None if it must not be stored
+        '''
+        cache_control = response.headers.get('Cache-Control', '').lower()
+        if 'no-store' in cache_control:
+            return None
+        if 'no-cache' in cache_control:
+            return 0
+        max_ages = dict((name.lower(), int(seconds)) for name, seconds in MAX_AGE_REGEX.findall(cache_control))
+        return max_ages.get('s-maxage', max_ages.get('max-age', 0))
+
+    def is_cacheable(self, response, freshness_seconds):
+        if response.status_code != 200 or freshness_seconds is None:
+            return False
+        has_validator = 'ETag' in response.headers or 'Last-Modified' in response.headers
+        return has_validator or freshness_seconds > 0
+
+    def get(self, url, headers=None):
+        '''
+        Answers the requests.Response of GET 'url', from the cache when it is still fresh or was not modified
+        '''
+        headers = dict(headers or {})
+        cache_key = (url, tuple(sorted(headers.items())))
+        cached_response = self.responses.get(cache_key)
+        if cached_response is not None and cached_response.is_fresh():
+            return cached_response.response(url)
+
+        request_headers = dict(headers)
+        if cached_response is not None:
+            request_headers.update(cached_response.conditional_headers())
+        response = self.session().get(url, headers=request_headers, timeout=self.timeout)
+
+        freshness_seconds = self.freshness_seconds(response)
+        if cached_response is not None and response.status_code == 304:
+            if freshness_seconds is None:
+                self.responses.delete(cache_key)
+                return cached_response.response(url)
+            cached_response = cached_response.revalidated(response, time.time() + freshness_seconds)
+            self.responses.set(cache_key, cached_response)
+            return cached_response.response(url)
+
+        if self.is_cacheable(response, freshness_seconds):
+            self.responses.set(cache_key, CachedResponse(response, time.time() + freshness_seconds))
+        else:
+            self.responses.delete(cache_key)
+        return response
+
+    def validator_of(self, response):
+        '''
+        Answers the ETag (or Last-Modified) of 'response', it identifies the version of the document
+        '''
+        return response.headers.get('ETag') or response.headers.get('Last-Modified')
@@ -2,8 +2,12 @@
 import importlib
 import inspect
 import json
+import hashlib
 import re
-from collections import OrderedDict
+import time as time_module
+from collections import OrderedDict, namedtuple
+from functools import lru_cache, wraps
+from types import MappingProxyType
 from datetime import date, datetime, time
 from decimal import Decimal
 
@@ -13,7 +17,8 @@ from django.contrib.gis.db import models
 from django.contrib.gis.db.models import Q, RasterField
 # Create your models here.
 from django.contrib.gis.gdal import OGRGeometry, GDALRaster
-from django.contrib.gis.gdal import SpatialReference
+from django.contrib.gis.gdal import SpatialReference, GDALException
+from django.contrib.gis.geos.error import GEOSException
 from django.contrib.gis.geos import GEOSGeometry
 from django.contrib.gis.geos import GeometryCollection
 from django.contrib.gis.geos import LineString
@@ -30,11 +35,22 @@ from django.contrib.gis.db.models import MultiPolygonField
 from django.contrib.gis.db.models import PointField
 from django.contrib.gis.db.models import PolygonField
 from django.contrib.gis.db.models import ForeignKey
-from django.db.utils import ConnectionDoesNotExist, ProgrammingError
+from django.db.utils import ConnectionDoesNotExist, DatabaseError, ProgrammingError
 from requests import ConnectionError
 from requests import HTTPError
-from django.db import connections, connection
+from requests import Timeout
+from django.db import connections, connection, transaction
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
 from .utils import *
+from .tiles import tile_bounds, WEB_MERCATOR_SRID
+from .resolver import LocalIRIResolver
+from .http_client import HttpClient
+from .response_cache import LRUCache
+from .tile_store import DiskTileStore
+from .path_parser import parse_path, path_segments_with_url
 
 class FeatureCollection(GeometryCollection):
     pass
@@ -67,6 +83,21 @@ def boolean_operator():
 def logical_operator():
     return ['or', 'and', '*or', '*and']
 
+LOGICAL_AND = 'and'
+LOGICAL_OR = 'or'
+FILTER_GROUP_OPEN = '('
+FILTER_GROUP_CLOSE = ')'
+FILTER_PLAN_CACHE_SIZE = 1024
+GEOMETRY_LITERAL_CACHE_SIZE = 256
+REMOTE_GEOMETRY_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+@lru_cache(maxsize=GEOMETRY_LITERAL_CACHE_SIZE)
+def geometry_from_literal(geometry_literal):
+    '''
+    Answers the geometry of a WKT/EWKT/GeoJSON/HEX literal, parsed once. The answer is shared, clone it before using
+    '''
+    return GEOSGeometry(geometry_literal)
+
 class Type_Called:
     """
     Type_called is a definition type that contains a name,
@@ -114,12 +145,55 @@ REPRESENTATION = {
     Q: [Q],
 }
 
+INNER_JOIN = 'inner'
+LEFT_JOIN = 'left'
+JOIN_TYPES = (INNER_JOIN, LEFT_JOIN)
+
 class JoinOperation():
-    def __init__(self, left_join_data, left_join_attr, right_join_attr, right_join_data):
+    def __init__(self, left_join_data, left_join_attr, right_join_attr, right_join_data, join_type=INNER_JOIN):
         self.left_join_data = left_join_data
         self.left_join_attr = left_join_attr
         self.right_join_attr = right_join_attr
         self.right_join_data = right_join_data
+        self.join_type = join_type
+
+    def is_left_join(self):
+        return self.join_type == LEFT_JOIN
+
+    def hashable_value(self, value):
+        # lists and dicts are compared by their content, as '==' does
+        try:
+            hash(value)
+            return value
+        except TypeError:
+            return json.dumps(value, sort_keys=True)
+
+    def right_join_dict_list(self):
+        return self.right_join_data if type(self.right_join_data) is list else [self.right_join_data]
+
+    def joined_pairs(self, left_elements, left_value_of):
+        '''
+        Yields (left element, list of the right dicts whose right_join_attr equals the left value), in the order of
+        left_elements. Inner joins skip the left elements without matches, left joins yield them with an empty list.
+        The hash index is built on the smaller side, so the cost is linear in the size of both sides
+        '''
+        right_dict_list = self.right_join_dict_list()
+
+        if len(right_dict_list) <= len(left_elements):
+            matches_by_value = {}
+            for right_dict in right_dict_list:
+                matches_by_value.setdefault(self.hashable_value(right_dict[self.right_join_attr]), []).append(right_dict)
+        else:
+            matches_by_value = {self.hashable_value(left_value_of(element)): [] for element in left_elements}
+            for right_dict in right_dict_list:
+                matches = matches_by_value.get(self.hashable_value(right_dict[self.right_join_attr]))
+                if matches is not None:
+                    matches.append(right_dict)
+
+        for element in left_elements:
+            matches = matches_by_value.get(self.hashable_value(left_value_of(element)), [])
+            if matches or self.is_left_join():
+                yield element, matches
 
 class ConverterType():
 
@@ -128,8 +202,14 @@ class ConverterType():
     def __new__(cls, *args, **kwargs):
         if not cls._instance:
             cls._instance = super(ConverterType, cls).__new__(cls, *args, **kwargs)
+            cls._instance.initialize()
         return cls._instance
 
+    def initialize(self):
+        self.converter_by_type = self.converters_dict()
+        # geometries fetched from urls, as EWKB by (url, ETag or Last-Modified)
+        self.geometries_by_url_and_validator = LRUCache(getattr(settings, 'HYPER_RESOURCE_REMOTE_GEOMETRY_CACHE_MAX_BYTES', REMOTE_GEOMETRY_CACHE_MAX_BYTES))
+
     def value_has_url(self, value_str):
         return (value_str.find('http:') > -1) or (value_str.find('https:') > -1) or (value_str.find('www.') > -1)
 
@@ -193,9 +273,28 @@ class ConverterType():
         return gc
 
     def get_geos_geometry_from_request(self, url_as_str):
-        resp = requests.get(url_as_str)
+        required_object = LocalIRIResolver().required_object_for(url_as_str)
+        if required_object is not None:
+            if 400 <= required_object.status_code <= 599:
+                raise HTTPError({required_object.status_code: required_object.representation_object})
+            return LocalIRIResolver().geometry_from(required_object)
+
+        resp = HttpClient().get(url_as_str)
         if 400 <= resp.status_code <= 599:
             raise HTTPError({resp.status_code: resp.reason})
+
+        validator = HttpClient().validator_of(resp)
+        if validator is None:
+            return self.geometry_from_response(resp)
+
+        ewkb = self.geometries_by_url_and_validator.get((url_as_str, validator))
+        if ewkb is not None:
+            return GEOSGeometry(buffer(ewkb))
+        geometry = self.geometry_from_response(resp)
+        self.geometries_by_url_and_validator.set((url_as_str, validator), bytes(geometry.ewkb))
+        return geometry
+
+    def geometry_from_response(self, resp):
         if resp.headers['content-type'] == CONTENT_TYPE_OCTET_STREAM:
             return GEOSGeometry(buffer(resp.content))
 
@@ -238,12 +337,12 @@ class ConverterType():
             if self.value_has_url(value_as_str):
                return self.get_geos_geometry_from_request(value_as_str)
 
-            return GEOSGeometry(value_as_str)
-        except (ValueError, ConnectionError, HTTPError) as err:
+            return geometry_from_literal(value_as_str).clone()
+        except (ValueError, ConnectionError, HTTPError, Timeout) as err:
             print('Error: '.format(err))
 
 
-    def operation_to_convert_value(self, a_type):
+    def converters_dict(self):
         d = {}
         d[str] = self.convert_to_string
         d[int] = self.convert_to_int
@@ -273,7 +372,13 @@ class ConverterType():
         d[MultiPointField] = self.convert_to_geometry
         d[ForeignKey] = self.convert_to_int
 
-        return d[a_type]
+        return d
+
+    def operation_to_convert_value(self, a_type):
+        return self.converter_by_type[a_type]
+
+    def converter_or_None(self, a_type):
+        return self.converter_by_type.get(a_type)
 
     def value_converted(self, a_type, value):
         object_method = self.operation_to_convert_value(a_type)
@@ -281,8 +386,8 @@ class ConverterType():
 
     def convert_parameters(self, a_type, attribute_or_function_name, parameters):
 
-        if a_type in BaseOperationController().dict_all_operation_dict():
-            operation_dict = BaseOperationController().dict_all_operation_dict()[a_type]
+        operation_dict = BaseOperationController().operations_for_type(a_type)
+        if operation_dict is not None:
 
             if attribute_or_function_name in operation_dict:
                 type_called = operation_dict[attribute_or_function_name]
@@ -291,6 +396,75 @@ class ConverterType():
 
         return parameters
 
+IndexedField = namedtuple('IndexedField', [
+    'name',
+    'field',
+    'type',        # type(field)
+    'converter',   # ConverterType method that converts a value from the path or None
+    'srid',        # the SRID of a geometric/raster field or None
+    'is_indexed',  # primary key, unique or db/spatial index
+])
+
+class ModelFieldIndex(object):
+    """
+    The metadata of the fields of a model class, indexed by name.
+    Filter expressions and projections look up their attributes here instead of scanning _meta.fields for each term
+    """
+    def __init__(self, model_class):
+        self.model_class = model_class
+        self.fields = tuple(model_class._meta.fields)
+        self.field_names = tuple(field.name for field in self.fields)
+        self.indexed_field_by_name = OrderedDict((field.name, self.indexed_field_for(field)) for field in self.fields)
+        self.fields_by_type = {}
+
+    def indexed_field_for(self, field):
+        return IndexedField(
+            name=field.name,
+            field=field,
+            type=type(field),
+            converter=ConverterType().converter_or_None(type(field)),
+            srid=getattr(field, 'srid', None),
+            is_indexed=bool(field.primary_key or field.unique or field.db_index or getattr(field, 'spatial_index', False))
+        )
+
+    def has_field(self, field_name):
+        return field_name in self.indexed_field_by_name
+
+    def indexed_field(self, field_name):
+        return self.indexed_field_by_name.get(field_name)
+
+    def field(self, field_name):
+        indexed_field = self.indexed_field(field_name)
+        return indexed_field.field if indexed_field is not None else None
+
+    def field_type(self, field_name):
+        indexed_field = self.indexed_field(field_name)
+        return indexed_field.type if indexed_field is not None else None
+
+    def fields_of_type(self, a_type):
+        if a_type not in self.fields_by_type:
+            self.fields_by_type[a_type] = tuple(field for field in self.fields if isinstance(field, a_type))
+        return self.fields_by_type[a_type]
+
+class FieldIndexRegistry(object):
+    """
+    The ModelFieldIndex of each model class, built the first time the model is used.
+    Model fields do not change after the app registry is ready, so an index lives for the process lifetime
+    """
+    _instance = None
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(FieldIndexRegistry, cls).__new__(cls, *args, **kwargs)
+            cls._instance.index_by_model_class = {}
+        return cls._instance
+
+    def index_for(self, model_class):
+        field_index = self.index_by_model_class.get(model_class)
+        if field_index is None:
+            field_index = ModelFieldIndex(model_class)
+            self.index_by_model_class[model_class] = field_index
+        return field_index
+
 class QObjectFactory:
 
     def __init__(self, model_class, attribute_name, operation_or_operator, raw_value_as_str):
@@ -299,19 +473,18 @@ class QObjectFactory:
         self.operation_or_operator = operation_or_operator
         self.raw_value_as_str = raw_value_as_str
 
+    def field_index(self):
+        return FieldIndexRegistry().index_for(self.model_class)
+
     def fields(self):
-        return self.model_class._meta.fields
+        return self.field_index().fields
 
     def field_type(self):
-        for field in self.fields():
-            if field.name == self.attribute_name:
-                return type(field)
-        return None
+        return self.field_index().field_type(self.attribute_name)
 
     def convert_value_for(self, a_value):
-        converter = ConverterType()
-        field_type = self.field_type()
-        if field_type is None:
+        indexed_field = self.field_index().indexed_field(self.attribute_name)
+        if indexed_field is None:
             return None
         if isinstance(a_value, bool):
             return a_value
@@ -319,7 +492,9 @@ class QObjectFactory:
         if (a_value.lower() == 'false' or a_value.lower() == 'true'):
             return  False if a_value.lower() == 'false' else True
 
-        return converter.value_converted(self.field_type(), a_value)
+        if indexed_field.converter is None:
+            return ConverterType().value_converted(indexed_field.type, a_value)
+        return indexed_field.converter(a_value)
 
 
     def q_object_base_range(self, oper_operation):
@@ -376,10 +551,10 @@ class FactoryComplexQuery():
         return cls._instance
 
     def fields(self, model_class):
-        return model_class._meta.fields
+        return FieldIndexRegistry().index_for(model_class).fields
 
     def field_names(self, mode_class):
-        return [field.name for field in self.fields(mode_class)]
+        return list(FieldIndexRegistry().index_for(mode_class).field_names)
 
     def base_operators(self):
         return boolean_operator()
@@ -388,7 +563,7 @@ class FactoryComplexQuery():
         return logical_operator()
 
     def is_attribute(self, att_name, model_class):
-        return att_name in self.field_names(model_class)
+        return FieldIndexRegistry().index_for(model_class).has_field(att_name)
 
     def is_logical_operator(self, op):
        return op.lower() in self.logical_operators()
@@ -402,50 +577,343 @@ class FactoryComplexQuery():
 
     def q_object_for_filter_expression(self, q_object_or_none, model_class, expression_as_array):
         #'sigla/in/rj,es,go/and/data/between/2017-02-01,2017-06-30/' = ['sigla','in','rj,es,go','and','data', 'between','2017-02-01,2017-06-30']
-        if '' in expression_as_array:
-            expression_as_array.remove('')
+        q_object = FilterExpressionCompiler().plan_for(model_class, expression_as_array).q_object()
+        if q_object_or_none is None:
+            return q_object
+        if q_object is None:
+            return q_object_or_none
+        return q_object_or_none & q_object
 
-        if len(expression_as_array)  == 2 and expression_as_array[1].lower() in ['isnull', 'isnotnull']:
-            boolean = expression_as_array[1].lower() == 'isnull'
-            expression_as_array[1] = 'isnull'
-            expression_as_array.append(boolean)
+    def q_object_for_spatial_expression(self, q_object_or_none, model_class, expression_as_array):
+        #'geom/within/Polygon(10,10, 30, 30, 40, 40 , 10 10)/and/data/between/2017-02-01,2017-06-30/' = ['sigla','in','rj,es,go','and','data', 'between','2017-02-01,2017-06-30']
+        return self.q_object_for_filter_expression(q_object_or_none, model_class, expression_as_array)
 
-        if len(expression_as_array)  < 3:
-            return q_object_or_none
-        oper = expression_as_array[0]
-        if self.is_logical_operator(oper):
-           expression_as_array = expression_as_array[1:]
+class FilterTerm(object):
+    """
+    A leaf of a FilterPlan: <attribute>/<operator>/<value> or <attribute>/isnull|isnotnull
+    """
+    def __init__(self, model_class, attribute_name, operation_or_operator, raw_value):
+        self.q_object_factory = QObjectFactory(model_class, attribute_name, operation_or_operator, raw_value)
+        indexed_field = FieldIndexRegistry().index_for(model_class).indexed_field(attribute_name)
+        # a geometry given by an url is requested again each time, the resource can change between requests
+        self.value_from_request = indexed_field is not None and issubclass(indexed_field.type, GeometryField) and \
+                                  isinstance(raw_value, str) and ConverterType().value_has_url(raw_value)
 
-        if self.is_attribute(expression_as_array[0], model_class):
-            qof = QObjectFactory(model_class, expression_as_array[0], expression_as_array[1], expression_as_array[2])
-            #oper = qof.operation_or_operator
-        else:
-            if len(expression_as_array) > 3:
-                qof = QObjectFactory(model_class, expression_as_array[1], expression_as_array[2], expression_as_array[3])
-            else:
-                qof = QObjectFactory(model_class, expression_as_array[0], expression_as_array[1],
-                                     expression_as_array[2])
-            oper = expression_as_array[0]
+    def is_static(self):
+        return not self.value_from_request
 
-        q_object_expression = self.q_object_with_logical_operator(q_object_or_none, qof.q_object(), oper)
+    def q_object(self):
+        return self.q_object_factory.q_object()
 
-        return self.q_object_for_filter_expression(q_object_expression, model_class, expression_as_array[3:])
+class FilterGroup(object):
+    """
+    A node of a FilterPlan that joins its children with the same logical operator (and/or)
+    """
+    def __init__(self, logical_operator, children):
+        self.logical_operator = logical_operator
+        self.children = children
 
-    def q_object_for_spatial_expression(self, q_object_or_none, model_class, expression_as_array):
-        #'geom/within/Polygon(10,10, 30, 30, 40, 40 , 10 10)/and/data/between/2017-02-01,2017-06-30/' = ['sigla','in','rj,es,go','and','data', 'between','2017-02-01,2017-06-30']
-        if len(expression_as_array)  < 3:
-            return q_object_or_none
+    def is_static(self):
+        return all(child.is_static() for child in self.children)
+
+    def q_object(self):
+        q_object = self.children[0].q_object()
+        for child in self.children[1:]:
+            q_object = (q_object & child.q_object()) if self.logical_operator == LOGICAL_AND else (q_object | child.q_object())
+        return q_object
+
+class FilterPlan(object):
+    """
+    A filter expression compiled for a model class. When no value depends on a request, the Q object is built
+    (and its values converted) only once and shared by every request with the same expression
+    """
+    def __init__(self, root):
+        self.root = root
+        self.static_q_object = root.q_object() if root is not None and root.is_static() else None
+
+    def q_object(self):
+        if self.static_q_object is not None:
+            return self.static_q_object
+        return self.root.q_object() if self.root is not None else None
+
+class FilterExpressionParser(object):
+    """
+    Parses the terms of a filter expression, 'and' has precedence over 'or' and the segments '(' and ')' group terms.
+    Ex.: sigla/eq/rj/or/(/sigla/eq/es/and/data/gt/2017-02-01/)
+    """
+    def __init__(self, model_class, tokens):
+        self.model_class = model_class
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        '''
+        Answers the next token, logical operators are answered as 'and'/'or' ('*and', 'AND' ...)
+        '''
+        token = self.tokens[self.position] if self.position < len(self.tokens) else None
+        if isinstance(token, str) and token.lower() in logical_operator():
+            return token.lower().lstrip('*')
+        return token
+
+    def group_or_node(self, logical_operator, nodes):
+        nodes = [node for node in nodes if node is not None]
+        if len(nodes) == 0:
+            return None
+        return nodes[0] if len(nodes) == 1 else FilterGroup(logical_operator, nodes)
+
+    def parse(self):
+        # an expression starting with a logical operator (filter/and/sigla/...) was always accepted
+        if self.peek() in (LOGICAL_AND, LOGICAL_OR):
+            self.position += 1
+        root = self.parse_or()
+        if self.peek() is not None:
+            raise InvalidFilterExpression('"' + '/'.join(str(token) for token in self.tokens) + '" has unbalanced parentheses')
+        return root
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.peek() is not None and self.peek() != FILTER_GROUP_CLOSE:
+            # terms without a logical operator between them are joined by 'or', like they always were
+            if self.peek() == LOGICAL_OR:
+                self.position += 1
+            nodes.append(self.parse_and())
+        return self.group_or_node(LOGICAL_OR, nodes)
+
+    def parse_and(self):
+        nodes = [self.parse_factor()]
+        while self.peek() == LOGICAL_AND:
+            self.position += 1
+            nodes.append(self.parse_factor())
+        return self.group_or_node(LOGICAL_AND, nodes)
+
+    def parse_factor(self):
+        if self.peek() is None or self.peek() == FILTER_GROUP_CLOSE:
+            return None
+        if self.peek() == FILTER_GROUP_OPEN:
+            self.position += 1
+            node = self.parse_or()
+            if self.peek() != FILTER_GROUP_CLOSE:
+                raise InvalidFilterExpression('"' + '/'.join(str(token) for token in self.tokens) + '" has unbalanced parentheses')
+            self.position += 1
+            return node
+        return self.parse_term()
+
+    def parse_term(self):
+        term_tokens = self.tokens[self.position:self.position + 3]
+        if len(term_tokens) >= 2 and term_tokens[1].lower() in ['isnull', 'isnotnull']:
+            self.position += 2
+            return FilterTerm(self.model_class, term_tokens[0], 'isnull', term_tokens[1].lower() == 'isnull')
+        if len(term_tokens) < 3:
+            # an incomplete term at the end of the expression is ignored
+            self.position = len(self.tokens)
+            return None
+        self.position += 3
+        return FilterTerm(self.model_class, *term_tokens)
 
-        if self.is_attribute(expression_as_array[0], model_class):
-            qof = QObjectFactory(model_class, expression_as_array[0], expression_as_array[1], expression_as_array[2])
-            oper = qof.operation_or_operator
+@lru_cache(maxsize=FILTER_PLAN_CACHE_SIZE)
+def compiled_filter_plan(model_class, normalized_tokens):
+    return FilterPlan(FilterExpressionParser(model_class, normalized_tokens).parse())
+
+class FilterExpressionCompiler(object):
+    """
+    Compiles filter expressions into FilterPlans, the plans are cached by model class and expression (without empty segments)
+    """
+    _instance = None
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(FilterExpressionCompiler, cls).__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    def normalized_tokens(self, expression_as_array):
+        return tuple(token for token in expression_as_array if token != '')
+
+    def plan_for(self, model_class, expression_as_array):
+        return compiled_filter_plan(model_class, self.normalized_tokens(expression_as_array))
+
+ST_ASGEOBUF = 'st_asgeobuf'
+ST_ASMVT = 'st_asmvt'
+ST_ASFLATGEOBUF = 'st_asflatgeobuf'
+PARALLEL_AGGREGATES = 'parallel_aggregates'
+
+class DatabaseCapabilities():
+    """
+    Registry of the optional PostGIS features available in each database.
+    Each connection alias is probed once and the answer is kept for the process lifetime
+    """
+    _instance = None
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(DatabaseCapabilities, cls).__new__(cls, *args, **kwargs)
+            cls._instance.capabilities_by_alias = {}
+        return cls._instance
+
+    def optional_routine_names(self):
+        return (ST_ASGEOBUF, ST_ASMVT, ST_ASFLATGEOBUF)
+
+    def disabled_capabilities(self):
+        return {name: False for name in self.optional_routine_names() + (PARALLEL_AGGREGATES,)}
+
+    def probe(self, alias):
+        '''
+        Answers the capabilities of the database 'alias' or None when it could not be probed (a connection failure)
+        '''
+        capabilities = self.disabled_capabilities()
+        if connections[alias].vendor != 'postgresql':
+            return capabilities
+
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute("SELECT DISTINCT lower(proname) FROM pg_proc WHERE lower(proname) IN %s",
+                               [self.optional_routine_names()])
+                for row in cursor.fetchall():
+                    capabilities[row[0]] = True
+
+                # parallel aggregation exists since postgresql 9.6 and is off when there are no workers per gather
+                cursor.execute("SELECT current_setting('server_version_num')::int")
+                if cursor.fetchone()[0] >= 90600:
+                    cursor.execute("SELECT current_setting('max_parallel_workers_per_gather')::int")
+                    capabilities[PARALLEL_AGGREGATES] = cursor.fetchone()[0] > 0
+        except ProgrammingError:
+            # the catalog can not be read: every optional feature stays disabled
+            pass
+        except DatabaseError:
+            return None
+
+        return capabilities
+
+    def capabilities_for(self, alias):
+        if alias not in self.capabilities_by_alias:
+            capabilities = self.probe(alias)
+            if capabilities is None:
+                # a failure says nothing about the database, it is probed again by the next caller
+                return self.disabled_capabilities()
+            self.capabilities_by_alias[alias] = capabilities
+        return self.capabilities_by_alias[alias]
+
+    def supports(self, alias, capability_name):
+        return self.capabilities_for(alias).get(capability_name, False)
+
+    def has_st_asgeobuf(self, alias):
+        return self.supports(alias, ST_ASGEOBUF)
+
+    def has_st_asmvt(self, alias):
+        return self.supports(alias, ST_ASMVT)
+
+    def has_st_asflatgeobuf(self, alias):
+        return self.supports(alias, ST_ASFLATGEOBUF)
+
+    def has_parallel_aggregates(self, alias):
+        return self.supports(alias, PARALLEL_AGGREGATES)
+
+    # Should be called if the database is upgraded while the process is running
+    def reset(self, alias=None):
+        if alias is None:
+            self.capabilities_by_alias.clear()
         else:
-            qof = QObjectFactory(model_class, expression_as_array[1], expression_as_array[2], expression_as_array[3])
-            oper = expression_as_array[0]
+            self.capabilities_by_alias.pop(alias, None)
+
+TABLE_VERSION_KEY_PREFIX = 'table_version:'
+ROW_VERSION_KEY_PREFIX = 'row_version:'
+TABLE_MODIFIED_KEY_PREFIX = 'table_modified:'
+ETAG_INDEX_KEY_PREFIX = 'etag_index:'
+
+class TableVersion():
+    """
+    Monotonically increasing versions of each model table and of each of its rows, kept in the cache shared by the workers.
+    The versions are bumped whenever a row of the table is saved or deleted.
+    A version key works as a tag: cached data stamped with older versions of its tags is stale
+    """
+    _instance = None
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(TableVersion, cls).__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    def key_for(self, table_name):
+        return TABLE_VERSION_KEY_PREFIX + table_name
+
+    def row_key_for(self, table_name, pk):
+        return ROW_VERSION_KEY_PREFIX + table_name + ':' + str(pk)
+
+    def initial_version(self):
+        # seeded with the current time, so a flushed cache never brings back a version already used
+        return int(time_module.time() * 1000000)
+
+    # Answers a dict whose keys are the tags and values are their current versions
+    def tag_versions(self, tags):
+        versions = cache.get_many(tags)
+
+        for tag in tags:
+            if tag not in versions:
+                initial_version = self.initial_version()
+                cache.add(tag, initial_version, None)
+                versions[tag] = cache.get(tag, initial_version)
+
+        return versions
+
+    def version_of(self, table_name):
+        key = self.key_for(table_name)
+        return self.tag_versions([key])[key]
 
-        q_object_expression = self.q_object_with_logical_operator(q_object_or_none, qof.q_object(), oper)
+    def modified_key_for(self, table_name):
+        return TABLE_MODIFIED_KEY_PREFIX + table_name
 
-        return self.q_object_for_filter_expression(q_object_expression, model_class, expression_as_array[3:])
+    # Answers the timestamp (in seconds) of the last write in the table
+    def last_modified_of(self, table_name):
+        key = self.modified_key_for(table_name)
+        last_modified = cache.get(key)
+
+        if last_modified is None:
+            # the last write is unknown, so it is assumed to be now
+            last_modified = int(time_module.time())
+            cache.add(key, last_modified, None)
+            last_modified = cache.get(key, last_modified)
+
+        return last_modified
+
+    def bump_tag(self, tag):
+        try:
+            return cache.incr(tag)
+        except ValueError:
+            # the key is not in the cache
+            cache.add(tag, self.initial_version(), None)
+            return self.tag_versions([tag])[tag]
+
+    def bump(self, table_name, pk=None):
+        # the modification time is changed first, so it is never older than the version readers see
+        cache.set(self.modified_key_for(table_name), int(time_module.time()), None)
+        version = self.bump_tag(self.key_for(table_name))
+
+        # the row after the table: readers check the table version after the row versions
+        if pk is not None:
+            self.bump_tag(self.row_key_for(table_name, pk))
+
+        return version
+
+class ETagIndex():
+    """
+    Index of the validators (etag and last modification) of the last representation sent for an IRI and a content type.
+    An entry is only valid while the version of its table is the same it was when the entry was indexed
+    """
+    _instance = None
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(ETagIndex, cls).__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    def key_for(self, iri, content_type):
+        return ETAG_INDEX_KEY_PREFIX + hashlib.sha1((iri + content_type).encode()).hexdigest()
+
+    # Answers a tuple (etag, last_modified) or None
+    def validators_for(self, iri, content_type, table_version):
+        entry = cache.get(self.key_for(iri, content_type))
+
+        if entry is None or entry[2] != table_version:
+            return None
+        return entry[0], entry[1]
+
+    def index(self, iri, content_type, e_tag, last_modified, table_version, seconds=86400):
+        cache.set(self.key_for(iri, content_type), (e_tag, last_modified, table_version), seconds)
 
 # To execute in python console
 #dir(ie20.rast)
@@ -454,8 +922,27 @@ class FactoryComplexQuery():
 #d = [ ("d[self." + i + "_operation_name] = Type_Called(" + "'" + i + "'" + ", [], object)" ) for i in arr]
 
 
+def frozen_operations(operations_dict_method):
+    '''
+    The operations dicts of a controller never change: each one is built once (per controller, i. e. per
+    concrete class) and shared by every caller as a read only mapping. Callers that need to add operations must copy it
+    '''
+    # the qualified name keeps apart an override and the method of the superclass called by it
+    method_key = operations_dict_method.__qualname__
+
+    @wraps(operations_dict_method)
+    def frozen_operations_dict_method(self):
+        frozen_dicts = self.__dict__.setdefault('frozen_operations_by_method', {})
+        if method_key not in frozen_dicts:
+            frozen_dicts[method_key] = MappingProxyType(operations_dict_method(self))
+        return frozen_dicts[method_key]
+
+    return frozen_operations_dict_method
+
+
 class BaseOperationController(object):
 
+    # the singleton is initialized once, by __new__, constructing it again must not rebuild its state
     _instance = None
     def __new__(cls, *args, **kwargs):
         if not cls._instance:
@@ -463,10 +950,6 @@ class BaseOperationController(object):
             cls._instance.initialize()
         return cls._instance
 
-    def __init__(self):
-        #super(BaseOperationController, self).__init__()
-        self.initialize()
-
     #Have to be overrided
     def initialize(self):
         self.area_operation_name = 'area'
@@ -542,6 +1025,7 @@ class BaseOperationController(object):
 
 
     #Spatial Operations
+    @frozen_operations
     def geometry_operations_dict(self):
         dicti = {
             self.area_operation_name:               Type_Called('area', [], float),
@@ -617,42 +1101,54 @@ class BaseOperationController(object):
         dicti.update(self.generic_object_operations_dict())
         return dicti
 
+    @frozen_operations
     def point_operations_dict(self):
         return self.geometry_operations_dict()
 
+    @frozen_operations
     def line_operations_dict(self):
         return self.geometry_operations_dict()
 
+    @frozen_operations
     def polygon_operations_dict(self):
         return self.geometry_operations_dict()
 
+    @frozen_operations
     def operations_dict_by_type(self):
         return {}
 
+    @frozen_operations
     def proxer_operations_dict_by_type(self):
         return {}
 
+    @frozen_operations
     def generic_object_operations_dict(self):
         return {
             self.join_operation_name:       Type_Called('join', [tuple, object], object),
             self.projection_operation_name: Type_Called('projection', [property], object),
         }
 
+    @frozen_operations
     def boolean_operations_dict(self):
         return {}
 
+    @frozen_operations
     def int_operations_dict(self):
         return {}
 
+    @frozen_operations
     def float_operations_dict(self):
         return {}
 
+    @frozen_operations
     def date_operations_dict(self):
         return {}
 
+    @frozen_operations
     def unicode_operations_dict(self):
         return self.string_operations_dict()
 
+    @frozen_operations
     def string_operations_dict(self):
         return {
             'capitalize': Type_Called('capitalize', [], str),
@@ -676,6 +1172,7 @@ class BaseOperationController(object):
         """operations that turns cellection in a single object"""
         raise NotImplementedError("'proxy_operations' must be implemented in subclasses")
 
+    @frozen_operations
     def dict_by_type_geometry_operations_dict(self):
         # self.geometry_operation_dict() returns a dict with all geospatial operations
         # the index GEOSGeometry of 'dicti' contains another dict of geospetial operations
@@ -697,6 +1194,7 @@ class BaseOperationController(object):
             GeometryCollection: self.geometry_operations_dict()
         }
 
+    @frozen_operations
     def dict_by_type_primitive_operations_dict(self):
         return {
             int: self.int_operations_dict(),
@@ -705,8 +1203,9 @@ class BaseOperationController(object):
             str: self.string_operations_dict()
         }
 
+    @frozen_operations
     def dict_all_operation_dict(self):
-        d =  self.dict_by_type_geometry_operations_dict()
+        d = dict(self.dict_by_type_geometry_operations_dict())
         d.update(self.dict_by_type_primitive_operations_dict())
         d.update(self.int_operations_dict())
         d.update(self.float_operations_dict())
@@ -717,30 +1216,40 @@ class BaseOperationController(object):
 
         return d
 
+    def operations_for_type(self, a_type):
+        '''
+        Responds the operations dict of the nearest class in the MRO of 'a_type' that has operations
+        (or None), resolved once per concrete type
+        '''
+        operations_by_concrete_type = self.__dict__.setdefault('operations_by_concrete_type', {})
+        if a_type not in operations_by_concrete_type:
+            all_operations_dict = self.dict_all_operation_dict()
+            operations_by_concrete_type[a_type] = next(
+                (all_operations_dict[a_class] for a_class in inspect.getmro(a_type) if a_class in all_operations_dict), None
+            )
+        return operations_by_concrete_type[a_type]
+
     def is_operation(self, an_object, name):
         if isinstance(an_object, BusinessModel):
             return an_object.is_operation(name)#return hasattr(an_object, name) and callable(getattr(an_object, name))
 
-        a_type = type(an_object)
-        if a_type not in self.dict_all_operation_dict():
+        operation_dict = self.operations_for_type(type(an_object))
+        if operation_dict is None:
             return False
 
-        operation_dict = self.dict_all_operation_dict()[a_type]
         return name in operation_dict
 
     def operation_has_parameters(self, an_object, att_or_method_name):
         if isinstance(an_object, BusinessModel):
             return an_object.operation_has_parameters(att_or_method_name)
 
-        a_type = type(an_object)
-
         #if isinstance(an_object, GeometryCollection):
         #    return att_or_method_name in self.dict_all_operation_dict()
 
-        if a_type not in self.dict_all_operation_dict():
+        operation_dict = self.operations_for_type(type(an_object))
+        if operation_dict is None:
             return False
 
-        operation_dict = self.dict_all_operation_dict()[a_type]
         if att_or_method_name in operation_dict:
             type_called = operation_dict[att_or_method_name]
             return len(type_called.get_parameters()) > 0
@@ -776,9 +1285,13 @@ class RasterOperationController(BaseOperationController):
         self.vsi_buffer_operation_name = 'vsi_buffer'
         self.warp_operation_name = 'warp'
         self.width_operation_name = 'width'
+        self.window_operation_name = 'window'
+        self.bbox_operation_name = 'bbox'
+        self.tiles_operation_name = 'tiles'
         self.join_operation_name = 'join' # DUPLICATED
         self.projection_operation_name = 'projection'# DUPLICATED
 
+    @frozen_operations
     def dict_all_operation_dict(self):
         return {
             self.bands_operation_name:          Type_Called(self.bands_operation_name, [], object),
@@ -801,6 +1314,9 @@ class RasterOperationController(BaseOperationController):
             self.vsi_buffer_operation_name:     Type_Called(self.vsi_buffer_operation_name, [], bytes),            # Encoding error
             self.warp_operation_name:           Type_Called(self.warp_operation_name, [], object),                 # missing arguments and Raster return type
             self.width_operation_name:          Type_Called(self.width_operation_name, [], object),
+            self.window_operation_name:         Type_Called(self.window_operation_name, [tuple, int], bytes),
+            self.bbox_operation_name:           Type_Called(self.bbox_operation_name, [tuple, tuple, int], bytes),
+            self.tiles_operation_name:          Type_Called(self.tiles_operation_name, [int, int, int], bytes),
             self.projection_operation_name:     Type_Called(self.projection_operation_name, [property], object)
         }
 
@@ -823,6 +1339,9 @@ class CollectionResourceOperationController(BaseOperationController):
         self.filter_and_collect_collection_operation_name = 'filter-and-collect'
         self.filter_and_count_resource_collection_operation_name = 'filter-and-count-resource'
         self.offset_limit_and_collect_collection_operation_name = 'offset-limit-and-collect'
+        self.cursor_limit_collection_operation_name = 'cursor-limit'
+        self.cursor_limit_and_collect_collection_operation_name = 'cursor-limit-and-collect'
+        self.filter_and_cursor_limit_collection_operation_name = 'filter-and-cursor-limit'
         self.join_operation_name = 'join'
         self.group_by_sum_collection_operation_name = "group-by-sum"
         self.projection_operation_name = 'projection'
@@ -831,23 +1350,29 @@ class CollectionResourceOperationController(BaseOperationController):
         return deepcopy([
             self.collect_collection_operation_name,
             self.filter_and_collect_collection_operation_name,
-            self.offset_limit_and_collect_collection_operation_name
+            self.offset_limit_and_collect_collection_operation_name,
+            self.cursor_limit_and_collect_collection_operation_name
         ])
 
+    @frozen_operations
     def internal_collection_operations_dict(self):
         return {
             self.filter_and_collect_collection_operation_name: Type_Called(self.filter_and_collect_collection_operation_name, [list], object),
             self.filter_and_count_resource_collection_operation_name: Type_Called(self.filter_and_count_resource_collection_operation_name, [list], int),
-            self.offset_limit_and_collect_collection_operation_name: Type_Called(self.offset_limit_and_collect_collection_operation_name, [list], object)
+            self.offset_limit_and_collect_collection_operation_name: Type_Called(self.offset_limit_and_collect_collection_operation_name, [list], object),
+            self.cursor_limit_and_collect_collection_operation_name: Type_Called(self.cursor_limit_and_collect_collection_operation_name, [list], object),
+            self.filter_and_cursor_limit_collection_operation_name: Type_Called(self.filter_and_cursor_limit_collection_operation_name, [list], object)
         }
 
         # Abstract collection Operations
+    @frozen_operations
     def collection_operations_dict(self):
         dict = {
             self.filter_collection_operation_name:          Type_Called(self.filter_collection_operation_name, [Q], object),
             self.collect_collection_operation_name:         Type_Called(self.collect_collection_operation_name, [property, 'operation'], object),
             self.count_resource_collection_operation_name:  Type_Called(self.count_resource_collection_operation_name, [], int),
             self.offset_limit_collection_operation_name:    Type_Called(self.offset_limit_collection_operation_name, [int, int], object),
+            self.cursor_limit_collection_operation_name:    Type_Called(self.cursor_limit_collection_operation_name, [str, int], object),
             self.distinct_collection_operation_name:        Type_Called(self.distinct_collection_operation_name, [property], object),
             self.group_by_count_collection_operation_name:  Type_Called(self.group_by_count_collection_operation_name, [list], object),
             self.group_by_sum_collection_operation_name:    Type_Called(self.group_by_sum_collection_operation_name, [str, str], object),
@@ -855,6 +1380,7 @@ class CollectionResourceOperationController(BaseOperationController):
         dict.update(self.generic_object_operations_dict())
         return dict
 
+    @frozen_operations
     def dict_all_operation_dict(self):
         return self.collection_operations_dict()
 
@@ -867,6 +1393,7 @@ class CollectionResourceOperationController(BaseOperationController):
     def expression_operator_expects_parameter(self, operator_name):
         return True if len(self.expression_operators_dict()[operator_name].get_parameters()) > 0 else False
 
+    @frozen_operations
     def expression_operators_dict(self):
         return {
             'neq': Type_Called('neq', [object], None),
@@ -884,6 +1411,7 @@ class CollectionResourceOperationController(BaseOperationController):
             'notin': Type_Called('notin', [list], None)
         }
 
+    @frozen_operations
     def expression_logical_operators(self):
         return {
             'and': Type_Called('and', [], None),
@@ -936,8 +1464,12 @@ class SpatialCollectionOperationController(CollectionResourceOperationController
         self.extent_collection_operation_name = 'extent'
         self.make_line_collection_operation_name = 'make-line'
         self.envelope_collection_operation_name = 'envelope'
+        self.tiles_collection_operation_name = 'tiles'
+        self.map_image_collection_operation_name = 'map-image'
+        self.png_tiles_collection_operation_name = 'png-tiles'
 
     #Abstract spatial collection Operations
+    @frozen_operations
     def spatial_collection_operations_dict(self):
         d = {
             self.bbcontaining_operation_name:           Type_Called(self.bbcontaining_operation_name, [GEOSGeometry], GEOSGeometry),
@@ -972,7 +1504,10 @@ class SpatialCollectionOperationController(CollectionResourceOperationController
             self.union_collection_operation_name:       Type_Called(self.union_collection_operation_name, [GEOSGeometry], GEOSGeometry),
             self.extent_collection_operation_name:      Type_Called(self.extent_collection_operation_name, [GEOSGeometry], tuple),
             self.make_line_collection_operation_name:   Type_Called(self.make_line_collection_operation_name, [GEOSGeometry], GEOSGeometry),
-            self.envelope_collection_operation_name:    Type_Called(self.envelope_collection_operation_name, [GEOSGeometry], Polygon)
+            self.envelope_collection_operation_name:    Type_Called(self.envelope_collection_operation_name, [GEOSGeometry], Polygon),
+            self.tiles_collection_operation_name:       Type_Called(self.tiles_collection_operation_name, [int, int, int], bytes),
+            self.map_image_collection_operation_name:   Type_Called(self.map_image_collection_operation_name, [tuple, tuple, int], bytes),
+            self.png_tiles_collection_operation_name:   Type_Called(self.png_tiles_collection_operation_name, [int, int, int], bytes)
         }
 
         d.update(self.generic_object_operations_dict())
@@ -988,6 +1523,7 @@ class SpatialCollectionOperationController(CollectionResourceOperationController
         ])
         return deepcopy(proxy_operations)
 
+    @frozen_operations
     def feature_collection_operations_dict(self):
         return dict(self.collection_operations_dict(), **self.spatial_collection_operations_dict())
 
@@ -995,6 +1531,7 @@ class SpatialCollectionOperationController(CollectionResourceOperationController
         return self.feature_collection_operations_dict().keys()
 
     #Responds a dict with all the operations
+    @frozen_operations
     def dict_all_operation_dict(self):
        return self.feature_collection_operations_dict()
 
@@ -1005,16 +1542,15 @@ class SpatialCollectionOperationController(CollectionResourceOperationController
       if isinstance(an_object, GeometryCollection):
           return name in self.dict_all_operation_dict()
 
-      a_type = type(an_object)
-
-      if a_type not in self.dict_all_operation_dict():
+      operation_dict = self.operations_for_type(type(an_object))
+      if operation_dict is None:
          return False
 
-      operation_dict = self.dict_all_operation_dict()[a_type]
       return name in operation_dict
 
+    @frozen_operations
     def expression_operators_dict(self):
-        d = super(SpatialCollectionOperationController, self).expression_operators_dict()
+        d = dict(super(SpatialCollectionOperationController, self).expression_operators_dict())
         d.update({
             self.bbcontaining_operation_name: Type_Called(self.bbcontaining_operation_name, [GEOSGeometry], None),
             self.bboverlaping_operation_name: Type_Called(self.bboverlaping_operation_name, [GEOSGeometry], None),
@@ -1078,6 +1614,7 @@ class StringOperationController(object):
         self.split_operation_name = "split"
         self.upper_operation_name = "upper"
 
+    @frozen_operations
     def operations_dict(self):
         return {
             self.capitalize_operation_name: Type_Called(self.capitalize_operation_name, [], str),
@@ -1097,6 +1634,7 @@ class StringOperationController(object):
             self.upper_operation_name:      Type_Called(self.upper_operation_name, [], str),
         }
 
+    @frozen_operations
     def operations_dict_by_type(self):
         #d = super(StringOperationController, self).operations_dict_by_type()
         #d.update({
@@ -1190,20 +1728,24 @@ class SpatialOperationController(BaseOperationController):
         self.join_operation_name = 'join'
         self.projection_operation_name = 'projection'
 
+    @frozen_operations
     def point_operations_dict(self):
         return self.geometry_operations_dict()
 
+    @frozen_operations
     def line_operations_dict(self):
         return self.geometry_operations_dict()
 
+    @frozen_operations
     def polygon_operations_dict(self):
         return self.geometry_operations_dict()
 
+    @frozen_operations
     def operations_dict_by_type(self):
         '''
         All operations supported by SpatialResource directly
         '''
-        d = super(SpatialOperationController, self).operations_dict_by_type()
+        d = dict(super(SpatialOperationController, self).operations_dict_by_type())
         d.update({
             FeatureModel:           self.operations_dict(),
             GEOSGeometry:           self.operations_dict(),
@@ -1226,16 +1768,18 @@ class SpatialOperationController(BaseOperationController):
         #d.update(self.proxied_operations_dict_by_type())
         return d
 
+    @frozen_operations
     def proxer_operations_dict_by_type(self):
         """
         All operations supported by SpatialResource indirectly (i. e. 'upper' can be applied to a SpatialResource after 'valid_reason')
         """
-        d = super(SpatialOperationController, self).proxer_operations_dict_by_type()
+        d = dict(super(SpatialOperationController, self).proxer_operations_dict_by_type())
         d.update(StringOperationController().operations_dict_by_type())
         return d
 
+    @frozen_operations
     def all_operations_dict_by_type(self):
-        d = self.operations_dict_by_type()
+        d = dict(self.operations_dict_by_type())
         d.update(self.proxer_operations_dict_by_type())
         return d
 
@@ -1254,13 +1798,12 @@ class SpatialOperationController(BaseOperationController):
         return self.proxer_operations_dict_by_type()[current_state][operation_name]
 
     def split_operation_by_url(self, operation_str):
-        operation_str = remove_last_slash(operation_str)
-        if not path_has_url(operation_str):
-            current_operation_name, operation_snippet_arr = remove_last_slash(operation_str).split("/")[0], remove_last_slash(operation_str).split("/")[1:]
-            return (current_operation_name, operation_snippet_arr)
+        parsed_path = parse_path(operation_str)
+        if not parsed_path.has_url:
+            return (parsed_path.segments[0], list(parsed_path.segments[1:]))
 
-        current_operation_name, operation_snippet_arr = operation_with_url_splitted_by_slash(operation_str)[0], operation_with_url_splitted_by_slash(operation_str)[1:]
-        return (current_operation_name, operation_snippet_arr)
+        segments = path_segments_with_url(parsed_path.path)
+        return (segments[0], list(segments[1:]))
 
     def state_machine(self, operation_str, current_state=INITIAL_STATE):
         fst_operation_name, snippet_operation_arr = self.split_operation_by_url(operation_str)
@@ -1300,8 +1843,9 @@ class SpatialOperationController(BaseOperationController):
         return self.state_machine(next_state_str, current_state)
 
 
+    @frozen_operations
     def operations_dict(self):
-        opers_dict = self.generic_object_operations_dict()
+        opers_dict = dict(self.generic_object_operations_dict())
         opers_dict.update({
             self.area_operation_name:               Type_Called(self.area_operation_name, [], float),
             self.boundary_operation_name:           Type_Called(self.boundary_operation_name, [], GEOSGeometry),
@@ -1375,10 +1919,13 @@ class SpatialOperationController(BaseOperationController):
 
 # todo: this class is a copy of BaseOperationController - refactor to inherit from "SpatialOperationController" (to be implemented)
 class ProxiedSpatialOperationController(SpatialOperationController):
+    _instance = None
 
+    @frozen_operations
     def geometry_operations_dict(self):
         return self.operations_dict()
 
+    @frozen_operations
     def dict_all_operation_dict(self):
         return self.dict_by_type_geometry_operations_dict()
 
@@ -1411,27 +1958,34 @@ class ProxiedNonSpatialResourceOperationController(object):
         self.split_operation_name = 'split'
         self.upper_operation_name = 'upper'
 
+    @frozen_operations
     def generic_object_operations_dict(self):
         return {
             self.join_operation_name:       Type_Called(self.join_operation_name, [tuple, object], object),
             self.projection_operation_name: Type_Called(self.projection_operation_name, [property], object),
         }
 
+    @frozen_operations
     def boolean_operations_dict(self):
         return {}
 
+    @frozen_operations
     def int_operations_dict(self):
         return {}
 
+    @frozen_operations
     def float_operations_dict(self):
         return {}
 
+    @frozen_operations
     def date_operations_dict(self):
         return {}
 
+    @frozen_operations
     def unicode_operations_dict(self):
         return self.string_operations_dict()
 
+    @frozen_operations
     def string_operations_dict(self):
         return {
             self.capitalize_operation_name: Type_Called(self.capitalize_operation_name, [], str),
@@ -1451,8 +2005,9 @@ class ProxiedNonSpatialResourceOperationController(object):
             self.upper_operation_name:      Type_Called(self.upper_operation_name, [], str),
         }
 
+    @frozen_operations
     def dict_all_operation_dict(self):
-        d = self.generic_object_operations_dict()
+        d = dict(self.generic_object_operations_dict())
         d.update(self.int_operations_dict())
         d.update(self.float_operations_dict())
         d.update(self.date_operations_dict())
@@ -1485,6 +2040,7 @@ class EntryPointResourceOperationController(CollectionResourceOperationControlle
         self.offset_limit_collection_operation_name = 'offset-limit'
         self.projection_operation_name = 'projection'
 
+    @frozen_operations
     def collection_operations_dict(self):
         return {
             self.filter_collection_operation_name:          Type_Called(self.filter_collection_operation_name, [Q], object),
@@ -1545,11 +2101,17 @@ class BusinessModel(models.Model):
     def attribute_names(self):
         return [ attribute for attribute in dir(self) if not callable(getattr(self, attribute)) and self.is_not_private(attribute)]
 
+    def field_index(self):
+        return FieldIndexRegistry().index_for(self.model_class())
+
     def fields(self):
-        return self.model_class()._meta.fields
+        return list(self.field_index().fields)
 
     def field_names(self):
-        return [field.name for field in self.fields()]
+        return list(self.field_index().field_names)
+
+    def field_for(self, field_name):
+        return self.field_index().field(field_name)
 
     def is_private(self, attribute_or_method_name):
         return attribute_or_method_name.startswith('__') and attribute_or_method_name.endswith('__')
@@ -1564,6 +2126,8 @@ class BusinessModel(models.Model):
         return operation_name in self.public_operation_names()
 
     def is_attribute(self, attribute_name):
+        if self.field_index().has_field(attribute_name):
+            return True
         return (attribute_name in dir(self) and not callable(getattr(self, attribute_name, None)))
 
     def operations_with_parameters_type(self):
@@ -1596,7 +2160,7 @@ class SpatialModel(BusinessModel):
         return None
 
     def geo_field(self):
-        return [field for field in self.fields() if isinstance(field, self.get_geospatial_type())][0]
+        return self.field_index().fields_of_type(self.get_geospatial_type())[0]
 
     def geo_field_name(self):
         return self.geo_field().name
@@ -1866,25 +2430,109 @@ class FeatureModel(SpatialModel):
     def transform(self, srid, clone=True):
         return self.get_spatial_object().transform(srid, clone=True)
 
+    def database_alias(self):
+        # a database named as the app label has priority over the default database
+        alias = self._meta.app_label
+        return alias if alias in connections.databases else 'default'
+
     def get_model_objects_geobuf(self, view_resource):
-        #pk_name = view_resource.pk_name()
-        sql_string = "SELECT routine_name FROM information_schema.routines"# where routine_name"# where routine_name like 'st\_asgeobuf%'"
+        alias = view_resource.object_model.database_alias()
 
-        cursor = None
-        try:
-            cursor = connections[view_resource.object_model._meta.app_label].cursor()
-        except ConnectionDoesNotExist:
-            cursor = connections['default'].cursor()
-        finally:
-            cursor.execute(sql_string)
-            row = [r[0] for r in cursor.fetchall() if r[0].startswith("st_asgeobuf")]
-            if row:
-                cursor.execute("SELECT ST_AsGeobuf(q, %s) FROM " + view_resource.table_name() + " as q",
-                               [view_resource.geometry_field_name()])
-                rows = cursor.fetchall()
-                return rows[0][0]
+        # ST_AsGeobuf exists since postgis 2.4
+        if not DatabaseCapabilities().has_st_asgeobuf(alias):
             raise ProgrammingError
 
+        with connections[alias].cursor() as cursor:
+            cursor.execute("SELECT ST_AsGeobuf(q, %s) FROM " + view_resource.table_name() + " as q",
+                           [view_resource.geometry_field_name()])
+            return cursor.fetchone()[0]
+
+    def get_model_objects_geojson(self, view_resource, queryset, attribute_names=None):
+        '''
+        Answers the FeatureCollection of 'queryset' as a GeoJSON string built by PostGIS
+        (json_build_object, ST_AsGeoJSON and json_agg). Filters, projections and slices in
+        the queryset are kept, because the queryset SQL is used as subquery
+        '''
+        geometry_field_name = view_resource.geometry_field_name()
+        if attribute_names is None:
+            attribute_names = list(view_resource.serializer_class.Meta.fields) + [geometry_field_name]
+        identifier = getattr(view_resource.serializer_class.Meta, 'identifier', None)
+
+        fields = [queryset.model._meta.get_field(name) for name in attribute_names]
+        if any(field.is_relation for field in fields):
+            # relationships are serialized as IRIs, only the serializer knows how to build them
+            raise ProgrammingError("Relationships can not be encoded as GeoJSON by the database")
+
+        db_connection = connections[queryset.db]
+        quote_name = db_connection.ops.quote_name
+        geometry_column = None
+        id_sql = ''
+        properties = []
+
+        for field in fields:
+            if field.name == geometry_field_name:
+                geometry_column = quote_name(field.column)
+            elif field.name == identifier:
+                id_sql = "'" + field.name + "', q." + quote_name(field.column) + ", "
+            else:
+                properties.append("'" + field.name + "', q." + quote_name(field.column))
+
+        if geometry_column is None:
+            raise ProgrammingError("A FeatureCollection can not be built without the geometry attribute")
+
+        # json_build_object accepts at most 100 arguments, so the properties are built in pieces
+        properties_sql = " || ".join(
+            "jsonb_build_object(" + ", ".join(properties[i:i + 50]) + ")" for i in range(0, len(properties), 50)
+        ) or "'{}'::jsonb"
+
+        feature_sql = "json_build_object(" + id_sql + "'type', 'Feature', " + \
+                      "'geometry', ST_AsGeoJSON(q." + geometry_column + ")::json, " + \
+                      "'properties', " + properties_sql + ")"
+
+        inner_queryset = queryset.values(*[field.name for field in fields])
+        inner_sql, params = inner_queryset.query.get_compiler(using=queryset.db).as_sql()
+
+        sql_string = "SELECT json_build_object('type', 'FeatureCollection', " + \
+                     "'features', COALESCE(json_agg(" + feature_sql + "), '[]'::json))::text " + \
+                     "FROM (" + inner_sql + ") as q"
+
+        with db_connection.cursor() as cursor:
+            cursor.execute(sql_string, params)
+            return cursor.fetchone()[0]
+
+    def get_model_objects_mvt(self, view_resource, queryset, z, x, y, attribute_names, extent=4096, tile_buffer=64):
+        '''
+        Answers the Mapbox Vector Tile z/x/y of 'queryset' built by PostGIS (ST_AsMVTGeom and ST_AsMVT).
+        'queryset' should be already bounded by the tile envelope, so the database can use the spatial index
+        '''
+        alias = queryset.db
+
+        # ST_AsMVT exists since postgis 2.4
+        if not DatabaseCapabilities().has_st_asmvt(alias):
+            raise ProgrammingError("ST_AsMVT is not available")
+
+        geometry_field_name = view_resource.geometry_field_name()
+        fields = [queryset.model._meta.get_field(name) for name in attribute_names + [geometry_field_name]]
+        quote_name = connections[alias].ops.quote_name
+        properties_sql = "".join(", q." + quote_name(field.column) + " AS " + quote_name(field.name)
+                                 for field in fields if field.name != geometry_field_name)
+
+        inner_queryset = queryset.values(*[field.name for field in fields])
+        inner_sql, inner_params = inner_queryset.query.get_compiler(using=alias).as_sql()
+        xmin, ymin, xmax, ymax = tile_bounds(z, x, y)
+
+        sql_string = "SELECT ST_AsMVT(t, %s, %s, 'mvt_geometry') FROM (" + \
+                     "SELECT ST_AsMVTGeom(ST_Transform(q." + quote_name(fields[-1].column) + ", " + str(WEB_MERCATOR_SRID) + "), " + \
+                     "ST_MakeEnvelope(%s, %s, %s, %s, " + str(WEB_MERCATOR_SRID) + "), %s, %s, true) AS mvt_geometry" + properties_sql + \
+                     " FROM (" + inner_sql + ") AS q) AS t WHERE t.mvt_geometry IS NOT NULL"
+        params = [view_resource.tile_layer_name(), extent, xmin, ymin, xmax, ymax, extent, tile_buffer] + list(inner_params)
+
+        with connections[alias].cursor() as cursor:
+            cursor.execute(sql_string, params)
+            tile = cursor.fetchone()[0]
+
+        return b'' if tile is None else bytes(tile)
+
 class ProxiedFeatureModel(FeatureModel):
 
     #Class to handle FeatureCollection that turns on single Features
@@ -1965,4 +2613,74 @@ class RasterModel(SpatialModel):
 
 class TiffModel(RasterModel):
     class Meta:
-        abstract = True
\ No newline at end of file
+        abstract = True
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_table_version(sender, **kwargs):
+    if not issubclass(sender, BusinessModel):
+        return
+
+    table_name = sender._meta.db_table
+    # the pk is read now, after a delete django sets it to None
+    pk = kwargs['instance'].pk
+    # after the commit, otherwise a concurrent GET could bind the new version to the old rows
+    transaction.on_commit(lambda: TableVersion().bump(table_name, pk), using=kwargs.get('using'))
+
+
+def web_mercator_extent_of(geometry, srid):
+    '''
+    Answers the extent of 'geometry' in web mercator, or None if it cannot be transformed
+    '''
+    try:
+        geometry = geometry.clone()
+        if geometry.srid is None:
+            geometry.srid = srid
+        geometry.transform(WEB_MERCATOR_SRID)
+        return geometry.extent
+    except (GEOSException, GDALException):
+        return None
+
+def invalidate_tiles_on_commit(table_name, geometry, srid, using):
+    if geometry is None:
+        return
+    bounds = web_mercator_extent_of(geometry, srid)
+    if bounds is None:
+        transaction.on_commit(lambda: DiskTileStore().invalidate_layer(table_name), using=using)
+    else:
+        transaction.on_commit(lambda: DiskTileStore().invalidate(table_name, bounds), using=using)
+
+STORED_GEOMETRY_ATTRIBUTE = '_geometry_before_save'
+
+@receiver(pre_save)
+def keep_stored_geometry(sender, **kwargs):
+    # the tiles where the feature was drawn, before the update moves it. They are invalidated after the save
+    if not issubclass(sender, FeatureModel) or kwargs.get('raw'):
+        return
+
+    table_name = sender._meta.db_table
+    instance = kwargs['instance']
+    if instance.pk is None or not DiskTileStore().has_tiles_for(table_name):
+        return
+    geo_field_name = instance.geo_field_name()
+    geometry = sender.objects.filter(pk=instance.pk).values_list(geo_field_name, flat=True).first()
+    setattr(instance, STORED_GEOMETRY_ATTRIBUTE, geometry)
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_tiles_of_geometry(sender, **kwargs):
+    # bulk operations (queryset.update/delete) do not send signals, their tiles must be invalidated by hand
+    if not issubclass(sender, FeatureModel) or kwargs.get('raw'):
+        return
+
+    # registered after the version bump (bump_table_version is connected first): the tiles of a render written before
+    # the invalidation are removed by it, the ones written after it find the new version and are removed by the render
+    table_name = sender._meta.db_table
+    instance = kwargs['instance']
+    stored_geometry = instance.__dict__.pop(STORED_GEOMETRY_ATTRIBUTE, None)
+    if not DiskTileStore().has_tiles_for(table_name):
+        return
+    invalidate_tiles_on_commit(table_name, stored_geometry, instance.geo_field().srid, kwargs.get('using'))
+    geometry = getattr(instance, instance.geo_field_name())
+    invalidate_tiles_on_commit(table_name, geometry, instance.geo_field().srid, kwargs.get('using'))
@@ -0,0 +1,91 @@
+from collections import namedtuple
+from functools import lru_cache
+
+from hyper_resource.utils import operation_with_url_splitted_by_slash, path_has_url, remove_last_slash, PARAM_SEPARATOR
+
+# Paths are repeated a lot (the same IRIs are requested by the clients), a worker keeps the most recent ones parsed
+PATH_CACHE_SIZE = 2048
+
+PROJECTION_OPERATION_NAME = 'projection'
+
+ParsedPath = namedtuple('ParsedPath', [
+    'path',              # the path without the last '/' or '*'
+    'segments',          # the path splitted by '/'
+    'lower_segments',
+    'projection',        # the projected attribute names (projection/a,b/...) or None
+    'operation_name',    # the lowered name of the first segment after the projection
+    'parameters',        # the segments after the operation name
+    'stages',            # the segments grouped by stage, each one but the first starts with a '*' segment
+    'has_url',
+])
+
+
+@lru_cache(maxsize=PATH_CACHE_SIZE)
+def parse_path(attributes_functions_str):
+    '''
+    Answers the ParsedPath of 'attributes_functions_str', it is parsed once and shared by every caller, so it is immutable
+    '''
+    path = remove_last_slash(attributes_functions_str)
+    segments = tuple(path.split('/'))
+    lower_segments = tuple(segment.lower() for segment in segments)
+
+    if segments[0] == PROJECTION_OPERATION_NAME and len(segments) > 1:
+        projection = tuple(segments[1].split(','))
+        operation_index = 2 if len(segments) > 2 else 0
+    else:
+        projection = None
+        operation_index = 0
+
+    stages = []
+    for segment in segments:
+        if not stages or segment.startswith('*'):
+            stages.append([])
+        stages[-1].append(segment)
+
+    return ParsedPath(
+        path=path,
+        segments=segments,
+        lower_segments=lower_segments,
+        projection=projection,
+        operation_name=lower_segments[operation_index],
+        parameters=segments[operation_index + 1:],
+        stages=tuple(tuple(stage) for stage in stages),
+        has_url=path_has_url(path),
+    )
+
+
+@lru_cache(maxsize=PATH_CACHE_SIZE)
+def path_segments_with_url(attributes_functions_str_url):
+    '''
+    Answers the path splitted by '/' keeping each url of it in one segment
+    '''
+    return tuple(operation_with_url_splitted_by_slash(attributes_functions_str_url))
+
+
+@lru_cache(maxsize=PATH_CACHE_SIZE)
+def path_splitted_by_url(attributes_functions_str_url):
+    '''
+    Answers (operation snippet, url, parameters after the url) or a tuple with only the path if it has no url
+    '''
+    res = attributes_functions_str_url.lower().find('http:')
+    if res == -1:
+        res = attributes_functions_str_url.lower().find('https:')
+        if res == -1:
+            res = attributes_functions_str_url.lower().find('www.')
+            if res == -1:
+                return (attributes_functions_str_url,)
+
+    if '/*' in attributes_functions_str_url:
+        param_inx = attributes_functions_str_url.index('/*')
+        param = attributes_functions_str_url[param_inx+2:]
+        return (attributes_functions_str_url[0:res], attributes_functions_str_url[res:param_inx], param)
+
+    operation_name = attributes_functions_str_url[0:res]
+    url_external_resource = attributes_functions_str_url[res:]
+
+    if PARAM_SEPARATOR in url_external_resource:
+        resource_url_without_params = url_external_resource[0:url_external_resource.index(PARAM_SEPARATOR) ]
+        other_params = url_external_resource[ url_external_resource.index(PARAM_SEPARATOR)+1: ]
+        return (operation_name, resource_url_without_params, other_params)
+
+    return (operation_name, url_external_resource, None)
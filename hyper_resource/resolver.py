@@ -0,0 +1,167 @@
+import inspect
+import json
+import threading
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.gis.geos import GEOSGeometry, GeometryCollection
+from django.http import Http404, HttpRequest, QueryDict
+from django.urls import Resolver404, get_script_prefix, resolve
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+
+from hyper_resource.utils import CONTENT_TYPE_JSON, HYPER_RESOURCE_EXTENSION
+
+
+class InternalRequest(HttpRequest):
+    """
+    A GET request for an IRI that is resolved in this process, it never goes through the network
+    """
+    def __init__(self, iri, accept):
+        super(InternalRequest, self).__init__()
+        iri_parts = urlsplit(iri)
+        self.iri_scheme = iri_parts.scheme or 'http'
+        self.method = 'GET'
+        self.path = iri_parts.path
+        self.path_info = LocalIRIResolver().path_info_from(iri_parts.path)
+        self.GET = QueryDict(iri_parts.query)
+        default_port = '443' if self.iri_scheme == 'https' else '80'
+        self.META = {
+            'REQUEST_METHOD': 'GET',
+            'HTTP_HOST': iri_parts.netloc,
+            'HTTP_ACCEPT': accept,
+            'SERVER_NAME': iri_parts.hostname or '',
+            'SERVER_PORT': str(iri_parts.port) if iri_parts.port else default_port,
+            'PATH_INFO': self.path_info,
+            'QUERY_STRING': iri_parts.query,
+        }
+
+    def _get_scheme(self):
+        return self.iri_scheme
+
+
+class LocalIRIResolver(object):
+    """
+    Executes the basic_get of the resources served by this deployment directly, so IRIs used as operation
+    parameters (join, complex requests, urls in paths) do not cost a HTTP request to ourselves.
+    An IRI is local when its host is the one of the request being served by the current thread
+    or one of settings.HYPER_RESOURCE_LOCAL_HOSTS
+    """
+    _instance = None
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(LocalIRIResolver, cls).__new__(cls, *args, **kwargs)
+            cls._instance.initialize()
+        return cls._instance
+
+    def initialize(self):
+        self.local_hosts = set(host.lower() for host in getattr(settings, 'HYPER_RESOURCE_LOCAL_HOSTS', []))
+        self.served_request = threading.local()
+
+    def set_served_host(self, host):
+        self.served_request.host = host.lower() if host else None
+
+    def served_host(self):
+        return getattr(self.served_request, 'host', None)
+
+    def is_local(self, iri):
+        host = urlsplit(iri).netloc.lower()
+        if not host:
+            return False
+        return host == self.served_host() or host in self.local_hosts
+
+    def path_info_from(self, path):
+        # the URLconf does not know the prefix where the application is mounted
+        script_prefix = get_script_prefix()
+        if script_prefix != '/' and path.startswith(script_prefix):
+            return '/' + path[len(script_prefix):]
+        return path
+
+    def resource_view_for(self, request):
+        '''
+        Answers the view (already bound to the url arguments) that serves 'request',
+        or None if it is not served by a hyper resource
+        '''
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+
+        view_class = getattr(match.func, 'view_class', None)
+        if view_class is None or not hasattr(view_class, 'basic_get'):
+            return None
+
+        view = view_class(**getattr(match.func, 'view_initkwargs', {}))
+        view.args = match.args
+        view.kwargs = match.kwargs
+        return view
+
+    def required_object_for(self, iri, accept=CONTENT_TYPE_JSON):
+        '''
+        Answers the RequiredObject of the resource identified by 'iri', computed in this process.
+        Answers None when the IRI must be requested through HTTP: it is not served by this deployment,
+        it asks for a format/extension handled only by get() or its resource requires a token
+        '''
+        from hyper_resource.resources.AbstractResource import RequiredObject
+
+        if not self.is_local(iri):
+            return None
+
+        request = InternalRequest(iri, accept)
+        if request.path.endswith(('.png', HYPER_RESOURCE_EXTENSION)):
+            return None
+
+        view = self.resource_view_for(request)
+        if view is None or view.kwargs.get('format') is not None or view.token_is_need():
+            return None
+
+        kwargs = dict((key, value) for key, value in view.kwargs.items() if key != 'format')
+        view.request = view.initialize_request(request, *view.args, **kwargs)
+        view.headers = view.default_response_headers
+        try:
+            # authentication, permissions and throttling are the same of a HTTP request
+            view.initial(view.request, *view.args, **kwargs)
+            return view.basic_get(view.request, *view.args, **kwargs)
+        except APIException as exc:
+            return RequiredObject({'detail': str(exc.detail)}, CONTENT_TYPE_JSON, None, exc.status_code)
+        except Http404:
+            return RequiredObject({}, CONTENT_TYPE_JSON, None, 404)
+
+    def data_from(self, required_object):
+        '''
+        Answers the representation of 'required_object' as python objects (like response.json() would do).
+        Objects (Decimal, dates, geometries ...) are rendered by the JSON renderer of the HTTP responses, so the data is
+        the same a remote request would answer
+        '''
+        representation = required_object.representation_object
+        if inspect.isgenerator(representation):
+            representation = ''.join(representation)
+        if isinstance(representation, bytes):
+            representation = representation.decode('utf-8')
+        if isinstance(representation, str):
+            try:
+                return json.loads(representation)
+            except ValueError:
+                return representation
+        return json.loads(JSONRenderer().render(representation).decode('utf-8'))
+
+    def geometry_from(self, required_object):
+        # a simple feature path has the model object as origin, its geometry is used without any conversion
+        origin = required_object.origin_object
+        representation = required_object.representation_object
+        if isinstance(origin, GEOSGeometry):
+            return origin
+        if hasattr(origin, 'get_spatial_object') and isinstance(representation, dict) and \
+                str(representation.get('type', '')).lower() == 'feature':
+            return origin.get_spatial_object()
+
+        data = self.data_from(required_object)
+        if isinstance(data, dict):
+            geometry_type = str(data.get('type', '')).lower()
+            if geometry_type == 'feature':
+                return GEOSGeometry(json.dumps(data['geometry']))
+            if geometry_type == 'featurecollection':
+                geometries = [GEOSGeometry(json.dumps(feature['geometry'])) for feature in data['features']]
+                return GeometryCollection(*geometries)
+            return GEOSGeometry(json.dumps(data))
+        return GEOSGeometry(data)
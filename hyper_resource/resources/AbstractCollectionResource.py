@@ -1,3 +1,9 @@
+import base64
+
+from django.contrib.gis.db.models import GeometryField, RasterField
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+
 from hyper_resource.models import BaseOperationController
 from hyper_resource.resources.AbstractResource import *
 #from hyper_resource.resources import ProxiedNonSpatialResource
@@ -76,31 +82,21 @@ class AbstractCollectionResource(AbstractResource):
         operators_list = ['*' + key for key in self.operation_controller.expression_operators_dict().keys()]
         operators_list.extend( ['*' + key for key in self.operation_controller.expression_logical_operators().keys()] )
 
-        attrs_functs_str = self.remove_last_slash(attributes_functions_str)
-        attrs_funcs_arr = attrs_functs_str.split('/')
-        if '/*' in attrs_functs_str:
-            second_oper_init = None
-            for attr_func in attrs_funcs_arr:
-                if attr_func.startswith('*') and attr_func not in operators_list:
-                    second_oper_init = attr_func
-                    break
-
-            if second_oper_init is None:
-                first_oper_snippet = attrs_functs_str
-                second_oper_snippet = None
-            else:
-                first_oper_snippet = attrs_functs_str[:attrs_functs_str.index(second_oper_init)-1]
-                second_oper_snippet = attrs_functs_str[attrs_functs_str.index(second_oper_init)+1:]
-        else:
-            first_oper_snippet = attrs_functs_str
-            second_oper_snippet = None
-        return (first_oper_snippet, second_oper_snippet)
+        # the second operation is the first stage (starting with '*') that is not an expression operator
+        stages = self.parsed_path(attributes_functions_str).stages
+        for stage_idx in range(1, len(stages)):
+            if stages[stage_idx][0] not in operators_list:
+                first_oper_snippet = '/'.join(['/'.join(stage) for stage in stages[:stage_idx]])
+                second_oper_snippet = '/'.join(['/'.join(stage) for stage in stages[stage_idx:]])[1:]
+                return (first_oper_snippet, second_oper_snippet)
+
+        return (self.parsed_path(attributes_functions_str).path, None)
 
     def extract_collect_operation_snippet(self, attributes_functions_str):
         if self.path_has_projection(attributes_functions_str):
             collect_oper_snippet_arr = self.remove_projection_from_path(attributes_functions_str).split('/')
         else:
-            collect_oper_snippet_arr = self.remove_last_slash(attributes_functions_str).split('/')
+            collect_oper_snippet_arr = self.path_segments(attributes_functions_str)
 
         if self.operation_controller.collect_collection_operation_name not in collect_oper_snippet_arr\
                 and '*' + self.operation_controller.collect_collection_operation_name not in collect_oper_snippet_arr:
@@ -142,8 +138,8 @@ class AbstractCollectionResource(AbstractResource):
         return self.operation_controller.projection_operation_name + '/' + collect_attrs
 
     def split_offset_limit_and_collect_operation(self, attributes_functions_str, add_collect_attrs_in_offset_limit=True):
-        offset_limit_snippet = '/'.join( self.remove_last_slash(attributes_functions_str).split('/')[:2] )
-        collect_operation_snippet = '/'.join( self.remove_last_slash(attributes_functions_str).split('/')[2:] )
+        offset_limit_snippet = '/'.join( self.path_segments(attributes_functions_str)[:2] )
+        collect_operation_snippet = '/'.join( self.path_segments(attributes_functions_str)[2:] )
 
         if add_collect_attrs_in_offset_limit:
             #collect_attrs = self.extract_collect_operation_attributes(attributes_functions_str, as_string=True)
@@ -151,8 +147,22 @@ class AbstractCollectionResource(AbstractResource):
 
         return offset_limit_snippet, collect_operation_snippet
 
+    def extract_cursor_limit_operation_snippet(self, attributes_functions_str):
+        '''
+        Answers the 'cursor-limit/<parameters>' snippet of paths like cursor-limit/..., projection/.../cursor-limit/...,
+        cursor-limit/.../collect/... and filter/.../*cursor-limit/...
+        '''
+        cursor_limit_name = self.operation_controller.cursor_limit_collection_operation_name
+        attrs_funcs_arr = self.path_segments(attributes_functions_str)
+
+        for idx, attr_func in enumerate(attrs_funcs_arr):
+            if attr_func.lower() in (cursor_limit_name, '*' + cursor_limit_name):
+                return cursor_limit_name + '/' + attrs_funcs_arr[idx + 1]
+
+        raise SyntaxError('"' + attributes_functions_str + '" does not contains a "' + cursor_limit_name + '" operation')
+
     def path_has_filter_operation(self, attributes_functions_str):
-        att_funcs = self.remove_last_slash(attributes_functions_str).split('/')
+        att_funcs = self.path_segments(attributes_functions_str)
         return len(att_funcs) > 1 and (att_funcs[0].lower() == self.operation_controller.filter_collection_operation_name)
 
     # Responds an array of operations name.
@@ -164,7 +174,7 @@ class AbstractCollectionResource(AbstractResource):
         return collection_operations_array
 
     def _dict_all_operation_dict(self):
-        operations_dict = self.operation_controller.internal_collection_operations_dict()
+        operations_dict = dict(self.operation_controller.internal_collection_operations_dict())
         operations_dict.update(self.operation_controller.dict_all_operation_dict())
 
         return operations_dict
@@ -175,18 +185,18 @@ class AbstractCollectionResource(AbstractResource):
         return operations_dict[operation_name]
 
     def get_operation_name_from_path(self, attributes_functions_str):
-        arr_att_funcs = self.remove_last_slash(attributes_functions_str).lower().split('/')
+        parsed_path = self.parsed_path(attributes_functions_str)
 
         # join operation has priority
         if self.path_has_join_operation(attributes_functions_str):
             return self.operation_controller.join_operation_name
 
+        # after a projection, operation_name is the operation projected (or the projection itself if there is none)
+        first_part_name = parsed_path.operation_name
         if self.path_has_projection(attributes_functions_str):
-            path_without_projection = self.remove_projection_from_path(attributes_functions_str)
-            first_part_name = self.operation_controller.projection_operation_name if path_without_projection == '' else arr_att_funcs[2]
-            arr_att_funcs = path_without_projection.split("/")
+            arr_att_funcs = parsed_path.segments[2:]
         else:
-            first_part_name = arr_att_funcs[0]
+            arr_att_funcs = parsed_path.lower_segments
 
         if first_part_name not in self.array_of_operation_name():
             return None
@@ -200,6 +210,14 @@ class AbstractCollectionResource(AbstractResource):
             and len(arr_att_funcs) > 2 and arr_att_funcs[2] == self.operation_controller.collect_collection_operation_name:
             return first_part_name + '-and-collect'
 
+        if  first_part_name == self.operation_controller.cursor_limit_collection_operation_name\
+            and len(arr_att_funcs) > 2 and arr_att_funcs[2] == self.operation_controller.collect_collection_operation_name:
+            return first_part_name + '-and-collect'
+
+        if  first_part_name == self.operation_controller.filter_collection_operation_name\
+            and '/*' + self.operation_controller.cursor_limit_collection_operation_name in attributes_functions_str:
+            return first_part_name + '-and-' + self.operation_controller.cursor_limit_collection_operation_name
+
         if first_part_name == self.operation_controller.collect_collection_operation_name and '/*filter' in attributes_functions_str:
             return first_part_name + '-and-filter'
 
@@ -228,6 +246,20 @@ class AbstractCollectionResource(AbstractResource):
 
         return self.required_object(request, queryset_or_objects)
 
+    def required_object_for_cursor_limit_operation(self, request, attributes_functions_str):
+        if not self.cursor_limit_operation_sintax_is_ok(attributes_functions_str):
+            return self.required_object_for_invalid_sintax(attributes_functions_str)
+
+        queryset_or_objects = self.get_objects_from_cursor_limit_operation(attributes_functions_str)
+
+        if self.path_has_projection(attributes_functions_str):
+            projection_atts_str = self.extract_projection_attributes(attributes_functions_str, as_string=True)
+            objects = self.get_object_serialized_by_only_attributes(projection_atts_str, queryset_or_objects)
+
+            return RequiredObject(objects, self.content_type_by_accept(request), queryset_or_objects, 200)
+
+        return self.required_object(request, queryset_or_objects)
+
     def required_object_for_distinct_operation(self,request, attributes_functions_str):
         queryset_or_objects =  self.get_objects_from_distinct_operation(attributes_functions_str)
 
@@ -320,6 +352,43 @@ class AbstractCollectionResource(AbstractResource):
         serialized_data = self.get_objects_serialized_by_collect_operation(collect_operation_snippet, business_objects)
         return RequiredObject(serialized_data, self.content_type_by_accept(request), business_objects, 200)
 
+    def required_object_for_cursor_limit_and_collect_collection_operation(self, request, attributes_functions_str):
+        if not self.cursor_limit_operation_sintax_is_ok(attributes_functions_str):
+            return self.required_object_for_invalid_sintax(attributes_functions_str)
+
+        cursor_limit_and_collect_snippet = self.remove_last_slash(attributes_functions_str)
+
+        if self.path_has_projection(attributes_functions_str):
+            if not self.projection_attrs_equals_collect_attrs(attributes_functions_str):
+                message = 'Projection attributes list must be the same as collect operation attributes list'
+                return self.required_object_for_invalid_sintax(attributes_functions_str, message)
+            cursor_limit_and_collect_snippet = self.remove_projection_from_path(cursor_limit_and_collect_snippet)
+
+        business_objects = self.get_objects_from_cursor_limit_and_collect_operation(cursor_limit_and_collect_snippet)
+
+        if self.is_image_content_type(request):
+            return self.required_object_for_image(business_objects, request)
+
+        collect_operation_snippet = self.extract_collect_operation_snippet(cursor_limit_and_collect_snippet)
+        serialized_data = self.get_objects_serialized_by_collect_operation(collect_operation_snippet, business_objects)
+        return RequiredObject(serialized_data, self.content_type_by_accept(request), business_objects, 200)
+
+    def required_object_for_filter_and_cursor_limit_collection_operation(self, request, attributes_functions_str):
+        if not self.cursor_limit_operation_sintax_is_ok(attributes_functions_str):
+            return self.required_object_for_invalid_sintax(attributes_functions_str)
+
+        business_objects = self.get_objects_from_filter_and_cursor_limit_operation(attributes_functions_str)
+
+        if self.is_image_content_type(request):
+            return self.required_object_for_image(business_objects, request)
+
+        if self.path_has_projection(attributes_functions_str):
+            attrs_funcs_str = self.extract_projection_attributes(attributes_functions_str, as_string=True)
+            serialized_data = self.get_object_serialized_by_only_attributes(attrs_funcs_str, business_objects)
+            return RequiredObject(serialized_data, self.content_type_by_accept(request), business_objects, 200)
+
+        return self.required_object(request, business_objects)
+
     def required_object_for_filter_and_count_resource_collection_operation(self, request, attributes_functions_str):
         attrs_funcs_str = self.remove_projection_from_path(attributes_functions_str)
         filter_operation_params = attrs_funcs_str[0:attrs_funcs_str.index('/*')]
@@ -379,6 +448,13 @@ class AbstractCollectionResource(AbstractResource):
         context = self.get_context_for_offset_limit_operation(request, attributes_functions_str)
         return RequiredObject(context, HYPER_RESOURCE_CONTENT_TYPE, self.object_model, 200)
 
+    def required_context_for_cursor_limit_operation(self, request, attributes_functions_str):
+        if not self.cursor_limit_operation_sintax_is_ok(attributes_functions_str):
+            return self.required_object_for_invalid_sintax(attributes_functions_str)
+
+        context = self.get_context_for_offset_limit_operation(request, attributes_functions_str)
+        return RequiredObject(context, HYPER_RESOURCE_CONTENT_TYPE, self.object_model, 200)
+
     def required_context_for_distinct_operation(self, request, attributes_functions_str):
         context = self.get_context_for_distinct_operation(request, attributes_functions_str)
         return RequiredObject(context, HYPER_RESOURCE_CONTENT_TYPE, self.object_model, 200)
@@ -401,6 +477,18 @@ class AbstractCollectionResource(AbstractResource):
 
         return self.required_context_for_collect_operation(request, attributes_functions_str)
 
+    def required_context_for_cursor_limit_and_collect_operation(self, request, attributes_functions_str):
+        if not self.cursor_limit_operation_sintax_is_ok(attributes_functions_str):
+            return self.required_object_for_invalid_sintax(attributes_functions_str)
+
+        return self.required_context_for_collect_operation(request, attributes_functions_str)
+
+    def required_context_for_filter_and_cursor_limit_operation(self, request, attributes_functions_str):
+        if not self.cursor_limit_operation_sintax_is_ok(attributes_functions_str):
+            return self.required_object_for_invalid_sintax(attributes_functions_str)
+
+        return self.required_context_for_filter_operation(request, attributes_functions_str)
+
     def required_context_for_simple_path(self, request):
         resource_type = self.resource_type_or_default_resource_type(request)
         return RequiredObject(self.context_resource.context(resource_type), HYPER_RESOURCE_CONTENT_TYPE, self.object_model, 200)
@@ -440,7 +528,7 @@ class AbstractCollectionResource(AbstractResource):
             return self.model_class().objects.filter(q_object)
 
     def get_objects_from_collect_operation(self, attributes_functions_str, queryset=None):
-        attrs_funcs_arr = self.remove_last_slash(attributes_functions_str).split('/')
+        attrs_funcs_arr = self.path_segments(attributes_functions_str)
         objects = self.model_class().objects.all() if queryset is None else queryset
 
         collect_object_list = []
@@ -480,6 +568,20 @@ class AbstractCollectionResource(AbstractResource):
 
         return collected_objects
 
+    def get_objects_from_cursor_limit_and_collect_operation(self, attributes_functions_str):
+        cursor_limit_snippet , collect_operation_snippet = self.split_offset_limit_and_collect_operation(attributes_functions_str, add_collect_attrs_in_offset_limit=True)
+        queryset_or_objects = self.get_objects_from_cursor_limit_operation(cursor_limit_snippet)
+        collected_objects = self.get_objects_from_collect_operation(collect_operation_snippet, queryset=queryset_or_objects)
+
+        return collected_objects
+
+    def get_objects_from_filter_and_cursor_limit_operation(self, attributes_functions_str):
+        cursor_limit_oper_idx = attributes_functions_str.index('/*' + self.operation_controller.cursor_limit_collection_operation_name)
+        filtered_collection = self.get_objects_from_filter_operation(attributes_functions_str[:cursor_limit_oper_idx])
+        cursor_limit_snippet = self.extract_cursor_limit_operation_snippet(attributes_functions_str)
+
+        return self.get_objects_from_cursor_limit_operation(cursor_limit_snippet, queryset=filtered_collection)
+
     def get_objects_from_distinct_operation(self, attributes_functions_str):
         attrs_funcs_no_projection = self.remove_last_slash(attributes_functions_str)
 
@@ -497,13 +599,13 @@ class AbstractCollectionResource(AbstractResource):
             return self.model_class().objects.distinct(*distinct_parameters)
 
     def get_objects_from_group_by_count_operation(self, attributes_functions_str):
-        attributes_functions_list = self.remove_last_slash(attributes_functions_str).split('/')
+        attributes_functions_list = self.path_segments(attributes_functions_str)
         parameters = attributes_functions_list[1:][0].split(',')
 
         return self.model_class().objects.values(*parameters).annotate(count=Count(*parameters))
 
     def get_objects_from_group_by_sum_operation(self, attributes_functions_str):
-        attrs_funcs_arr = self.remove_last_slash(attributes_functions_str).split("/")[1]
+        attrs_funcs_arr = self.path_segments(attributes_functions_str)[1]
         grouper, sum_attr = attrs_funcs_arr.split(PARAM_SEPARATOR)
         return self.model_class().objects.all().values( grouper ).annotate( **{GROUP_BY_SUM_PROPERTY_NAME: Sum( sum_attr )} )
 
@@ -513,7 +615,7 @@ class AbstractCollectionResource(AbstractResource):
             attrs_funcs_without_projection = self.remove_projection_from_path(attributes_functions_str).split("/")
         else:
             selected_attrs = None
-            attrs_funcs_without_projection = self.remove_last_slash(attributes_functions_str).split('/')
+            attrs_funcs_without_projection = self.path_segments(attributes_functions_str)
 
         offset_str, limit_str = attrs_funcs_without_projection[1].split("&")
         offset, limit = int(offset_str), int(limit_str)
@@ -525,6 +627,114 @@ class AbstractCollectionResource(AbstractResource):
             return self.model_class().objects.values(*selected_attrs)[offset:offset + limit]
         return self.model_class().objects.all()[offset:offset + limit]
 
+    def get_objects_from_cursor_limit_operation(self, attributes_functions_str, queryset=None):
+        ordering_attr, last_key, last_pk, limit = self.cursor_limit_parameters(attributes_functions_str)
+        objects = self.model_class().objects.all() if queryset is None else queryset
+        objects = self.queryset_after_cursor(objects, ordering_attr, last_key, last_pk)
+
+        next_cursor = self.next_cursor_for(objects, ordering_attr, limit)
+        if next_cursor is not None:
+            next_link = self.cursor_limit_link(self.request, self.extract_cursor_limit_operation_snippet(attributes_functions_str), next_cursor)
+            if next_link is not None:
+                self.representation_links['next'] = next_link
+
+        if self.path_has_projection(attributes_functions_str):
+            objects = objects.values(*self.extract_projection_attributes(attributes_functions_str))
+
+        return objects[:limit]
+
+    # ---------------------------------------- KEYSET PAGINATION (CURSOR-LIMIT) ----------------------------------------
+    def cursor_ordering_field(self, attribute_name):
+        try:
+            field = self.model_class()._meta.get_field(attribute_name)
+        except FieldDoesNotExist:
+            raise ValueError('"' + attribute_name + '" is not an attribute')
+
+        # keyset pagination compares (attribute, pk) pairs, NULL and geometries can not be compared
+        if not field.concrete or field.many_to_many or field.null or isinstance(field, (GeometryField, RasterField)):
+            raise ValueError('"' + attribute_name + '" can not be used to order a cursor')
+
+        return field
+
+    def encode_cursor(self, ordering_attr, last_key, last_pk):
+        # isoformat keeps the microseconds of dates and times, without them rows could be skipped
+        as_json = lambda value: value.isoformat() if hasattr(value, 'isoformat') else str(value)
+        cursor_json = json.dumps([ordering_attr, last_key, last_pk], default=as_json, separators=(',', ':'))
+
+        return base64.urlsafe_b64encode(cursor_json.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            cursor_json = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            ordering_attr, last_key, last_pk = json.loads(cursor_json)
+        except (ValueError, TypeError):
+            raise ValueError('"' + cursor + '" is not a valid cursor')
+
+        if not isinstance(ordering_attr, str):
+            raise ValueError('"' + cursor + '" is not a valid cursor')
+
+        return ordering_attr, last_key, last_pk
+
+    def cursor_limit_parameters(self, attributes_functions_str):
+        '''
+        Answers (ordering attribute, last key, last pk, limit) from the parameters of cursor-limit:
+        cursor-limit/<limit> pages by pk, cursor-limit/<attribute>&<limit> pages by 'attribute' and
+        cursor-limit/<cursor>&<limit> continues from the opaque cursor of the 'next' Link header
+        '''
+        parameters = self.extract_cursor_limit_operation_snippet(attributes_functions_str).split('/')[1].split(PARAM_SEPARATOR)
+
+        if len(parameters) == 1:
+            ordering_attr, last_key, last_pk = self.model_class()._meta.pk.name, None, None
+        elif len(parameters) == 2 and parameters[0] in [field.name for field in self.model_class()._meta.get_fields()]:
+            ordering_attr, last_key, last_pk = parameters[0], None, None
+        elif len(parameters) == 2:
+            ordering_attr, last_key, last_pk = self.decode_cursor(parameters[0])
+        else:
+            raise ValueError('"' + attributes_functions_str + '" has too many parameters')
+
+        limit = int(parameters[-1])
+        if limit <= 0:
+            raise ValueError('limit must be positive')
+
+        self.cursor_ordering_field(ordering_attr)
+        return ordering_attr, last_key, last_pk, limit
+
+    def queryset_after_cursor(self, queryset, ordering_attr, last_key, last_pk):
+        if ordering_attr == self.model_class()._meta.pk.name:
+            queryset = queryset.order_by('pk')
+            return queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+
+        # the pk breaks ties of the ordering attribute, so no row is repeated or skipped between pages
+        queryset = queryset.order_by(ordering_attr, 'pk')
+        if last_pk is None:
+            return queryset
+
+        # the redundant '>=' lets the database start an index range scan instead of evaluating the 'or'
+        after_last_key = Q(**{ordering_attr + '__gt': last_key}) | Q(**{ordering_attr: last_key, 'pk__gt': last_pk})
+        return queryset.filter(after_last_key, **{ordering_attr + '__gte': last_key})
+
+    def next_cursor_for(self, queryset, ordering_attr, limit):
+        '''
+        Answers the cursor that continues the page of the first 'limit' rows of 'queryset' (already after the cursor)
+        or None on the last page. The keys of one row more than the page are read, so a full last page has no next page
+        '''
+        keys = list(queryset.values_list(ordering_attr, 'pk')[:limit + 1])
+        if len(keys) <= limit:
+            return None
+
+        return self.encode_cursor(ordering_attr, *keys[limit - 1])
+
+    def cursor_limit_link(self, request, cursor_limit_snippet, next_cursor):
+        absolute_uri = self.remove_last_slash(request.build_absolute_uri())
+        if cursor_limit_snippet not in absolute_uri:
+            return None
+
+        limit = cursor_limit_snippet.split(PARAM_SEPARATOR)[-1].split('/')[-1]
+        next_cursor_limit_snippet = self.operation_controller.cursor_limit_collection_operation_name + '/' + next_cursor + PARAM_SEPARATOR + limit
+        idx = absolute_uri.rindex(cursor_limit_snippet)
+
+        return absolute_uri[:idx] + next_cursor_limit_snippet + absolute_uri[idx + len(cursor_limit_snippet):]
+
     # ---------------------------------------- GET CONTEXT FROM OPERATION  ----------------------------------------
     def get_context_for_filter_operation(self, request, attributes_functions_str):
         context = self.get_context_for_operation(request, attributes_functions_str)
@@ -602,7 +812,7 @@ class AbstractCollectionResource(AbstractResource):
         resource_type = self.resource_type_or_default_resource_type(request)
         context = self.get_context_for_operation_resource_type(attributes_functions_str, resource_type)
 
-        attr_name = self.remove_last_slash(attributes_functions_str).split('/')[-1]
+        attr_name = self.path_segments(attributes_functions_str)[-1]
         context_dict_for_attr = {}
         context_dict_for_attr[attr_name] = self.context_resource.attribute_contextualized_dict_for_field(self.field_for(attr_name))
         context["@context"] = context_dict_for_attr
@@ -614,7 +824,7 @@ class AbstractCollectionResource(AbstractResource):
         context["@context"] = self.context_resource.get_hydra_term_definition()
         context["@context"].update(self.context_resource.get_subClassOf_term_definition())
 
-        attr_name = self.remove_last_slash(attributes_functions_str).split('/')[-1]
+        attr_name = self.path_segments(attributes_functions_str)[-1]
         context_dict_for_attr = {}
         context_dict_for_attr[attr_name] = self.context_resource.attribute_contextualized_dict_for_field(self.field_for(attr_name))
         context["@context"].update(context_dict_for_attr)
@@ -633,7 +843,7 @@ class AbstractCollectionResource(AbstractResource):
 
     def get_context_for_group_by_sum_operation(self, request, attributes_functions_str):
         context = self.get_context_for_operation(request, attributes_functions_str)
-        group_by_attr = self.remove_last_slash(attributes_functions_str).split("/")[1]
+        group_by_attr = self.path_segments(attributes_functions_str)[1]
         grouper, _ = group_by_attr.split(PARAM_SEPARATOR)
 
         operation_name = self.get_operation_name_from_path(attributes_functions_str)
@@ -666,6 +876,9 @@ class AbstractCollectionResource(AbstractResource):
     def return_type_for_offset_limit_operation(self, attributes_functions_str):
         return COLLECTION_TYPE
 
+    def return_type_for_cursor_limit_operation(self, attributes_functions_str):
+        return self.return_type_for_offset_limit_operation(attributes_functions_str)
+
     def return_type_for_distinct_operation(self, attributes_functions_str):
         return COLLECTION_TYPE
 
@@ -770,6 +983,9 @@ class AbstractCollectionResource(AbstractResource):
         d.update({
             self.operation_controller.offset_limit_collection_operation_name: self.required_object_for_offset_limit_operation,
             self.operation_controller.offset_limit_and_collect_collection_operation_name: self.required_object_for_offset_limit_and_collect_collection_operation,
+            self.operation_controller.cursor_limit_collection_operation_name: self.required_object_for_cursor_limit_operation,
+            self.operation_controller.cursor_limit_and_collect_collection_operation_name: self.required_object_for_cursor_limit_and_collect_collection_operation,
+            self.operation_controller.filter_and_cursor_limit_collection_operation_name: self.required_object_for_filter_and_cursor_limit_collection_operation,
             self.operation_controller.filter_and_collect_collection_operation_name: self.required_object_for_filter_and_collect_collection_operation,
             self.operation_controller.filter_and_count_resource_collection_operation_name: self.required_object_for_filter_and_count_resource_collection_operation,
             self.operation_controller.count_resource_collection_operation_name: self.required_object_for_count_resource_operation,
@@ -794,6 +1010,9 @@ class AbstractCollectionResource(AbstractResource):
             self.operation_controller.group_by_count_collection_operation_name: self.required_context_for_group_by_count_operation,
             self.operation_controller.filter_and_collect_collection_operation_name: self.required_context_for_collect_operation,
             self.operation_controller.offset_limit_and_collect_collection_operation_name: self.required_context_for_offset_limit_and_collect_operation,
+            self.operation_controller.cursor_limit_collection_operation_name: self.required_context_for_cursor_limit_operation,
+            self.operation_controller.cursor_limit_and_collect_collection_operation_name: self.required_context_for_cursor_limit_and_collect_operation,
+            self.operation_controller.filter_and_cursor_limit_collection_operation_name: self.required_context_for_filter_and_cursor_limit_operation,
             self.operation_controller.filter_and_count_resource_collection_operation_name: self.required_context_for_count_resource_operation,
             self.operation_controller.group_by_sum_collection_operation_name: self.required_context_for_group_by_sum_operation,
         })
@@ -810,6 +1029,9 @@ class AbstractCollectionResource(AbstractResource):
             self.operation_controller.group_by_count_collection_operation_name:             self.return_type_for_group_by_count_operation,
             self.operation_controller.filter_and_collect_collection_operation_name:         self.return_type_for_collect_operation,
             self.operation_controller.offset_limit_and_collect_collection_operation_name:   self.return_type_for_offset_limit_and_collect_operation,
+            self.operation_controller.cursor_limit_collection_operation_name:               self.return_type_for_cursor_limit_operation,
+            self.operation_controller.cursor_limit_and_collect_collection_operation_name:   self.return_type_for_offset_limit_and_collect_operation,
+            self.operation_controller.filter_and_cursor_limit_collection_operation_name:    self.return_type_for_filter_operation,
             self.operation_controller.filter_and_count_resource_collection_operation_name:  self.return_type_for_count_resource_operation,
             self.operation_controller.group_by_sum_collection_operation_name:               self.return_type_for_group_by_sum_operation,
         })
@@ -826,6 +1048,9 @@ class AbstractCollectionResource(AbstractResource):
             self.operation_controller.group_by_count_collection_operation_name:             self.resource_type_by_operation,
             self.operation_controller.filter_and_collect_collection_operation_name:         self.resource_type_by_operation,
             self.operation_controller.offset_limit_and_collect_collection_operation_name:   self.resource_type_by_operation,
+            self.operation_controller.cursor_limit_collection_operation_name:               self.resource_type_by_operation,
+            self.operation_controller.cursor_limit_and_collect_collection_operation_name:   self.resource_type_by_operation,
+            self.operation_controller.filter_and_cursor_limit_collection_operation_name:    self.resource_type_by_operation,
             self.operation_controller.filter_and_count_resource_collection_operation_name:  self.resource_type_by_operation,
             self.operation_controller.group_by_sum_collection_operation_name:               self.resource_type_by_operation,
         })
@@ -849,7 +1074,11 @@ class AbstractCollectionResource(AbstractResource):
                 return self.required_object_for_complex_request(request)
             return self.required_object_for_invalid_sintax(attributes_functions_str, message="Complex requests is not enabled")
 
-        res = self.get_required_object_from_method_to_execute(request, attributes_functions_str)
+        try:
+            res = self.get_required_object_from_method_to_execute(request, attributes_functions_str)
+        except InvalidFilterExpression as err:
+            # every operation with a filter (filter, filter/.../*count-resource, filter/.../*collect ...) is answered here
+            return self.required_object_for_invalid_sintax(attributes_functions_str, message=str(err))
         if res is None:
             return self.required_object_for_invalid_sintax(attributes_functions_str)
         return res
@@ -894,7 +1123,7 @@ class AbstractCollectionResource(AbstractResource):
         if self.path_has_projection(attributes_functions_str):
             offset_limit_snippet_arr = self.remove_projection_from_path(attributes_functions_str).split('/')
         else:
-            offset_limit_snippet_arr = self.remove_last_slash(attributes_functions_str).split('/')
+            offset_limit_snippet_arr = self.path_segments(attributes_functions_str)
 
         if offset_limit_snippet_arr[0] != self.operation_controller.offset_limit_collection_operation_name:
             return False
@@ -910,6 +1139,20 @@ class AbstractCollectionResource(AbstractResource):
             return False
         return True
 
+    def cursor_limit_operation_sintax_is_ok(self, attributes_functions_str):
+        try:
+            cursor_limit_snippet = self.extract_cursor_limit_operation_snippet(attributes_functions_str)
+            self.cursor_limit_parameters(cursor_limit_snippet)
+        except (SyntaxError, ValueError, IndexError):
+            return False
+
+        attrs_funcs_str = self.remove_projection_from_path(attributes_functions_str) if self.path_has_projection(attributes_functions_str) else self.remove_last_slash(attributes_functions_str)
+        cursor_limit_snippet_arr = attrs_funcs_str.split('/')
+        if cursor_limit_snippet_arr[0] == self.operation_controller.cursor_limit_collection_operation_name\
+            and len(cursor_limit_snippet_arr) > 2 and not self.is_operation(cursor_limit_snippet_arr[2]):
+            return False
+        return True
+
     def convert_value_to_filter_attribute_type(self, type_to_convert_value, literal_value_str):
         try:
             converter = ConverterType()
@@ -998,7 +1241,7 @@ class AbstractCollectionResource(AbstractResource):
         if self.path_has_url(attributes_functions_str):
             attributes_functions_arr = self.attribute_functions_str_with_url_splitted_by_slash(attributes_functions_str)
         else:
-            attributes_functions_arr = self.remove_last_slash(attributes_functions_str).split('/')
+            attributes_functions_arr = self.path_segments(attributes_functions_str)
 
         if not self.filter_operation_sintax_first_three_index_is_ok(attributes_functions_arr):
             return False
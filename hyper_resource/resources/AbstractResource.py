@@ -4,6 +4,8 @@ from hyper_resource.views import *
 from image_generator.img_generator import BuilderPNG
 
 import ast
+import gzip
+import inspect
 import re
 import json
 import random
@@ -13,12 +15,14 @@ import requests
 from django.contrib.gis.db.models.functions import AsGeoJSON
 from django.contrib.gis.gdal import SpatialReference
 from django.db.models.base import ModelBase
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
 # Create your views here.
-from django.utils.http import quote_etag
+from django.utils.cache import patch_vary_headers
+from django.utils.http import quote_etag, http_date, parse_http_date_safe
 from requests import ConnectionError
 from requests import HTTPError
+from requests import Timeout
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -28,9 +32,13 @@ from rest_framework.negotiation import BaseContentNegotiation
 from django.contrib.gis.db import models
 from abc import ABCMeta, abstractmethod
 from datetime import datetime
+from django.conf import settings
 from django.core.cache import cache
 import hashlib
-from hyper_resource.models import FactoryComplexQuery, BusinessModel, ConverterType
+from hyper_resource.models import FactoryComplexQuery, BusinessModel, ConverterType, TableVersion, ETagIndex
+from hyper_resource.response_cache import TieredCache
+from hyper_resource.blob_store import ContentAddressedStore, FileRange, StoredBody, byte_range
+from hyper_resource.path_parser import parse_path, path_segments_with_url, path_splitted_by_url
 from image_generator.img_generator import BuilderPNG
 from user_management.models import HyperUser
 
@@ -149,6 +157,9 @@ class AbstractResource(APIView):
         self.iri_style = ''
         self.operation_controller = BaseOperationController()
         self.e_tag = None
+        self.current_table_version = None
+        # rel => IRI of the links built with the representation (like the next page), they are cached with it
+        self.representation_links = {}
         self.is_entry_point = False
         self.http_allowed_methods = ELEMENT_METHODS
 
@@ -158,8 +169,13 @@ class AbstractResource(APIView):
     def get_content_types_for_resource(self):
         return [CONTENT_TYPE_JSON, CONTENT_TYPE_OCTET_STREAM]
 
+    # Versions, validators and representations kept in a process local cache are not invalidated by the writes of other workers
+    def cache_is_shared(self):
+        return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHE_BACKENDS
+
+    # Cached representations are invalidated through the cache itself, so it must be shared by every worker
     def cache_enabled(self):
-        return False
+        return self.cache_is_shared()
 
     def generate_e_tag(self, data):
         return str(hash(data))
@@ -171,15 +187,69 @@ class AbstractResource(APIView):
         return response
 
     def hashed_value(self, request, serialized_data):
+        if isinstance(serialized_data, StoredBody):
+            return self.body_e_tag(request, serialized_data)
         #resource_hash = hashlib.sha1(json.dumps(serialized_data).encode()).hexdigest()
         resource_hash = hashlib.sha1(str(serialized_data).encode()).hexdigest()
         resource_hash = resource_hash + "." + self.content_type_by_accept(request)
         self.e_tag = resource_hash
         return resource_hash
 
-    # todo: remove etag default parameter, Etag must be a has of the serialized data
+    # Should be overridden. Answer False when the representation does not depend only on the resource's table
+    # When it answers False the Etag is the hash of the representation
+    def versioned_e_tag_enabled(self, request):
+        # the table versions are kept in the cache, a worker would not see the versions bumped by the others
+        if self.serializer_class is None or not self.cache_is_shared():
+            return False
+        # representations built from other resources (urls as parameters) change without the table being changed
+        return not self.path_has_url(request.get_full_path())
+
+    # The version is read once per request, before any query, so a write during the request never gets its version
+    def table_version(self):
+        if self.current_table_version is None:
+            self.current_table_version = TableVersion().version_of(self.table_name())
+        return self.current_table_version
+
+    def table_last_modified(self):
+        return TableVersion().last_modified_of(self.table_name())
+
+    def versioned_e_tag_for(self, request, a_content_type):
+        version_iri_content_type = str(self.table_version()) + self.remove_last_slash(request.build_absolute_uri()) + a_content_type
+        return hashlib.sha1(version_iri_content_type.encode()).hexdigest() + "." + a_content_type
+
+    # Answers an etag computed from (table version, iri, content type), without touching the rows, or None
+    def versioned_e_tag(self, request):
+        if not self.versioned_e_tag_enabled(request):
+            return None
+        return self.versioned_e_tag_for(request, self.content_type_by_accept(request))
+
+    def e_tags_from_header(self, header_value):
+        e_tags = []
+        for e_tag in header_value.split(','):
+            e_tag = e_tag.strip()
+            e_tag = e_tag[2:] if e_tag.startswith('W/') else e_tag
+            e_tags.append(e_tag.strip('"'))
+        return e_tags
+
+    def versioned_e_tag_match(self, request):
+        e_tag = self.versioned_e_tag(request)
+        if e_tag is None:
+            return False
+        return e_tag in self.e_tags_from_header(request.META.get(HTTP_IF_NONE_MATCH, ''))
+
+    # Answers if the If-Match header has the current versioned etag, whatever content type it was generated for
+    def versioned_e_tag_match_if_match(self, request):
+        if not self.versioned_e_tag_enabled(request):
+            return False
+
+        for e_tag in self.e_tags_from_header(request.META.get(HTTP_IF_MATCH, '')):
+            if '.' in e_tag and e_tag == self.versioned_e_tag_for(request, e_tag.split('.', 1)[1]):
+                return True
+        return False
+
     def inject_e_tag(self, request, serialized_data):
-        self.e_tag = self.hashed_value(request, serialized_data)
+        e_tag = self.versioned_e_tag(request)
+        self.e_tag = e_tag if e_tag is not None else self.hashed_value(request, serialized_data)
 
     def jwt_algorithm(self):
         return 'HS256'
@@ -252,6 +322,10 @@ class AbstractResource(APIView):
         self.add_cors_headers_in_header(response)
 
     def add_base_headers(self, request, response):
+        if response.status_code == 200:
+            for rel, iri in self.representation_links.items():
+                self.add_url_in_header(iri, response, rel=rel)
+
         iri_base = self.remove_last_slash(request.build_absolute_uri())
 
         if self.contextclassname not in iri_base:
@@ -338,6 +412,8 @@ class AbstractResource(APIView):
 
     def dispatch(self, request, *args, **kwargs):
         attributes_functions_str = self.kwargs.get("attributes_functions", None)
+        # IRIs with the same host of this request are resolved in process by the operations
+        LocalIRIResolver().set_served_host(request.META.get('HTTP_HOST'))
 
         if not self.request_forward(request):
             return HttpResponse(
@@ -472,18 +548,15 @@ class AbstractResource(APIView):
     def attribute_names_to_web(self):
         return self.serializer_class.Meta.fields
 
-    def field_for(self, attribute_name):
-        fields_model = self.object_model.fields()
+    def field_index(self):
+        return FieldIndexRegistry().index_for(type(self.object_model))
 
-        for field in fields_model:
-            if field.name == attribute_name:
-                return field
-
-        return None
+    def field_for(self, attribute_name):
+        return self.field_index().field(attribute_name)
 
     def fields_to_web_for_attribute_names(self, attribute_names):
         # gets the models fields list
-        fields_model = self.object_model.fields()
+        fields_model = self.field_index().fields
         return [field for field in fields_model if field.name in attribute_names]
 
     def fields_to_web(self):
@@ -604,7 +677,7 @@ class AbstractResource(APIView):
         key = self.get_key_cache(request)
 
         # the cache stores a tuple of Etag and the serialized data
-        tuple_etag_serialized_data = cache.get(key)
+        tuple_etag_serialized_data = self.valid_entry_in_cache(key)
 
         if tuple_etag_serialized_data is None:
             return False
@@ -613,8 +686,53 @@ class AbstractResource(APIView):
 
     def is_conditional_get(self, request):
         return request.META.get(HTTP_IF_NONE_MATCH) is not None or \
+               request.META.get(HTTP_IF_MODIFIED_SINCE) is not None or \
                request.META.get(HTTP_IF_UNMODIFIED_SINCE) is not None
 
+    # An indexed entry is invalidated by bumping the table version, what the other workers only see in a shared cache
+    def etag_index_enabled(self, request):
+        return self.cache_is_shared() and self.versioned_e_tag_enabled(request)
+
+    def indexed_validators(self, request):
+        if not self.etag_index_enabled(request):
+            return None
+        iri = self.remove_last_slash(request.build_absolute_uri())
+        return ETagIndex().validators_for(iri, self.content_type_by_accept(request), self.table_version())
+
+    # Answers if the client's representation is still valid looking only at the etag index, no query is executed
+    def not_modified_by_index(self, request):
+        validators = self.indexed_validators(request)
+        if validators is None:
+            return False
+
+        e_tag, last_modified = validators
+        if_none_match = request.META.get(HTTP_IF_NONE_MATCH)
+        # If-None-Match has precedence over If-Modified-Since
+        if if_none_match is not None:
+            e_tags = self.e_tags_from_header(if_none_match)
+            return e_tag in e_tags or '*' in e_tags
+
+        if_modified_since = parse_http_date_safe(request.META.get(HTTP_IF_MODIFIED_SINCE, ''))
+        return if_modified_since is not None and last_modified <= if_modified_since
+
+    def index_validators(self, request, response):
+        if response.status_code != 200 or not response.has_header(ETAG) or not self.etag_index_enabled(request):
+            return
+
+        last_modified = self.table_last_modified()
+        response['Last-Modified'] = http_date(last_modified)
+        iri = self.remove_last_slash(request.build_absolute_uri())
+        ETagIndex().index(iri, self.content_type_by_accept(request), response[ETAG], last_modified, self.table_version())
+
+    def response_not_modified(self, request):
+        resp = Response(data={}, status=304, content_type=self.content_type_by_accept(request))
+        validators = self.indexed_validators(request)
+
+        if validators is not None:
+            resp[ETAG] = validators[0]
+            resp['Last-Modified'] = http_date(validators[1])
+        return resp
+
     # Should be overridden
     # Answer a formatted string(iri + accept) which is a key to retrieve an object in the cache
     def get_key_cache(self, request, a_content_type=None):
@@ -623,19 +741,188 @@ class AbstractResource(APIView):
 
         return self.request.build_absolute_uri() + self.content_type_by_accept(request)
 
-    def set_key_with_data_in_cache(self, key, etag, data, seconds=3600):
+    # Should be overridden
+    # Answer the tags (version keys) of the data which a cached representation depends on.
+    # An element depends only on its row, so writes in other rows do not purge it
+    def cache_tags(self):
+        if self.object_model is not None and self.object_model.pk is not None:
+            return [TableVersion().row_key_for(self.table_name(), self.object_model.pk)]
+        return [TableVersion().key_for(self.table_name())]
+
+    # Answer the tuple (etag, content_type, body, gzipped_body) cached with 'key', or None if it is absent or any of its tags has changed.
+    # The representation links cached with it become the links of this resource
+    def valid_entry_in_cache(self, key):
+        entry = TieredCache().get(key)
+
+        # the cache stores a tuple of the tag versions, Etag, content type, rendered body, gzipped body and representation links
+        if entry is None or len(entry) != 6:
+            return None
+
+        if cache.get_many(list(entry[0].keys())) != entry[0]:
+            return None
+
+        # the file of a stored body may have been removed (or written by another host)
+        if isinstance(entry[3], StoredBody) and not entry[3].exists():
+            return None
+
+        self.representation_links = dict(entry[5])
+        return entry[1:5]
+
+    # Should be overridden
+    def cache_gzip_enabled(self):
+        return True
+
+    # Answer the quality of each content coding in Accept-Encoding
+    def accept_encoding_qualities(self, request):
+        qualities = {}
+        for coding in request.META.get(HTTP_ACCEPT_ENCODING, '').split(','):
+            name, _, parameters = coding.partition(';')
+            parameter_name, _, value = parameters.partition('=')
+            try:
+                quality = float(value) if parameter_name.strip() == 'q' else 1.0
+            except ValueError:
+                quality = 0.0
+            qualities[name.strip().lower()] = quality
+        return qualities
+
+    # 'gzip;q=0' refuses gzip, as '*;q=0' does when gzip is not named
+    def accept_gzip(self, request):
+        qualities = self.accept_encoding_qualities(request)
+        return qualities.get('gzip', qualities.get('*', 0.0)) > 0
+
+    def rendered_content(self, data):
+        renderer = self.get_renderers()[0]
+        return renderer.render(data, renderer.media_type, {'view': self, 'request': self.request})
+
+    # Answer the tuple (etag, content_type, body, gzipped_body), the body is the final encoded representation
+    def rendered_entry(self, etag, data, a_content_type):
+        body = data if isinstance(data, (bytes, StoredBody)) else self.rendered_content(data)
+        gzipped_body = None
+
+        # byte ranges are of the identity encoding, so binary bodies are kept as they are
+        if self.is_binary_representation(a_content_type):
+            return etag, a_content_type, body, gzipped_body
+
+        # png is already compressed
+        if self.cache_gzip_enabled() and a_content_type != CONTENT_TYPE_IMAGE_PNG and len(body) >= GZIP_MIN_BYTES:
+            gzipped_body = gzip.compress(body)
+
+        return etag, a_content_type, body, gzipped_body
+
+    # Answer the entry as it was kept in the cache (a large binary body is replaced by its StoredBody)
+    def set_entry_in_cache(self, key, entry, seconds=3600):
+        if not self.cache_enabled():
+            return entry
+
+        # representations built from other resources can not be invalidated by this resource's writes
+        if not self.versioned_e_tag_enabled(self.request):
+            return entry
+
+        table_version = TableVersion()
+        tag_versions = table_version.tag_versions(self.cache_tags())
+
+        # a write was committed while the representation was built, so it may be already stale
+        if table_version.version_of(self.table_name()) != self.table_version():
+            return entry
+
+        e_tag, a_content_type, body, gzipped_body = entry
+        if self.is_binary_representation(a_content_type):
+            entry = e_tag, a_content_type, self.stored_body_for(body), gzipped_body
+        TieredCache().set(key, (tag_versions,) + tuple(entry) + (dict(self.representation_links),), seconds)
+        return entry
+
+    def set_key_with_data_in_cache(self, key, etag, data, seconds=3600, a_content_type=None):
         if isinstance(data, memoryview) or not self.cache_enabled():
             return
 
-        if cache.get(key) is None:
-            cache.set(key, (etag, data), seconds)
+        a_content_type = a_content_type or self.content_type_by_accept(self.request)
+        self.set_entry_in_cache(key, self.rendered_entry(etag, data, a_content_type), seconds)
+
+    # Answer an HttpResponse with the rendered body, nothing is rendered again
+    def response_for_rendered_entry(self, request, entry):
+        e_tag, a_content_type, body, gzipped_body = entry
+
+        if self.is_binary_representation(a_content_type):
+            return self.response_for_binary_body(request, body, a_content_type, e_tag)
+
+        if gzipped_body is not None and self.accept_gzip(request):
+            resp = HttpResponse(gzipped_body, status=200, content_type=a_content_type)
+            resp['Content-Encoding'] = 'gzip'
+        else:
+            resp = HttpResponse(body, status=200, content_type=a_content_type)
+
+        # the variant answered depends on Accept-Encoding even when the identity body is sent
+        if gzipped_body is not None:
+            patch_vary_headers(resp, ['Accept-Encoding'])
+        self.set_etag_in_header(resp, e_tag)
+
+        return resp
+
+    # Should be overridden
+    def is_binary_representation(self, a_content_type):
+        return a_content_type in [CONTENT_TYPE_OCTET_STREAM, CONTENT_TYPE_IMAGE_PNG, CONTENT_TYPE_IMAGE_TIFF]
+
+    # Should be overridden. Answer False when the binary bodies must not be written in the local disk
+    def blob_store_enabled(self):
+        return getattr(settings, 'HYPER_RESOURCE_BLOB_STORE_ENABLED', True)
+
+    # Large binary bodies are written once in the content addressed store, the cache entries keep only their StoredBody
+    def stored_body_for(self, body):
+        if self.blob_store_enabled() and isinstance(body, bytes) and len(body) >= ContentAddressedStore().min_bytes:
+            return ContentAddressedStore().put(body)
+        return body
+
+    # A strong Etag: the digest of the very bytes answered, which If-Range requires to join byte ranges
+    def body_e_tag(self, request, body):
+        digest = body.sha256() if isinstance(body, StoredBody) else hashlib.sha256(body).hexdigest()
+        e_tag = digest + "." + self.content_type_by_accept(request)
+        self.e_tag = e_tag
+        return e_tag
+
+    def requested_byte_range(self, request, size, e_tag):
+        # a client with an old copy (If-Range with another Etag) receives the whole body
+        if_range = request.META.get(HTTP_IF_RANGE)
+        if if_range is not None and if_range != e_tag:
+            return None
+        return byte_range(request.META.get(HTTP_RANGE), size)
+
+    # Answer 'body' (bytes or a StoredBody) as a whole or the byte range requested. A StoredBody is answered by
+    # a FileResponse, so the WSGI server sends the file itself (wsgi.file_wrapper/sendfile) when it is whole
+    def response_for_binary_body(self, request, body, a_content_type, e_tag):
+        size = len(body)
+        try:
+            first_and_last = self.requested_byte_range(request, size, e_tag)
+        except ValueError:
+            resp = HttpResponse(status=416)
+            resp['Content-Range'] = 'bytes */' + str(size)
+            return resp
+
+        status_code, first, last = 200, 0, size - 1
+        if first_and_last is not None:
+            status_code, (first, last) = 206, first_and_last
+
+        if isinstance(body, StoredBody):
+            a_file = body.open()
+            if status_code == 206:
+                a_file = FileRange(a_file, first, last - first + 1)
+            resp = FileResponse(a_file, status=status_code, content_type=a_content_type)
+        else:
+            resp = HttpResponse(body[first:last + 1] if status_code == 206 else body, status=status_code, content_type=a_content_type)
+
+        resp['Accept-Ranges'] = 'bytes'
+        resp['Content-Length'] = str(last - first + 1)
+        if status_code == 206:
+            resp['Content-Range'] = 'bytes ' + str(first) + '-' + str(last) + '/' + str(size)
+        if e_tag is not None:
+            resp[ETAG] = e_tag
+        return resp
 
     def resource_in_cache(self, request):
         if not self.cache_enabled():
             return
 
         key = self.get_key_cache(request)
-        return cache.get(key)
+        return self.valid_entry_in_cache(key)
 
     def is_image_content_type(self, request, **kwargs):
         return self.content_type_by_accept(request) == CONTENT_TYPE_IMAGE_PNG or kwargs.get(
@@ -662,12 +949,10 @@ class AbstractResource(APIView):
             result = str(required_object.representation_object).encode()
 
         #e_tag = self.generate_e_tag(value_to_e_tag)
-        self.set_key_with_data_in_cache(key, self.e_tag, result)
-
-        resp = HttpResponse(result, content_type=CONTENT_TYPE_OCTET_STREAM)
-        self.set_etag_in_header(resp, self.e_tag)
+        entry = self.rendered_entry(self.e_tag, result, CONTENT_TYPE_OCTET_STREAM)
+        entry = self.set_entry_in_cache(key, entry)
 
-        return resp
+        return self.response_for_rendered_entry(request, entry)
 
     # Should be overridden
     def response_base_get_with_image(self, request, required_object):
@@ -691,27 +976,17 @@ class AbstractResource(APIView):
         key = self.get_key_cache(request, CONTENT_TYPE_IMAGE_PNG)
         e_tag = self.generate_e_tag(image)
 
-        self.set_key_with_data_in_cache(key, e_tag, image)
-        resp = HttpResponse(image, content_type=CONTENT_TYPE_IMAGE_PNG)
-        self.set_etag_in_header(resp, e_tag)
+        entry = self.rendered_entry(e_tag, image, CONTENT_TYPE_IMAGE_PNG)
+        entry = self.set_entry_in_cache(key, entry)
 
-        return resp
+        return self.response_for_rendered_entry(request, entry)
 
     # Should be overridden
     def response_base_object_in_cache(self, request):
-        tuple_etag_serialized_data = self.resource_in_cache(request)
+        entry = self.resource_in_cache(request)
 
-        if tuple_etag_serialized_data is not None:
-            if HTTP_ACCEPT in request.META and request.META[HTTP_ACCEPT] in [CONTENT_TYPE_IMAGE_PNG, CONTENT_TYPE_OCTET_STREAM]:
-                resp = HttpResponse(tuple_etag_serialized_data[1], content_type=request.META[HTTP_ACCEPT])
-
-            else:
-                resp = Response(data=tuple_etag_serialized_data[1], status=200,
-                                content_type=self.content_type_by_accept(request))
-
-            self.set_etag_in_header(resp, tuple_etag_serialized_data[0])
-
-            return resp
+        if entry is not None:
+            return self.response_for_rendered_entry(request, entry)
 
     def required_object_is_image(self, required_object):
         return required_object.content_type == CONTENT_TYPE_IMAGE_PNG
@@ -719,36 +994,87 @@ class AbstractResource(APIView):
     def required_object_is_binary(self, required_object):
         return required_object.content_type == CONTENT_TYPE_OCTET_STREAM
 
+    # A generator as representation_object means the resource must be streamed, chunk by chunk
+    def required_object_is_streaming(self, required_object):
+        return inspect.isgenerator(required_object.representation_object)
+
+    # Should be overridden
+    def response_base_get_streaming(self, request, required_object):
+        return StreamingHttpResponse(required_object.representation_object, status=required_object.status_code,
+                                     content_type=required_object.content_type)
+
+    # Should be overridden. Answer True when the representation is streamed, a streamed representation is never cached
+    def representation_is_streamed(self, request):
+        return False
+
+    # Answer if the representation will be kept in the cache, it is known before the representation is computed
+    def representation_is_cacheable(self, request):
+        return self.cache_enabled() and self.versioned_e_tag_enabled(request) and not self.representation_is_streamed(request)
+
     # Should be overridden
     def response_base_get(self, request, *args, **kwargs):
-        resource = self.resource_in_cache(request)
+        entry = self.resource_in_cache(request)
+
+        if entry:
+            return self.response_for_rendered_entry(request, entry)
+
+        # waiting for another request is useless when its representation will not be in the cache
+        if not self.representation_is_cacheable(request):
+            return self.response_base_get_computed(request, *args, **kwargs)
 
-        if resource:
-            return self.response_base_object_in_cache(request)
+        # concurrent misses of the same representation are computed once, the others are answered from the cache
+        with TieredCache().computing(self.get_key_cache(request)):
+            entry = self.resource_in_cache(request)
+            if entry:
+                return self.response_for_rendered_entry(request, entry)
+            return self.response_base_get_computed(request, *args, **kwargs)
 
+    # Should be overridden
+    def response_base_get_computed(self, request, *args, **kwargs):
         required_object = self.basic_get(request, *args, **kwargs)
+
+        # streamed responses are neither hashed nor cached, otherwise the whole resource would be materialized
+        if self.required_object_is_streaming(required_object):
+            resp = self.response_base_get_streaming(request, required_object)
+            e_tag = self.versioned_e_tag(request)
+            if e_tag is not None:
+                resp[ETAG] = e_tag
+            return resp
+
         self.inject_e_tag(request, required_object.representation_object)
         status = required_object.status_code
 
-        if status in [400, 401, 404]:
+        if 400 <= status < 500:
             return Response(required_object.representation_object, status=status)
 
-        if status in [500]:
+        if status >= 500:
             return Response({'Error ': 'The server can not process this request. Status:' + str(status)}, status=status)
 
         if self.required_object_is_image(required_object):
-            return HttpResponse(required_object.representation_object, status=200, content_type=CONTENT_TYPE_IMAGE_PNG)
+            return self.response_for_binary_body(request, required_object.representation_object, CONTENT_TYPE_IMAGE_PNG, self.e_tag)
+
+        # bytes are already encoded (by the database, for instance), there is nothing to render
+        if type(required_object.representation_object) == bytes:
+            if self.cache_enabled():
+                entry = self.rendered_entry(self.e_tag, required_object.representation_object, required_object.content_type)
+                entry = self.set_entry_in_cache(self.get_key_cache(request), entry)
+                return self.response_for_rendered_entry(request, entry)
+
+            if self.is_binary_representation(required_object.content_type):
+                return self.response_for_binary_body(request, required_object.representation_object, required_object.content_type, self.e_tag)
+
+            response = HttpResponse(required_object.representation_object, status=200, content_type=required_object.content_type)
+            response["Etag"] = self.e_tag
+            return response
 
         if self.required_object_is_binary(required_object):
-            if type(required_object.representation_object) == bytes:
-                response = HttpResponse(required_object.representation_object, status=200, content_type=required_object.content_type)
-                response["Etag"] = self.e_tag
-                return response
             return self.response_base_get_binary(request, required_object)
 
-        #if self.cache_enabled():
-        key = self.get_key_cache(request, a_content_type=required_object.content_type)
-        self.set_key_with_data_in_cache(key, self.e_tag, required_object.representation_object)
+        if self.cache_enabled():
+            # the body is rendered once, for the cache and for this response
+            entry = self.rendered_entry(self.e_tag, required_object.representation_object, required_object.content_type)
+            entry = self.set_entry_in_cache(self.get_key_cache(request, a_content_type=required_object.content_type), entry)
+            return self.response_for_rendered_entry(request, entry)
 
         resp = Response(data=required_object.representation_object, status=200, content_type=required_object.content_type)
         self.set_etag_in_header(resp, self.e_tag)
@@ -757,9 +1083,12 @@ class AbstractResource(APIView):
 
     # Should be overridden
     def response_conditional_get(self, request, *args, **kwargs):
+        if self.not_modified_by_index(request):
+            return self.response_not_modified(request)
+
         a_content_type = self.content_type_by_accept(request)
 
-        if self.conditional_etag_match(request):
+        if self.versioned_e_tag_match(request) or self.conditional_etag_match(request):
             return Response(data={}, status=304, content_type=a_content_type)
 
         return self.response_base_get(request, *args, **kwargs)
@@ -787,11 +1116,16 @@ class AbstractResource(APIView):
         if 'HTTP_ETAG' in request.META:
             etag = request.META['HTTP_ETAG']
 
+        if self.versioned_e_tag_enabled(request):
+            # the table version must be read before the query runs
+            self.table_version()
+
         if self.is_conditional_get(request):
             resp = self.response_conditional_get(request, *args, **kwargs)
         else:
             resp = self.response_base_get(request, *args, **kwargs)
 
+        self.index_validators(request, resp)
         self.add_base_headers(request, resp)
         return resp
 
@@ -828,7 +1162,7 @@ class AbstractResource(APIView):
 
         serializer = self.serializer_class(obj, data=request.data, context={'request': request})
 
-        if not self.resource_etag_equals_request_if_none_match(request, obj):
+        if not self.versioned_e_tag_match_if_match(request) and not self.resource_etag_equals_request_if_none_match(request, obj):
             data = {"Precondition failed": "Data is already modified. You have to keep your current data, do another GET request for this resource and merge the modifications"}
             response = Response(data=data, status=status.HTTP_412_PRECONDITION_FAILED)
             response['access-control-allow-origin'] = self.access_control_allow_origin_str()
@@ -911,8 +1245,15 @@ class AbstractResource(APIView):
     def is_simple_path(self, attributes_functions_str):
         return attributes_functions_str is None or len(attributes_functions_str) == 0
 
+    # The path is parsed once (and cached), the methods below answer from the ParsedPath instead of splitting it again
+    def parsed_path(self, attributes_functions_str):
+        return parse_path(attributes_functions_str)
+
+    def path_segments(self, attributes_functions_str):
+        return list(parse_path(attributes_functions_str).segments)
+
     def path_has_operations(self, attributes_functions_name):
-        attrs_functs = self.remove_last_slash(attributes_functions_name).split('/')
+        attrs_functs = self.parsed_path(attributes_functions_name).segments
 
         operations = self.operation_names_model()
 
@@ -925,7 +1266,7 @@ class AbstractResource(APIView):
         return False
 
     def path_has_only_attributes(self, attributes_functions_name):
-        attrs_functs = self.remove_last_slash(attributes_functions_name).split('/')
+        attrs_functs = self.parsed_path(attributes_functions_name).segments
 
         if len(attrs_functs) > 1:
             return False
@@ -942,28 +1283,21 @@ class AbstractResource(APIView):
         if attributes_functions_name == None or attributes_functions_name == '':
             return False
 
-        attrs_funcs_arr = self.remove_last_slash(attributes_functions_name).split('/')
-        return attrs_funcs_arr[0] == self.operation_controller.projection_operation_name
+        return self.parsed_path(attributes_functions_name).segments[0] == self.operation_controller.projection_operation_name
 
     def remove_projection_from_path(self, attributes_functions_str, remove_only_name=False):
-        attrs_functs_arr = self.remove_last_slash(attributes_functions_str).split('/')
+        attrs_functs_arr = self.parsed_path(attributes_functions_str).segments
 
         if attrs_functs_arr[0] == self.operation_controller.projection_operation_name:
-            attrs_functs_arr.pop(0)
-
-            if not remove_only_name:
-                attrs_functs_arr.pop(0)
+            attrs_functs_arr = attrs_functs_arr[1:] if remove_only_name else attrs_functs_arr[2:]
 
         return '/'.join(attrs_functs_arr)
 
     def extract_projection_snippet(self, attributes_functions_str, as_string=False):
-        attrs_funcs_arr = self.remove_last_slash(attributes_functions_str).split('/')
-        projection_snippet = '/'.join(attrs_funcs_arr[:2])
-
-        return projection_snippet
+        return '/'.join(self.parsed_path(attributes_functions_str).segments[:2])
 
     def extract_projection_attributes(self, attributes_functions_str, as_string=False):
-        attrs_funcs_arr = self.remove_last_slash(attributes_functions_str).split('/')
+        attrs_funcs_arr = self.parsed_path(attributes_functions_str).segments
 
         if as_string:
             return attrs_funcs_arr[1]
@@ -1034,28 +1368,7 @@ class AbstractResource(APIView):
         return dict( json.loads(response.text) )
 
     def attributes_functions_splitted_by_url(self, attributes_functions_str_url):
-        res = attributes_functions_str_url.lower().find('http:')
-        if res == -1:
-            res = attributes_functions_str_url.lower().find('https:')
-            if res == -1:
-                res = attributes_functions_str_url.lower().find('www.')
-                if res == -1:
-                    return [attributes_functions_str_url]
-
-        if '/*' in attributes_functions_str_url:
-            param_inx = attributes_functions_str_url.index('/*')
-            param = attributes_functions_str_url[param_inx+2:]
-            return [attributes_functions_str_url[0:res], attributes_functions_str_url[res:param_inx], param]
-
-        operation_name = attributes_functions_str_url[0:res]
-        url_external_resource = attributes_functions_str_url[res:]
-
-        if PARAM_SEPARATOR in url_external_resource:
-            resource_url_without_params = url_external_resource[0:url_external_resource.index(PARAM_SEPARATOR) ]
-            other_params = url_external_resource[ url_external_resource.index(PARAM_SEPARATOR)+1: ]
-            return [operation_name, resource_url_without_params, other_params]
-
-        return [operation_name, url_external_resource, None]
+        return list(path_splitted_by_url(attributes_functions_str_url))
 
     def path_has_url(self, attributes_functions_str_url):
         return attributes_functions_str_url.find('http:') > -1 \
@@ -1080,22 +1393,7 @@ class AbstractResource(APIView):
         return url[:-1] if url.endswith('/') else url
 
     def attribute_functions_str_with_url_splitted_by_slash(self, attributes_functions_str_url):
-        att_functions_str_url = attributes_functions_str_url
-        #exp = r"(?=https{0,1}:.+?\*)https{0,1}:.+?\*"
-        exp = r'(?=https{0,1}:.+?\*)(https{0,1}:.+?\*)|(https{0,1}:.+?\/?$)'
-        #exp = r'(?=https{0,1}:.+?\*)https{0,1}:.+?[*]|[/]$'
-        url_as_arr_of_tuples = re.findall(exp, att_functions_str_url, re.IGNORECASE)
-
-        url_as_arr = self.get_url_arr_from_arr_of_tuples(url_as_arr_of_tuples)
-
-        token = '_*+_TOKEN__$URL-#_Num:'
-        for index, url_str in enumerate(url_as_arr):
-            att_functions_str_url = att_functions_str_url.replace(url_str, token + str(index), 1)# + '/*', 1)
-        att_functions_str_url_as_array = att_functions_str_url.split('/')
-        for idx, url_str in enumerate(url_as_arr):
-            att_functions_str_url_as_array[att_functions_str_url_as_array.index(token + str(idx))] = url_str if url_str[-1] not in ['*', '/'] else url_str[:-1]
-
-        return att_functions_str_url_as_array if att_functions_str_url_as_array[-1] != '*' else att_functions_str_url_as_array[:-1]
+        return list(path_segments_with_url(attributes_functions_str_url))
 
     def attribute_functions_str_splitted_by_slash(self, attributes_functions_str_url):
         att_functions_str_url = self.remove_last_slash(attributes_functions_str_url)
@@ -1185,13 +1483,11 @@ class AbstractResource(APIView):
         return self.operation_controller.dict_all_operation_dict()[operation_name]
 
     def get_operation_name_from_path(self, attributes_functions_str):
-        arr_att_funcs = self.remove_last_slash(attributes_functions_str).lower().split('/')
-
         # join operation has priority
         if self.path_has_join_operation(attributes_functions_str):
             return self.operation_controller.join_operation_name
         else:
-            first_part_name =  arr_att_funcs[0]
+            first_part_name = self.parsed_path(attributes_functions_str).lower_segments[0]
 
         if first_part_name not in self.array_of_operation_name():
             return None
@@ -1242,17 +1538,12 @@ class AbstractResource(APIView):
         return (attribute_or_method_name in dic) and dic[attribute_or_method_name].has_parameters()
 
     def path_has_join_operation(self, attributes_functions_str):
-        arr_att_funcs = self.remove_last_slash(attributes_functions_str).split('/')
-
-        join_counter = arr_att_funcs.count(self.operation_controller.join_operation_name)
-        if join_counter == 0:
-            return False
+        arr_att_funcs = self.parsed_path(attributes_functions_str).segments
 
-        for att_func in arr_att_funcs:
-            join_idx = arr_att_funcs.index(self.operation_controller.join_operation_name)
-            if join_idx != -1 and '&' in arr_att_funcs[join_idx+1]:
+        # a join segment followed by the joined attributes (left_attr&right_attr)
+        for join_idx, att_func in enumerate(arr_att_funcs[:-1]):
+            if att_func == self.operation_controller.join_operation_name and '&' in arr_att_funcs[join_idx+1]:
                 return True
-            arr_att_funcs.pop(join_idx)
         return False
 
     # method without use
@@ -1355,7 +1646,7 @@ class AbstractResource(APIView):
                 http_str = (value[0:4]).lower()
 
                 if http_str == 'http':
-                    resp = requests.get(value)
+                    resp = HttpClient().get(value)
 
                     if 400 <= resp.status_code <= 599:
                         raise HTTPError({resp.status_code: resp.reason})
@@ -1369,7 +1660,7 @@ class AbstractResource(APIView):
                         a_geom = js
                     parameters_converted.append(GEOSGeometry((json.dumps(a_geom))))
 
-            except (ConnectionError, HTTPError) as err:
+            except (ConnectionError, HTTPError, Timeout) as err:
                 print('Error: '.format(err))
 
         return parameters_converted
@@ -1377,40 +1668,31 @@ class AbstractResource(APIView):
     def generate_tmp_file(self, suffix='', length_name=10):
         return ''.join([random.choice('0123456789ABCDEF') for i in range(length_name)]) + suffix
 
-    def get_style_file(self, request):
+    def get_style_xml(self, request):
         if 'HTTP_LAYERSTYLE' in request.META:
             layer_style_url = request.META['HTTP_LAYERSTYLE']
-            response = requests.get(layer_style_url)
+            response = self.http_get(layer_style_url)
 
             if response.status_code == 200:
-                file_name = self.generate_tmp_file(suffix='_tmp_style.xml')
-
-                with open(file_name, 'w+') as st:
-                    st.write(response.text.encode('UTF-8'))
-                    st.close()
-
-                return file_name
+                return response.text
 
         return None
 
     def get_png(self, queryset, request):
-        style = self.get_style_file(request)
+        style_xml = self.get_style_xml(request)
 
         if isinstance(queryset, GEOSGeometry):
-            config = {'wkt': queryset.wkt, 'type': queryset.geom_type}
+            config = {'wkbs': [bytes(queryset.wkb)], 'type': queryset.geom_type}
         elif isinstance(queryset, dict):
             try:
-                config = {"wkt": queryset[self.geometry_field_name()].wkt, "type": queryset[self.geometry_field_name()].geom_type }
+                config = {"wkbs": [bytes(queryset[self.geometry_field_name()].wkb)], "type": queryset[self.geometry_field_name()].geom_type }
             except KeyError:
                 config = {"wkt": queryset["coordinates"], "type": queryset["type"]}
         else:
-            config = {'wkt': queryset.geom.wkt, 'type': queryset.geom.geom_type}
+            config = {'wkbs': [bytes(queryset.geom.wkb)], 'type': queryset.geom.geom_type}
 
-        if style is not None:
-            config.update({
-                'style': style,
-                'deleteStyle': True
-            })
+        if style_xml is not None:
+            config['style_xml'] = style_xml
 
         builder_png = BuilderPNG(config)
 
@@ -1465,12 +1747,27 @@ class AbstractResource(APIView):
         return required_obj
 
     def required_object_for_complex_request(self, request):
-        response = self.execute_complex_request(request)
+        try:
+            response = self.execute_complex_request(request)
+        except HTTPError as err:
+            return self.required_object_for_iri_error(err)
         return RequiredObject(json.loads(response.json), self.content_type_by_accept(request), self, 200)
 
+    # Answer the error of an IRI used by the operation, with the status it was answered
+    def required_object_for_iri_error(self, http_error):
+        representation_object = {'This IRI can not be retrieved: ': http_error.response.url}
+        return RequiredObject(representation_object, CONTENT_TYPE_JSON, self, http_error.response.status_code)
+
     # must be overrided
     def required_object_for_join_operation(self, request, attributes_functions_str):
-        join_objects_or_None = self.get_objects_from_join_operation(request, attributes_functions_str)
+        if not self.join_type_is_ok(request, attributes_functions_str):
+            message = "The join type must be one of: " + ", ".join(JOIN_TYPES)
+            return self.required_object_for_invalid_sintax(attributes_functions_str, message=message)
+
+        try:
+            join_objects_or_None = self.get_objects_from_join_operation(request, attributes_functions_str)
+        except HTTPError as err:
+            return self.required_object_for_iri_error(err)
         if join_objects_or_None:
             return RequiredObject(join_objects_or_None, self.content_type_by_accept(request), self, 200)
 
@@ -1510,10 +1807,9 @@ class AbstractResource(APIView):
     def build_join_operation(self, request, attributes_functions_str):
         uri_before_oper, join_attrs, uri_or_data_after_oper = self.split_join_uri(request, attributes_functions_str)
 
-        data_before_oper = requests.get(uri_before_oper).json()
+        data_before_oper = self.data_from_iri(uri_before_oper, '*/*')
         if uri_or_data_after_oper.startswith('http://') or uri_or_data_after_oper.startswith('https://') or uri_or_data_after_oper.startswith('www.'):
-            response = requests.get(uri_or_data_after_oper, headers={'Accept': 'application/json'})
-            data_after_oper = response.json()
+            data_after_oper = self.data_from_iri(uri_or_data_after_oper, CONTENT_TYPE_JSON)
         else:
             data_after_oper = json.loads(uri_or_data_after_oper)
 
@@ -1521,11 +1817,43 @@ class AbstractResource(APIView):
             left_join_data=data_before_oper,
             left_join_attr=join_attrs[0],
             right_join_attr=join_attrs[1],
-            right_join_data=data_after_oper
+            right_join_data=data_after_oper,
+            join_type=self.join_type_from_join_attrs(join_attrs)
         )
 
+    # Answer the response of GET 'url', a remote resource that does not answer in time is answered as 504 (Gateway Timeout)
+    def http_get(self, url, headers=None):
+        try:
+            return HttpClient().get(url, headers=headers)
+        except Timeout:
+            response = requests.models.Response()
+            response.status_code, response.reason, response.url = 504, 'Gateway Timeout', url
+            return response
+
+    # Raises HTTPError when the resource of 'iri' answers an error, be it local or remote
+    def data_from_iri(self, iri, accept=CONTENT_TYPE_JSON):
+        required_object = LocalIRIResolver().required_object_for(iri, accept)
+        if required_object is None:
+            response = self.http_get(iri, headers={'Accept': accept})
+            response.raise_for_status()
+            return response.json()
+
+        if required_object.status_code >= 400:
+            response = requests.models.Response()
+            response.status_code, response.url = required_object.status_code, iri
+            raise HTTPError(str(required_object.status_code) + ' Error for url: ' + iri, response=response)
+        return LocalIRIResolver().data_from(required_object)
+
+    # join/left_attr&right_attr/... is an inner join, join/left_attr&right_attr&left/... a left join
+    def join_type_from_join_attrs(self, join_attrs):
+        return join_attrs[2].lower() if len(join_attrs) > 2 else INNER_JOIN
+
+    def join_type_is_ok(self, request, attributes_functions_str):
+        join_attrs = self.split_join_uri(request, attributes_functions_str)[1]
+        return len(join_attrs) <= 3 and self.join_type_from_join_attrs(join_attrs) in JOIN_TYPES
+
     def split_join_uri(self, request, attributes_functions_str):
-        attrs_funcs_arr = self.remove_last_slash(attributes_functions_str).split('/')
+        attrs_funcs_arr = self.path_segments(attributes_functions_str)
 
 
         join_idx = attrs_funcs_arr.index(self.operation_controller.join_operation_name)
@@ -1567,7 +1895,7 @@ class AbstractResource(APIView):
         if self.path_has_url(attributes_functions_str):
             attrs_fucs_arr = self.attribute_functions_str_with_url_splitted_by_slash(attributes_functions_str)
         else:
-            attrs_fucs_arr = self.remove_last_slash(attributes_functions_str).split("/")
+            attrs_fucs_arr = self.path_segments(attributes_functions_str)
 
         # todo: use self.object_model or a simple object (with CharFields setted to "" and IntegerFields setted to 1)
         result = self.get_operation_return_type(self.object_model, attrs_fucs_arr[0], attrs_fucs_arr[1:])
@@ -1637,7 +1965,7 @@ class AbstractResource(APIView):
         }
 
     def projection_operation_sintax_is_ok(self, attributes_functions_str):
-        projection_snippet_arr = self.remove_last_slash(attributes_functions_str).split('/')
+        projection_snippet_arr = self.path_segments(attributes_functions_str)
 
         try:
             if projection_snippet_arr[0] != self.operation_controller.projection_operation_name:
@@ -1,6 +1,12 @@
+from collections import namedtuple
+
 from django.contrib.gis.gdal import GDALRaster
 from django.db import connection
 
+# the columns of PostGIS ST_MetaData, it is read from the raster header only
+RasterMetadata = namedtuple('RasterMetadata', ['upper_left_x', 'upper_left_y', 'width', 'height', 'scale_x', 'scale_y',
+                                               'skew_x', 'skew_y', 'srid', 'num_bands'])
+
 
 class BaseModel(object):
 
@@ -71,6 +77,27 @@ class BaseModel(object):
             return model_raster_collection
     '''
 
+    def get_raster_metadata(self, view_resource, pk):
+        pk_name = view_resource.pk_name()
+        sql_string = "SELECT (ST_MetaData(" + view_resource.spatial_field_name() + ")).* FROM " + view_resource.table_name() + " WHERE " + pk_name + " = %s"
+        with connection.cursor() as cursor:
+            cursor.execute(sql_string, [pk])
+            row = cursor.fetchone()
+            return None if row is None else RasterMetadata(*row)
+
+    def get_raster_bytes(self, view_resource, pk, raster_expression, params):
+        '''
+        Answers the GTiff bytes of 'raster_expression', a PostGIS raster expression of the spatial field (written as {raster}).
+        It is computed by the database, so only the pixels of the answer are transferred. Answers None if it is empty
+        '''
+        pk_name = view_resource.pk_name()
+        sql_string = "SELECT ST_AsGDALRaster(" + raster_expression.format(raster=view_resource.spatial_field_name()) + ", 'GTiff') FROM " + \
+                     view_resource.table_name() + " WHERE " + pk_name + " = %s"
+        with connection.cursor() as cursor:
+            cursor.execute(sql_string, list(params) + [pk])
+            row = cursor.fetchone()
+            return None if row is None or row[0] is None else row[0].tobytes()
+
     def get_iris_raster(self, view_resource, kwargs):
         pk_name = view_resource.pk_name()
         sql_string = "SELECT " + pk_name + " FROM " + view_resource.table_name()
@@ -1,6 +1,5 @@
 from hyper_resource.models import CollectionResourceOperationController
 from hyper_resource.resources.AbstractCollectionResource import AbstractCollectionResource
-from copy import deepcopy
 
 class CollectionResource(AbstractCollectionResource):
     def __init__(self):
@@ -10,7 +9,7 @@ class CollectionResource(AbstractCollectionResource):
         self.objs_per_page = 1000
 
     def add_base_headers(self, request, response):
-        super(AbstractCollectionResource, self).add_base_headers(request, response)
+        super(CollectionResource, self).add_base_headers(request, response)
         attributes_functions_str = self.kwargs.get('attributes_functions') if self.kwargs.get('attributes_functions') is not None else ""
         attrs_funcs_str = self.remove_projection_from_path(attributes_functions_str) if self.path_has_projection(attributes_functions_str) else attributes_functions_str
 
@@ -25,7 +24,7 @@ class CollectionResource(AbstractCollectionResource):
         offset_limit_oper_name = self.operation_controller.offset_limit_collection_operation_name
 
         if not self.is_simple_path(attributes_functions_str): # if isn't simple path, is offset_limit operation
-            offset_limit_arr = self.remove_last_slash(attributes_functions_str).split("/")
+            offset_limit_arr = self.path_segments(attributes_functions_str)
             range_arr = offset_limit_arr[1].split("&")#, offset_limit_arr[2]
             new_start_idx = str( int(range_arr[0]) + self.objs_per_page)
             new_offset_limit = offset_limit_arr[0] + "/" + new_start_idx + "&" + range_arr[1]
@@ -46,16 +45,13 @@ class CollectionResource(AbstractCollectionResource):
         return self.join_collection_on_collection(join_operation)
 
     def join_collection_on_collection(self, join_operation):
+        # the elements are fetched only for this join, they are updated in place instead of copied
         joined_data_list = []
-        for original_element in join_operation.left_join_data:
-            updated_element = deepcopy(original_element)
-            updated_element["__joined__"] = []
-            for dict_to_join in join_operation.right_join_data:
-                if updated_element[join_operation.left_join_attr] == dict_to_join[join_operation.right_join_attr]:
-                    updated_element['__joined__'].append(deepcopy(dict_to_join))
-
-            if len(updated_element["__joined__"]) > 0:
-                joined_data_list.append(updated_element)
+        left_value_of = lambda element: element[join_operation.left_join_attr]
+
+        for element, dicts_to_join in join_operation.joined_pairs(join_operation.left_join_data, left_value_of):
+            element["__joined__"] = dicts_to_join
+            joined_data_list.append(element)
 
         return joined_data_list
 
@@ -51,7 +51,7 @@ class AbstractEntryPointResource(AbstractCollectionResource):
         return self.context_resource.addContext(request, response)
 
     def path_has_only_attributes(self, attributes_functions_name):
-        attrs_functs = self.remove_last_slash(attributes_functions_name).split('/')
+        attrs_functs = self.path_segments(attributes_functions_name)
 
         if len(attrs_functs) > 1:
             return False
@@ -96,13 +96,7 @@ class AbstractEntryPointResource(AbstractCollectionResource):
         return collection_operations_array
 
     def get_operation_name_from_path(self, attributes_functions_str):
-        arr_att_funcs = self.remove_last_slash(attributes_functions_str).lower().split('/')
-
-        if self.path_has_projection(attributes_functions_str):
-            path_without_projection = self.remove_projection_from_path(attributes_functions_str)
-            first_part_name = self.operation_controller.projection_operation_name if path_without_projection == '' else arr_att_funcs[2]
-        else:
-            first_part_name = arr_att_funcs[0]
+        first_part_name = self.parsed_path(attributes_functions_str).operation_name
 
         if first_part_name not in self.array_of_operation_name():
             return None
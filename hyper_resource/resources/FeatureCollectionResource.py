@@ -1,15 +1,19 @@
 
+import hashlib
 import json
 from operator import itemgetter
 
-import requests
 
 from django.core import cache
 from django.contrib.gis.db.models import Extent, Union, MakeLine
+from django.contrib.gis.db.models.functions import Transform
 from django.contrib.gis.geos import GeometryCollection, GEOSGeometry
+from django.core.exceptions import FieldDoesNotExist
 from django.db import ProgrammingError
+from django.db.models.query import QuerySet
 
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
 
 from hyper_resource.resources.AbstractResource import *
 from hyper_resource.resources.AbstractResource import RequiredObject
@@ -20,10 +24,22 @@ from hyper_resource.resources.SpatialCollectionResource import SpatialCollection
 from hyper_resource.resources.AbstractCollectionResource import AbstractCollectionResource, COLLECTION_TYPE
 from hyper_resource.models import SpatialCollectionOperationController, BaseOperationController, FactoryComplexQuery, \
     ConverterType, FeatureModel, FeatureCollection
-from copy import deepcopy
+from hyper_resource.geometry_sql import GeometryOperationCompiler, SimplifyPreserveTopology
+from hyper_resource.tiles import VectorTileEncoder, tile_envelope, tile_is_valid, metatile_of, metatile_bounds, MVT_BUFFER, MVT_EXTENT, \
+    WEB_MERCATOR_SRID, METATILE_SIZE, PNG_TILE_SIZE, PNG_TILE_BUFFER_PIXELS
+from hyper_resource.tile_store import DiskTileStore
 from image_generator.img_generator import BuilderPNG
 from django.contrib.gis.geos import Polygon
 
+MAP_IMAGE_DEFAULT_WIDTH = 800
+MAP_IMAGE_DEFAULT_HEIGHT = 600
+MAP_IMAGE_MAX_SIZE = 4096
+MAP_IMAGE_DEFAULT_SRID = 4326
+# annotation with the geometry transformed to the map srid and simplified to the pixel resolution
+MAP_IMAGE_GEOMETRY_ALIAS = 'map_image_geometry'
+DEFAULT_STYLE_KEY = 'default'
+PNG_METATILE_KEY_PREFIX = 'png-metatile:'
+
 
 class FeatureCollectionResource(SpatialCollectionResource):
     def __init__(self):
@@ -54,6 +70,105 @@ class FeatureCollectionResource(SpatialCollectionResource):
     def dict_list_as_feature_collection(self, dict_list):
         return {'type': 'FeatureCollection', 'features': dict_list}
 
+    # Should be overridden. Large layers should answer True to stream the simple path feature by feature
+    def streaming_enabled(self):
+        return False
+
+    def streaming_chunk_size(self):
+        return 2000
+
+    def accept_is_json(self, request):
+        return self.content_type_by_accept(request) in [CONTENT_TYPE_JSON, CONTENT_TYPE_GEOJSON]
+
+    def representation_is_streamed(self, request):
+        return self.streaming_enabled() and not self.database_geojson_enabled() and self.accept_is_json(request) and \
+               self.is_simple_path(self.kwargs.get('attributes_functions'))
+
+    def feature_collection_stream(self, queryset, request):
+        '''
+        Yields a FeatureCollection as JSON chunks, reading the queryset with a server-side cursor,
+        so only one chunk of features is in memory at a time
+        '''
+        serializer = self.serializer_class(context={'request': request})
+        chunk_size = self.streaming_chunk_size()
+        features = []
+        separator = ''
+
+        yield '{"type": "FeatureCollection", "features": ['
+        for business_object in queryset.iterator(chunk_size=chunk_size):
+            features.append(json.dumps(serializer.to_representation(business_object), cls=JSONEncoder))
+            if len(features) == chunk_size:
+                yield separator + ','.join(features)
+                separator = ','
+                features = []
+
+        if features:
+            yield separator + ','.join(features)
+        yield ']}'
+
+    def required_object_for_streaming(self, request, queryset):
+        return RequiredObject(self.feature_collection_stream(queryset, request), self.content_type_by_accept(request), queryset, 200)
+
+    # Should be overridden. Answer True to let PostGIS build the GeoJSON of simple path, filter, offset-limit and projection
+    def database_geojson_enabled(self):
+        return False
+
+    def required_object_for_database_geojson(self, request, queryset, attribute_names=None):
+        '''
+        Answers a RequiredObject whose representation is the GeoJSON already encoded by the database,
+        or None when the request can not be answered this way
+        '''
+        if not self.database_geojson_enabled() or not self.accept_is_json(request):
+            return None
+
+        if attribute_names is not None and (self.geometry_field_name() not in attribute_names or len(attribute_names) < 2):
+            return None
+
+        try:
+            geojson = self.object_model.get_model_objects_geojson(self, queryset, attribute_names)
+        except (ProgrammingError, FieldDoesNotExist):
+            return None
+
+        return RequiredObject(geojson.encode(), self.content_type_by_accept(request), queryset, 200)
+
+    # Should be overridden. Answers the name of the layer in the vector tiles
+    def tile_layer_name(self):
+        return self.table_name()
+
+    def tile_extent(self):
+        return MVT_EXTENT
+
+    # Should be overridden. Answers, in tile units, how much of the geometries around the tile is kept to avoid rendering artifacts
+    def tile_buffer(self):
+        return MVT_BUFFER
+
+    # Should be overridden. Answers how many png tiles by side are rendered at once (a power of 2)
+    def metatile_size(self):
+        return getattr(settings, 'HYPER_RESOURCE_METATILE_SIZE', METATILE_SIZE)
+
+    def tile_attribute_names(self):
+        '''
+        Answers the attributes encoded as properties of the vector tile features.
+        Relationships are IRIs and geometries are the features themselves, so they are left out
+        '''
+        attribute_names = []
+        for attribute_name in self.serializer_class.Meta.fields:
+            try:
+                field = self.model_class()._meta.get_field(attribute_name)
+            except FieldDoesNotExist:
+                continue
+            if not field.is_relation and not isinstance(field, GeometryField):
+                attribute_names.append(attribute_name)
+        return attribute_names
+
+    def vector_tile_features(self, queryset, attribute_names):
+        # the database transforms the geometries to web mercator, python only clips and encodes them
+        rows = queryset.annotate(mvt_geometry=Transform(self.geometry_field_name(), WEB_MERCATOR_SRID))\
+                       .values('pk', 'mvt_geometry', *attribute_names)
+
+        for row in rows.iterator():
+            yield row['pk'], row['mvt_geometry'], {name: row[name] for name in attribute_names}
+
     def dict_list_as_geometry_collection(self, dict_list):
         return {'type': 'GeometryCollection', 'geometries': dict_list}
 
@@ -312,8 +427,7 @@ class FeatureCollectionResource(SpatialCollectionResource):
         geom_left = ct.get_geos_geometry_from_request(request_tuple[0])
 
         if self.path_has_url(request_tuple[2]):
-            response = requests.get(request_tuple[2])
-            response_right = json.dumps(response.json())
+            response_right = json.dumps(self.data_from_iri(request_tuple[2], '*/*'))
 
         else: # if request_list[2] is GeometryCollection (GeoJson) or WKT ...
             response_right = request_tuple[2]
@@ -354,7 +468,10 @@ class FeatureCollectionResource(SpatialCollectionResource):
              self.operation_controller.union_collection_operation_name:     self.required_object_for_union_operation,
              self.operation_controller.extent_collection_operation_name:    self.required_object_for_extent_operation,
              self.operation_controller.make_line_collection_operation_name: self.required_object_for_make_line_operation,
-             self.operation_controller.envelope_collection_operation_name:  self.required_object_for_envelope_operation
+             self.operation_controller.envelope_collection_operation_name:  self.required_object_for_envelope_operation,
+             self.operation_controller.tiles_collection_operation_name:     self.required_object_for_tiles_operation,
+             self.operation_controller.map_image_collection_operation_name: self.required_object_for_map_image_operation,
+             self.operation_controller.png_tiles_collection_operation_name: self.required_object_for_png_tiles_operation
         })
 
         return dicti
@@ -393,6 +510,9 @@ class FeatureCollectionResource(SpatialCollectionResource):
              self.operation_controller.extent_collection_operation_name:    self.required_context_for_extent_operation,
              self.operation_controller.make_line_collection_operation_name: self.required_context_for_make_line_operation,
              self.operation_controller.envelope_collection_operation_name:  self.required_context_for_envelope_operation,
+             self.operation_controller.tiles_collection_operation_name:     self.required_context_for_tiles_operation,
+             self.operation_controller.map_image_collection_operation_name: self.required_context_for_map_image_operation,
+             self.operation_controller.png_tiles_collection_operation_name: self.required_context_for_png_tiles_operation,
              self.operation_controller.join_operation_name:                 self.required_context_for_specialized_operation,
         })
         return dicti
@@ -431,7 +551,10 @@ class FeatureCollectionResource(SpatialCollectionResource):
             self.operation_controller.union_collection_operation_name:      self.return_type_for_union_operation,
             self.operation_controller.extent_collection_operation_name:     self.return_type_for_extent_operation,
             self.operation_controller.make_line_collection_operation_name:  self.return_type_for_make_line_operation,
-            self.operation_controller.envelope_collection_operation_name:   self.return_type_for_envelope_operation
+            self.operation_controller.envelope_collection_operation_name:   self.return_type_for_envelope_operation,
+            self.operation_controller.tiles_collection_operation_name:      self.return_type_for_tiles_operation,
+            self.operation_controller.map_image_collection_operation_name:  self.return_type_for_map_image_operation,
+            self.operation_controller.png_tiles_collection_operation_name:  self.return_type_for_png_tiles_operation
         })
         return dicti
 
@@ -469,7 +592,10 @@ class FeatureCollectionResource(SpatialCollectionResource):
             self.operation_controller.union_collection_operation_name:      self.resource_type_by_operation,
             self.operation_controller.extent_collection_operation_name:     self.resource_type_by_operation,
             self.operation_controller.make_line_collection_operation_name:  self.resource_type_by_operation,
-            self.operation_controller.envelope_collection_operation_name:   self.resource_type_by_operation
+            self.operation_controller.envelope_collection_operation_name:   self.resource_type_by_operation,
+            self.operation_controller.tiles_collection_operation_name:      self.resource_type_by_operation,
+            self.operation_controller.map_image_collection_operation_name:  self.resource_type_by_operation,
+            self.operation_controller.png_tiles_collection_operation_name:  self.resource_type_by_operation
         })
         return dicti
 
@@ -497,11 +623,20 @@ class FeatureCollectionResource(SpatialCollectionResource):
     def return_type_for_join_operation(self, attributes_functions_str):
         return FeatureCollection
 
+    def return_type_for_tiles_operation(self, attributes_functions_str):
+        return bytes
+
+    def return_type_for_map_image_operation(self, attributes_functions_str):
+        return bytes
+
+    def return_type_for_png_tiles_operation(self, attributes_functions_str):
+        return bytes
+
     def return_type_for_distinct_operation(self, attributes_functions_str):
         return FeatureCollection
 
     def return_type_for_group_by_count_operation(self, attributes_functions_str):
-        grouped_attribute = self.remove_last_slash(attributes_functions_str).split("/")[-1]
+        grouped_attribute = self.path_segments(attributes_functions_str)[-1]
         if grouped_attribute != self.geometry_field_name():
             return super(FeatureCollectionResource, self).return_type_for_group_by_count_operation(attributes_functions_str)
         return FeatureCollection
@@ -566,6 +701,13 @@ class FeatureCollectionResource(SpatialCollectionResource):
                 binary_content = geobuf.encode(serializer.data)
             return RequiredObject(binary_content, CONTENT_TYPE_OCTET_STREAM, self.object_model, 200)
 
+        required_object = self.required_object_for_database_geojson(request, self.get_objects_from_simple_path())
+        if required_object is not None:
+            return required_object
+
+        if self.streaming_enabled() and self.accept_is_json(request):
+            return self.required_object_for_streaming(request, self.get_objects_from_simple_path())
+
         return super(FeatureCollectionResource, self).required_object_for_simple_path(request)
 
     def required_object_for_only_attributes(self, request, attributes_functions_str):
@@ -573,18 +715,157 @@ class FeatureCollectionResource(SpatialCollectionResource):
             objects = self.get_object_by_only_attributes(attributes_functions_str)
             return self.required_object_for_image(objects, request)
 
+        attribute_names = self.remove_projection_from_path(attributes_functions_str, remove_only_name=True).split(',')
+        required_object = self.required_object_for_database_geojson(request, self.get_objects_from_simple_path(), attribute_names)
+        if required_object is not None:
+            return required_object
+
         return super(FeatureCollectionResource, self).required_object_for_only_attributes(request, attributes_functions_str)
 
     def required_object_for_offset_limit_operation(self, request, attributes_functions_str):
         if not self.offset_limit_operation_sintax_is_ok(attributes_functions_str):
             return self.required_object_for_invalid_sintax(attributes_functions_str)
 
+        if self.database_geojson_enabled():
+            attribute_names = self.extract_projection_attributes(attributes_functions_str) if self.path_has_projection(attributes_functions_str) else None
+            queryset = self.get_objects_from_offset_limit_operation(attributes_functions_str)
+            required_object = self.required_object_for_database_geojson(request, queryset, attribute_names)
+            if required_object is not None:
+                return required_object
+
         if not self.is_image_content_type(request):
             return super(FeatureCollectionResource, self).required_object_for_offset_limit_operation(request, attributes_functions_str)
 
         queryset_or_objects = self.get_objects_from_offset_limit_operation(attributes_functions_str)
         return self.required_object_for_image(queryset_or_objects, request)
 
+    def required_object_for_cursor_limit_operation(self, request, attributes_functions_str):
+        if not self.cursor_limit_operation_sintax_is_ok(attributes_functions_str):
+            return self.required_object_for_invalid_sintax(attributes_functions_str)
+
+        if self.database_geojson_enabled():
+            attribute_names = self.extract_projection_attributes(attributes_functions_str) if self.path_has_projection(attributes_functions_str) else None
+            queryset = self.get_objects_from_cursor_limit_operation(attributes_functions_str)
+            required_object = self.required_object_for_database_geojson(request, queryset, attribute_names)
+            if required_object is not None:
+                return required_object
+
+        if not self.is_image_content_type(request):
+            return super(FeatureCollectionResource, self).required_object_for_cursor_limit_operation(request, attributes_functions_str)
+
+        queryset_or_objects = self.get_objects_from_cursor_limit_operation(attributes_functions_str)
+        return self.required_object_for_image(queryset_or_objects, request)
+
+    def required_object_for_tiles_operation(self, request, attributes_functions_str):
+        if not self.tiles_operation_sintax_is_ok(attributes_functions_str):
+            return self.required_object_for_invalid_sintax(attributes_functions_str)
+
+        z, x, y = self.tiles_operation_parameters(attributes_functions_str)
+        queryset = self.get_objects_from_tiles_operation(attributes_functions_str)
+        attribute_names = self.tile_attribute_names()
+
+        # Keeping the compatibility with postgis < 2.4
+        try:
+            tile = self.object_model.get_model_objects_mvt(self, queryset, z, x, y, attribute_names, self.tile_extent(), self.tile_buffer())
+        except ProgrammingError:
+            encoder = VectorTileEncoder(z, x, y, self.tile_extent(), self.tile_buffer())
+            tile = encoder.encode(self.tile_layer_name(), self.vector_tile_features(queryset, attribute_names))
+
+        return RequiredObject(tile, CONTENT_TYPE_MVT, queryset, 200)
+
+    def required_object_for_map_image_operation(self, request, attributes_functions_str):
+        if not self.map_image_operation_sintax_is_ok(attributes_functions_str):
+            return self.required_object_for_invalid_sintax(attributes_functions_str)
+
+        bbox, width, height, srid = self.map_image_operation_parameters(attributes_functions_str)
+        queryset = self.get_objects_from_map_image_operation(attributes_functions_str)
+        config = self.map_image_config(queryset, self.get_style_xml(request))
+
+        image = BuilderPNG(config, bbox=bbox, srs=srid, width=width, height=height).generate()
+        return RequiredObject(image, CONTENT_TYPE_IMAGE_PNG, queryset, 200)
+
+    def required_object_for_png_tiles_operation(self, request, attributes_functions_str):
+        if not self.tiles_operation_sintax_is_ok(attributes_functions_str):
+            return self.required_object_for_invalid_sintax(attributes_functions_str)
+
+        z, x, y = self.tiles_operation_parameters(attributes_functions_str)
+        # the store is invalidated by the table (sender._meta.db_table) of the features written
+        layer = self.table_name()
+        # read before the render, so the writes committed while rendering are noticed
+        self.table_version()
+        style_xml = self.get_style_xml(request)
+        style_key = self.png_tile_style_key(style_xml)
+        # a stored tile is sent from its file, it is not read here
+        tile = DiskTileStore().stored_body(layer, style_key, z, x, y)
+        if tile is not None:
+            return RequiredObject(tile, CONTENT_TYPE_IMAGE_PNG, self.object_model, 200)
+
+        metatile_x, metatile_y, size = metatile_of(z, x, y, self.metatile_size())
+        metatile_key = '/'.join([PNG_METATILE_KEY_PREFIX + layer, style_key, str(z), str(metatile_x), str(metatile_y)])
+        # the concurrent requests of the tiles of a metatile wait for one render, then read their tiles from the store
+        with TieredCache().computing(metatile_key):
+            tile = DiskTileStore().stored_body(layer, style_key, z, x, y)
+            if tile is None:
+                tiles = self.render_metatile(z, metatile_x, metatile_y, size, style_xml)
+                self.store_metatile(style_key, z, metatile_x, metatile_y, tiles)
+                # the tiles are not stored when the table was written since then, its bytes are answered
+                tile = DiskTileStore().stored_body(layer, style_key, z, x, y) or tiles[(x - metatile_x, y - metatile_y)]
+
+        return RequiredObject(tile, CONTENT_TYPE_IMAGE_PNG, self.object_model, 200)
+
+    def table_written_since_read(self):
+        return TableVersion().version_of(self.table_name()) != self.table_version()
+
+    def store_metatile(self, style_key, z, metatile_x, metatile_y, tiles):
+        '''
+        Writes the tiles of a metatile in the store, unless the table was written after its version was read:
+        the invalidation of the write may have run while the tiles were rendered from the old rows.
+        The tiles are removed if the table is written while they are stored
+        '''
+        if self.table_written_since_read():
+            return
+
+        layer = self.table_name()
+        for (column, row), a_tile in tiles.items():
+            DiskTileStore().set(layer, style_key, z, metatile_x + column, metatile_y + row, a_tile)
+
+        if self.table_written_since_read():
+            for column, row in tiles:
+                DiskTileStore().remove(DiskTileStore().tile_path(layer, style_key, z, metatile_x + column, metatile_y + row))
+
+    def png_tile_style_key(self, style_xml):
+        return DEFAULT_STYLE_KEY if style_xml is None else hashlib.sha1(style_xml.encode('utf-8')).hexdigest()
+
+    def render_metatile(self, z, x, y, size, style_xml):
+        '''
+        Renders the size x size png tiles from z/x/y in one image and answers them by (column, row) in the metatile
+        '''
+        bbox = metatile_bounds(z, x, y, size)
+        pixels = size * PNG_TILE_SIZE
+        resolution = (bbox[2] - bbox[0]) / pixels
+        queryset = self.get_objects_in_viewport(bbox, WEB_MERCATOR_SRID, resolution, PNG_TILE_BUFFER_PIXELS * resolution)
+        config = self.map_image_config(queryset, style_xml)
+        return BuilderPNG(config, bbox=bbox, srs=WEB_MERCATOR_SRID, width=pixels, height=pixels).generate_tiles(PNG_TILE_SIZE)
+
+    def map_image_config(self, queryset, style_xml):
+        config = {
+            'wkbs': [bytes(geometry.wkb) for geometry in queryset.values_list(MAP_IMAGE_GEOMETRY_ALIAS, flat=True) if geometry is not None],
+            'type': self.field_for(self.geometry_field_name()).geom_type
+        }
+        if style_xml is not None:
+            config['style_xml'] = style_xml
+        return config
+
+    def required_object_for_filter_operation(self, request, attributes_functions_str):
+        if self.database_geojson_enabled():
+            attribute_names = self.extract_projection_attributes(attributes_functions_str) if self.path_has_projection(attributes_functions_str) else None
+            queryset = self.get_objects_from_filter_operation(attributes_functions_str)
+            required_object = self.required_object_for_database_geojson(request, queryset, attribute_names)
+            if required_object is not None:
+                return required_object
+
+        return super(FeatureCollectionResource, self).required_object_for_filter_operation(request, attributes_functions_str)
+
     def required_object_for_specialized_operation(self, request, attributes_functions_str):
         first_oper_snippet, second_oper_snippet = self.split_combined_operation(attributes_functions_str)
 
@@ -612,7 +893,7 @@ class FeatureCollectionResource(SpatialCollectionResource):
             return self.required_object(request, spatial_objects)
 
     def required_object_for_envelope_operation(self, request, attributes_functions_str):
-        attrs_funcs_arr = self.remove_last_slash(attributes_functions_str).split("/")
+        attrs_funcs_arr = self.path_segments(attributes_functions_str)
         poly = self.get_object_from_envelope_spatial_operation(attributes_functions_str)
         if len(attrs_funcs_arr) == 1:
             return RequiredObject(
@@ -648,6 +929,23 @@ class FeatureCollectionResource(SpatialCollectionResource):
         context = self.get_context_for_union_operation(request, attributes_functions_str)
         return RequiredObject(context, HYPER_RESOURCE_CONTENT_TYPE, self.object_model, 200)
 
+    def required_context_for_tiles_operation(self, request, attributes_functions_str):
+        if not self.tiles_operation_sintax_is_ok(attributes_functions_str):
+            return self.required_object_for_invalid_sintax(attributes_functions_str)
+
+        context = self.get_context_for_operation(request, attributes_functions_str)
+        return RequiredObject(context, HYPER_RESOURCE_CONTENT_TYPE, self.object_model, 200)
+
+    def required_context_for_map_image_operation(self, request, attributes_functions_str):
+        if not self.map_image_operation_sintax_is_ok(attributes_functions_str):
+            return self.required_object_for_invalid_sintax(attributes_functions_str)
+
+        context = self.get_context_for_operation(request, attributes_functions_str)
+        return RequiredObject(context, HYPER_RESOURCE_CONTENT_TYPE, self.object_model, 200)
+
+    def required_context_for_png_tiles_operation(self, request, attributes_functions_str):
+        return self.required_context_for_tiles_operation(request, attributes_functions_str)
+
     def required_context_for_extent_operation(self, request, attributes_functions_str):
         context = self.get_context_for_extent_operation(request, attributes_functions_str)
         return RequiredObject(context, HYPER_RESOURCE_CONTENT_TYPE, self.object_model, 200)
@@ -705,24 +1003,42 @@ class FeatureCollectionResource(SpatialCollectionResource):
 
     def get_objects_from_join_operation(self, request, attributes_functions_str):
         join_operation = self.build_join_operation(request, attributes_functions_str)
-        return self.join_feature_collection_on_dict_list(join_operation)
 
-    def join_feature_collection_on_dict_list(self, join_operation):
-        joined_data_list = []
-        for original_feature in join_operation.left_join_data['features']:
-            updated_feature = deepcopy(original_feature)
-            updated_feature['properties']['__joined__'] = []
+        if self.streaming_enabled() and self.accept_is_json(request):
+            return self.joined_feature_collection_stream(join_operation)
+        return self.join_feature_collection_on_dict_list(join_operation)
 
-            for dict_to_join in join_operation.right_join_data:
-                if updated_feature['properties'][join_operation.left_join_attr] == dict_to_join[join_operation.right_join_attr]:
-                    updated_feature['properties']['__joined__'].append( deepcopy(dict_to_join) )
+    def joined_features(self, join_operation):
+        # the features are fetched only for this join, they are updated in place instead of copied
+        features = join_operation.left_join_data['features']
+        left_value_of = lambda feature: feature['properties'][join_operation.left_join_attr]
 
-            # verify if the current feature was updated
-            #if sorted(list(updated_feature['properties'].keys())) != sorted(list(original_feature['properties'].keys())):
-            if len(updated_feature['properties']['__joined__']) > 0:
-                joined_data_list.append(updated_feature)
+        for feature, dicts_to_join in join_operation.joined_pairs(features, left_value_of):
+            feature['properties']['__joined__'] = dicts_to_join
+            yield feature
 
-        return {'type': 'FeatureCollection', 'features': joined_data_list}
+    def join_feature_collection_on_dict_list(self, join_operation):
+        return {'type': 'FeatureCollection', 'features': list(self.joined_features(join_operation))}
+
+    def joined_feature_collection_stream(self, join_operation):
+        '''
+        Yields the joined FeatureCollection as JSON chunks, the joined features are serialized as they are produced
+        '''
+        chunk_size = self.streaming_chunk_size()
+        features = []
+        separator = ''
+
+        yield '{"type": "FeatureCollection", "features": ['
+        for feature in self.joined_features(join_operation):
+            features.append(json.dumps(feature, cls=JSONEncoder))
+            if len(features) == chunk_size:
+                yield separator + ','.join(features)
+                separator = ','
+                features = []
+
+        if features:
+            yield separator + ','.join(features)
+        yield ']}'
 
     def get_objects_from_specialized_operation(self, attributes_functions_str):
 
@@ -736,6 +1052,67 @@ class FeatureCollectionResource(SpatialCollectionResource):
 
         return self.get_objects_from_spatial_operation(arr)
 
+    def tiles_operation_parameters(self, attributes_functions_str):
+        z, x, y = [int(param) for param in self.path_segments(attributes_functions_str)[1:]]
+        return z, x, y
+
+    def tiles_operation_sintax_is_ok(self, attributes_functions_str):
+        try:
+            z, x, y = self.tiles_operation_parameters(attributes_functions_str)
+        except ValueError:
+            return False
+        return tile_is_valid(z, x, y)
+
+    def get_objects_from_tiles_operation(self, attributes_functions_str):
+        z, x, y = self.tiles_operation_parameters(attributes_functions_str)
+        # the envelope includes the tile buffer and '&&' (bboverlaps) lets the database use the spatial index
+        envelope = tile_envelope(z, x, y, float(self.tile_buffer()) / self.tile_extent())
+        return self.model_class().objects.filter(**{self.geometry_field_name() + '__bboverlaps': envelope})
+
+    def map_image_operation_parameters(self, attributes_functions_str):
+        '''
+        map-image/<minx>,<miny>,<maxx>,<maxy>[/<width>&<height>[/<srid>]] answers (bbox, width, height, srid),
+        the bbox is in the srid coordinates (EPSG:4326 by default)
+        '''
+        parameters = self.path_segments(attributes_functions_str)[1:]
+        if len(parameters) == 0 or len(parameters) > 3:
+            raise ValueError('"' + attributes_functions_str + '" must have a bbox and may have a size and a srid')
+
+        bbox = tuple(float(coordinate) for coordinate in parameters[0].split(','))
+        width, height = MAP_IMAGE_DEFAULT_WIDTH, MAP_IMAGE_DEFAULT_HEIGHT
+        if len(parameters) > 1:
+            width, height = [int(size) for size in parameters[1].split(PARAM_SEPARATOR)]
+        srid = int(parameters[2]) if len(parameters) > 2 else MAP_IMAGE_DEFAULT_SRID
+        return bbox, width, height, srid
+
+    def map_image_operation_sintax_is_ok(self, attributes_functions_str):
+        try:
+            bbox, width, height, srid = self.map_image_operation_parameters(attributes_functions_str)
+        except ValueError:
+            return False
+        return len(bbox) == 4 and bbox[0] < bbox[2] and bbox[1] < bbox[3] and \
+               0 < width <= MAP_IMAGE_MAX_SIZE and 0 < height <= MAP_IMAGE_MAX_SIZE
+
+    def map_image_resolution(self, bbox, width, height):
+        # the size of a pixel in the units of the srid, details smaller than it are not visible in the image
+        return min((bbox[2] - bbox[0]) / width, (bbox[3] - bbox[1]) / height)
+
+    def get_objects_from_map_image_operation(self, attributes_functions_str):
+        bbox, width, height, srid = self.map_image_operation_parameters(attributes_functions_str)
+        return self.get_objects_in_viewport(bbox, srid, self.map_image_resolution(bbox, width, height))
+
+    def get_objects_in_viewport(self, bbox, srid, resolution, margin=0.0):
+        '''
+        Answers the features that overlap 'bbox' (enlarged by 'margin'), annotated with their geometry
+        transformed to 'srid' and simplified to 'resolution'
+        '''
+        viewport = Polygon.from_bbox((bbox[0] - margin, bbox[1] - margin, bbox[2] + margin, bbox[3] + margin))
+        viewport.srid = srid
+        # '&&' (bboverlaps) lets the database use the spatial index, only the features in the viewport are read
+        queryset = self.model_class().objects.filter(**{self.geometry_field_name() + '__bboverlaps': viewport})
+        map_geometry = SimplifyPreserveTopology(Transform(self.geometry_field_name(), srid), resolution)
+        return queryset.annotate(**{MAP_IMAGE_GEOMETRY_ALIAS: map_geometry})
+
     def get_objects_from_extent_spatial_operation(self, attributes_functions_str):
         first_part_name = super(FeatureCollectionResource, self).get_operation_name_from_path(attributes_functions_str)
 
@@ -786,7 +1163,7 @@ class FeatureCollectionResource(SpatialCollectionResource):
         collected_attrs = self.extract_collect_operation_attributes(attributes_functions_str)
         queryset = self.model_class().objects.values(*collected_attrs) if queryset is None else queryset
 
-        attrs_funcs_arr = self.remove_last_slash(attributes_functions_str).split("/")
+        attrs_funcs_arr = self.path_segments(attributes_functions_str)
         #obj_model_list_or_queryset = self.transform_queryset_in_object_model_list(objects)
         collected_objects_list = []
 
@@ -795,6 +1172,10 @@ class FeatureCollectionResource(SpatialCollectionResource):
         operation_name = attrs_funcs_arr[2]
         operation_params = attrs_funcs_arr[3:]
 
+        operation_expression = self.collect_operation_expression(queryset, operated_attr, operation_name, operation_params)
+        if operation_expression is not None:
+            return self.get_objects_from_collect_operation_in_database(queryset, attrs_out_of_operation, operated_attr, operation_name, operation_expression)
+
         oper_type_called_from_collect = BaseOperationController().dict_all_operation_dict()[operation_name]
 
         for dict_obj in queryset:
@@ -819,6 +1200,39 @@ class FeatureCollectionResource(SpatialCollectionResource):
 
         return collected_objects_list
 
+    def collect_operation_expression(self, queryset, operated_attr, operation_name, operation_params):
+        '''
+        Answers the database function that computes the collect operation for every row,
+        or None when the operation has to be executed in python, row by row
+        '''
+        if not isinstance(queryset, QuerySet) or not isinstance(self.field_for(operated_attr), GeometryField):
+            return None
+
+        compiler = GeometryOperationCompiler()
+        if not compiler.database_supports(queryset.db):
+            return None
+
+        return compiler.compile(operated_attr, operation_name, operation_params)
+
+    def get_objects_from_collect_operation_in_database(self, queryset, attrs_out_of_operation, operated_attr, operation_name, operation_expression):
+        operated_alias = 'collected_' + operation_name
+        if self.field_for(operated_alias) is not None:
+            operated_alias = 'collected_' + operated_alias
+
+        queryset = queryset.annotate(**{operated_alias: operation_expression}).values(*attrs_out_of_operation, operated_alias)
+
+        collected_objects_list = []
+        for dict_obj in queryset:
+            operation_result = dict_obj.pop(operated_alias)
+            # same keys as the python execution: geometries keep the attribute name, other results get the operation name
+            if isinstance(operation_result, GEOSGeometry):
+                dict_obj[operated_attr] = operation_result
+            else:
+                dict_obj[operation_name] = operation_result
+            collected_objects_list.append(dict_obj)
+
+        return collected_objects_list
+
     def get_object_serialized_by_only_attributes(self, attribute_names_str, object):
         arr = []
         attribute_names_str_as_array = self.remove_last_slash(attribute_names_str).split(',')
@@ -930,7 +1344,7 @@ class FeatureCollectionResource(SpatialCollectionResource):
 
     def get_png(self, queryset, request):
         geom_type = None
-        wkt = 'GEOMETRYCOLLECTION('
+        wkbs = []
 
         if isinstance(queryset, dict):
             try:
@@ -941,9 +1355,9 @@ class FeatureCollectionResource(SpatialCollectionResource):
             except KeyError:
                 queryset = [value for key, value in queryset.items()]
 
-        for i, e in enumerate(queryset):
+        for e in queryset:
             if isinstance(e, FeatureModel):
-                wkt += e.get_spatial_object().wkt  # it is need to fix the case that the attribute is not called by geom
+                wkbs.append(bytes(e.get_spatial_object().wkb))  # it is need to fix the case that the attribute is not called by geom
 
             else:
                 try:
@@ -956,25 +1370,20 @@ class FeatureCollectionResource(SpatialCollectionResource):
                 except TypeError:
                     geome = e
 
-                wkt += geome.wkt
+                wkbs.append(bytes(geome.wkb))
                 geom_type = geome.geom_type
 
-            wkt += ',' if i != len(queryset) - 1 else ')'
-
         if len(queryset):
             if isinstance(queryset[0], FeatureModel):
                 geom_type = queryset[0].get_spatial_object().geom_type
         else:
             geom_type = ''
 
-        config = {'wkt': wkt, 'type': geom_type}
-        style = self.get_style_file(request)
+        config = {'wkbs': wkbs, 'type': geom_type}
+        style_xml = self.get_style_xml(request)
 
-        if style is not None:
-            config.update({
-                'style': style,
-                'deleteStyle': True
-            })
+        if style_xml is not None:
+            config['style_xml'] = style_xml
 
         builder_png = BuilderPNG(config)
 
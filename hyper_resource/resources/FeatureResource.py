@@ -2,6 +2,7 @@ import pickle
 
 from hyper_resource.resources.AbstractResource import *
 from hyper_resource.resources.SpatialResource import SpatialResource
+from hyper_resource.geometry_sql import GeometryOperationCompiler, GeoJSON
 IMAGE_RESOURCE_TYPE = "Image"
 FEATURE_RESOURCE_TYPE = FeatureModel
 GEOBUF = 'Geobuf'
@@ -10,6 +11,8 @@ GEOBUF = 'Geobuf'
 class FeatureResource(SpatialResource):
     def __init__(self):
         super(FeatureResource, self).__init__()
+        # the database expression of the operation chain of the path being served, compiled once by basic_get
+        self.operation_expression = None
 
     def default_resource_type(self):
         return FEATURE_RESOURCE_TYPE
@@ -48,12 +51,16 @@ class FeatureResource(SpatialResource):
         # substitute any occurences of ':/' to '://' in 'attributes_functions_str'
         attributes_functions_str = re.sub(r':/+', '://', attributes_functions_str)
         arr_of_two_url_and_param = self.attributes_functions_splitted_by_url(attributes_functions_str)
-        resp = requests.get(arr_of_two_url_and_param[1])
-        if resp.status_code in[400, 401, 404]:
-            return RequiredObject({},CONTENT_TYPE_JSON, self.object_model,  resp.status_code)
-        if resp.status_code == 500:
-            return RequiredObject({},CONTENT_TYPE_JSON, self.object_model,resp.status_code)
-        j = resp.text
+        required_object = LocalIRIResolver().required_object_for(arr_of_two_url_and_param[1], '*/*')
+        if required_object is not None:
+            if required_object.status_code >= 400:
+                return RequiredObject({}, CONTENT_TYPE_JSON, self.object_model, required_object.status_code)
+            j = json.dumps(LocalIRIResolver().data_from(required_object))
+        else:
+            resp = self.http_get(arr_of_two_url_and_param[1])
+            if resp.status_code >= 400:
+                return RequiredObject({},CONTENT_TYPE_JSON, self.object_model,  resp.status_code)
+            j = resp.text
 
         if arr_of_two_url_and_param[2] is not None:
             attributes_functions_str = arr_of_two_url_and_param[0] + j + PARAM_SEPARATOR + arr_of_two_url_and_param[2]
@@ -87,6 +94,72 @@ class FeatureResource(SpatialResource):
     def get_object_from_transform_spatial_operation(self, attributes_functions_str):
         pass
 
+    def operation_chain_from_path(self, attributes_functions_str):
+        '''
+        Answers the path as a list of (geometry operation name, parameters), or None when some operation
+        is not a geometry operation or does not answer a geometry to the next one
+        '''
+        geometry_operations_dict = BaseOperationController().geometry_operations_dict()
+        att_funcs = self.path_segments(self.remove_geometry_attribute_from_path(attributes_functions_str))
+        operations = []
+        idx = 0
+
+        while idx < len(att_funcs):
+            if operations and not issubclass(geometry_operations_dict[operations[-1][0]].return_type, GEOSGeometry):
+                return None
+
+            type_called = geometry_operations_dict.get(att_funcs[idx])
+            if type_called is None:
+                return None
+
+            parameters = []
+            if type_called.has_parameters():
+                if idx + 1 == len(att_funcs):
+                    return None
+                parameters = att_funcs[idx + 1].split(PARAM_SEPARATOR)
+            operations.append((att_funcs[idx], parameters))
+            idx += 2 if type_called.has_parameters() else 1
+
+        return operations
+
+    def operation_expression_for_path(self, attributes_functions_str):
+        '''
+        Answers one database expression for the whole operation chain of the path, geometries are answered
+        as GeoJSON. Answers None when the chain has to be executed in python
+        '''
+        if attributes_functions_str is None or self.path_has_url(attributes_functions_str.lower()):
+            return None
+
+        operations = self.operation_chain_from_path(attributes_functions_str)
+        compiler = GeometryOperationCompiler()
+        if not operations or not compiler.database_supports(self.model_class().objects.db):
+            return None
+
+        expression = compiler.compile_chain(self.geometry_field_name(), operations)
+        if expression is None:
+            return None
+
+        self.name_of_last_operation_executed = operations[-1][0]
+        if issubclass(BaseOperationController().geometry_operations_dict()[operations[-1][0]].return_type, GEOSGeometry):
+            return GeoJSON(expression)
+        return expression
+
+    def get_object_from_operation_expression(self, operation_expression):
+        pk_name = self.pk_name()
+        a_value = self.model_class().objects.filter(**{pk_name: getattr(self.object_model, pk_name)})\
+            .annotate(operation_result=operation_expression).values_list('operation_result', flat=True).first()
+
+        if a_value is None:
+            return None
+        if isinstance(operation_expression, GeoJSON):
+            return json.loads(a_value)
+        return {self.name_of_last_operation_executed: a_value}
+
+    def get_object_deferring_geometry(self, a_dict):
+        # the geometry is computed by the database, loading it would only cost time and memory
+        dicti = self.dic_with_only_identitier_field(a_dict)
+        return get_object_or_404(self.model_class().objects.defer(self.geometry_field_name()), **dicti)
+
     def operation_name_method_dic(self):
         dict = super(FeatureResource, self).operation_name_method_dic()
         dict.update({
@@ -450,6 +523,8 @@ class FeatureResource(SpatialResource):
     def required_object_for_spatial_operation(self, request, attributes_functions_str):
         if self.path_has_url(attributes_functions_str.lower()):
             result = self.get_object_from_operation_attributes_functions_str_with_url(attributes_functions_str, request)
+        elif self.operation_expression is not None:
+            result = self.get_object_from_operation_expression(self.operation_expression)
         else:
             result = self.get_object_from_operation(self.remove_last_slash(attributes_functions_str))
 
@@ -471,23 +546,16 @@ class FeatureResource(SpatialResource):
         return self.join_feature_on_dict_response(join_operation)
 
     def join_feature_on_dict_response(self, join_operation):
-        if  join_operation.left_join_data['properties'][ join_operation.left_join_attr ] != join_operation.right_join_data[ join_operation.right_join_attr ]:
-            return None # the datas isn't 'joinable'
-
-        join_operation.left_join_data["properties"]["__joined__"] = []
-        join_operation.left_join_data["properties"]["__joined__"].append(join_operation.right_join_data)
-        return deepcopy(join_operation.left_join_data)
+        return self.join_feature_on_list_response(join_operation)
 
     def join_feature_on_list_response(self, join_operation):
-        join_operation.left_join_data['properties']['__joined__'] = []
-
-        for dicti in join_operation.right_join_data:
-            if join_operation.left_join_data['properties'][join_operation.left_join_attr] == dicti[join_operation.right_join_attr]:
-                join_operation.left_join_data['properties']['__joined__'].append(dicti)
+        # answers None when the datas isn't 'joinable'
+        left_value_of = lambda feature: feature['properties'][join_operation.left_join_attr]
 
-        if len(join_operation.left_join_data['properties']['__joined__']) == 0:
-            return None
-        return join_operation.left_join_data
+        for feature, dicts_to_join in join_operation.joined_pairs([join_operation.left_join_data], left_value_of):
+            feature['properties']['__joined__'] = dicts_to_join
+            return feature
+        return None
 
     def get_context_for_join_operation(self, request, attributes_functions_str):
         geometric_uri, join_attr, alphanumeric_uri = self.split_join_uri(request, attributes_functions_str)
@@ -587,9 +655,9 @@ class FeatureResource(SpatialResource):
 
         if self.path_has_url(attributes_functions_str):
             _ , url_external_resource, parameters_list = self.attributes_functions_splitted_by_url(attributes_functions_str)
-            response = requests.get(url_external_resource)
+            response = self.http_get(url_external_resource)
 
-            if response.status_code in[400, 401, 404, 500]:
+            if response.status_code >= 400:
                 return None #operation_params = GEOSGeometry(Point([0, 0]))
 
             operation_params = [response.text]
@@ -597,7 +665,7 @@ class FeatureResource(SpatialResource):
                 operation_params.append(parameters_list)
 
         else:
-            operation_params = self.remove_last_slash(attributes_functions_str).split("/")[1:]
+            operation_params = self.path_segments(attributes_functions_str)[1:]
         return type( self._execute_attribute_or_method(geom_val, operation_name, operation_params) )
 
     def return_type_for_generic_spatial_operation(self, attributes_functions_str):
@@ -628,20 +696,18 @@ class FeatureResource(SpatialResource):
         return serialized_object
 
     def get_operation_name_from_path(self, attributes_functions_str):
-        arr_att_funcs = self.remove_last_slash(attributes_functions_str).lower().split('/')
-
         # join operation has priority
         if self.path_has_join_operation(attributes_functions_str):
             return self.operation_controller.join_operation_name
         else:
-            first_part_name =  arr_att_funcs[0]
+            first_part_name = self.parsed_path(attributes_functions_str).lower_segments[0]
 
         if first_part_name not in self.operation_controller.operations_dict():
             return None
         return first_part_name
 
     def remove_geometry_attribute_from_path(self, attributes_functions_str):
-        attrs_funcs_arr = remove_last_slash(attributes_functions_str).split("/")
+        attrs_funcs_arr = self.path_segments(attributes_functions_str)
         if attrs_funcs_arr[0] == self.geometry_field_name():
             return "/".join(attrs_funcs_arr[1:])
 
@@ -658,12 +724,16 @@ class FeatureResource(SpatialResource):
         return method_to_execute(*[request, attributes_functions_str])
 
     def basic_get(self, request, *args, **kwargs):
-        self.object_model = self.get_object(kwargs)
+        attributes_functions_str = kwargs.get(self.attributes_functions_name_template())
+
+        self.operation_expression = self.operation_expression_for_path(attributes_functions_str)
+        if self.is_image_content_type(request) or self.operation_expression is None:
+            self.object_model = self.get_object(kwargs)
+        else:
+            self.object_model = self.get_object_deferring_geometry(kwargs)
         self.current_object_state = self.object_model
         self.set_basic_context_resource(request)
 
-        attributes_functions_str = kwargs.get(self.attributes_functions_name_template())
-
         if self.is_simple_path(attributes_functions_str):
             return self.required_object_for_simple_path(request)
 
@@ -28,23 +28,15 @@ class NonSpatialResource(AbstractResource):
         return self.join_dict_on_non_spatial_resource(join_operation)
 
     def join_dict_on_non_spatial_resource(self, join_operation):
-        if join_operation.left_join_data[ join_operation.left_join_attr ] != join_operation.right_join_data[ join_operation.right_join_attr ]:
-            return None
-
-        join_operation.left_join_data["__joined__"] = []
-        join_operation.left_join_data["__joined__"].append( join_operation.right_join_data )
-        return join_operation.left_join_data
+        return self.join_dict_list_on_non_spatial_resource(join_operation)
 
     def join_dict_list_on_non_spatial_resource(self, join_operation):
-        join_operation.left_join_data['__joined__'] = []
+        left_value_of = lambda dicti: dicti[join_operation.left_join_attr]
 
-        for dicti in join_operation.right_join_data:
-            if join_operation.left_join_data[ join_operation.left_join_attr ] == dicti[ join_operation.right_join_attr ]:
-                join_operation.left_join_data['__joined__'].append(dicti)
-
-        if len(join_operation.left_join_data['__joined__']) == 0:
-            return None
-        return join_operation.left_join_data
+        for dicti, dicts_to_join in join_operation.joined_pairs([join_operation.left_join_data], left_value_of):
+            dicti['__joined__'] = dicts_to_join
+            return dicti
+        return None
 
     '''
     def join_non_spatial_on_feature(self, join_operation):
@@ -15,7 +15,7 @@ class ProxiedNonSpatialResource(NonSpatialResource):
         self.object_model = object
 
     def required_object_for_proxied_get(self, object, request, attributes_functions_str):
-        attrs_funcs_arr = self.remove_last_slash(attributes_functions_str).split("/")[1:]
+        attrs_funcs_arr = self.path_segments(attributes_functions_str)[1:]
         result = self._execute_attribute_or_method(object, attrs_funcs_arr[0], attrs_funcs_arr[1:])
 
     def content_type_for_operation(self, request, attributes_functions_str):
@@ -25,7 +25,7 @@ class ProxiedNonSpatialResource(NonSpatialResource):
         if self.path_has_url(attributes_functions_str):
             attrs_fucs_arr = self.attribute_functions_str_with_url_splitted_by_slash(attributes_functions_str)
         else:
-            attrs_fucs_arr = self.remove_last_slash(attributes_functions_str).split("/")
+            attrs_fucs_arr = self.path_segments(attributes_functions_str)
 
         # todo: use self.object_model or a simple object (with CharFields setted to "" and IntegerFields setted to 1)
         result = self.get_operation_return_type(self.object_model, attrs_fucs_arr[0], attrs_fucs_arr[1:])
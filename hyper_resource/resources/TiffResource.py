@@ -1,8 +1,21 @@
+import math
+
 from django.contrib.gis.gdal import GDALRaster
+from django.contrib.gis.geos import Polygon
 
 from hyper_resource.resources.AbstractResource import *
 from hyper_resource.resources.BaseModel import BaseModel
 from hyper_resource.resources.RasterResource import RasterResource
+from hyper_resource.tiles import tile_bounds, tile_is_valid, WEB_MERCATOR_SRID
+
+# the largest side, in pixels, of a window or bbox answered
+RASTER_WINDOW_MAX_SIZE = 4096
+RASTER_MAX_OVERVIEW_LEVEL = 16
+RASTER_TILE_SIZE = 256
+# the source pixels around a tile are read too, the resampling kernel needs them
+RASTER_TILE_BUFFER_PIXELS = 2
+# PostGIS algorithm used to reduce windows and to warp tiles
+RASTER_RESAMPLING_ALGORITHM = 'Bilinear'
 
 
 class TiffResource(RasterResource):
@@ -127,7 +140,10 @@ class TiffResource(RasterResource):
             self.operation_controller.transform_operation_name: self.required_object_for_transform_operation,
             self.operation_controller.vsi_buffer_operation_name: self.required_object_for_spatial_operation,
             self.operation_controller.warp_operation_name: self.required_object_for_spatial_operation,
-            self.operation_controller.width_operation_name: self.required_object_for_spatial_operation
+            self.operation_controller.width_operation_name: self.required_object_for_spatial_operation,
+            self.operation_controller.window_operation_name: self.required_object_for_window_operation,
+            self.operation_controller.bbox_operation_name: self.required_object_for_bbox_operation,
+            self.operation_controller.tiles_operation_name: self.required_object_for_tiles_operation
         })
         return dict
 
@@ -154,6 +170,9 @@ class TiffResource(RasterResource):
             self.operation_controller.vsi_buffer_operation_name:    self.required_context_for_operation,
             self.operation_controller.warp_operation_name:          self.required_context_for_operation,
             self.operation_controller.width_operation_name:         self.required_context_for_operation,
+            self.operation_controller.window_operation_name:        self.required_context_for_operation,
+            self.operation_controller.bbox_operation_name:          self.required_context_for_operation,
+            self.operation_controller.tiles_operation_name:         self.required_context_for_operation,
         })
         return dict
 
@@ -179,7 +198,10 @@ class TiffResource(RasterResource):
             self.operation_controller.transform_operation_name:      self.return_type_for_transform_operation,
             self.operation_controller.vsi_buffer_operation_name:     self.return_type_for_vsi_buffer_operation,
             self.operation_controller.warp_operation_name:           self.return_type_for_warp_operation,
-            self.operation_controller.width_operation_name:          self.return_type_for_width_operation
+            self.operation_controller.width_operation_name:          self.return_type_for_width_operation,
+            self.operation_controller.window_operation_name:         self.return_type_for_window_operation,
+            self.operation_controller.bbox_operation_name:           self.return_type_for_bbox_operation,
+            self.operation_controller.tiles_operation_name:          self.return_type_for_tiles_operation
         })
         return dicti
 
@@ -206,6 +228,9 @@ class TiffResource(RasterResource):
             self.operation_controller.vsi_buffer_operation_name:    self.resource_type_by_operation,
             self.operation_controller.warp_operation_name:          self.resource_type_by_operation,
             self.operation_controller.width_operation_name:         self.resource_type_by_operation,
+            self.operation_controller.window_operation_name:        self.resource_type_by_operation,
+            self.operation_controller.bbox_operation_name:          self.resource_type_by_operation,
+            self.operation_controller.tiles_operation_name:         self.resource_type_by_operation,
         })
         return dicti
 
@@ -220,8 +245,191 @@ class TiffResource(RasterResource):
             return self.response_request_attributes_functions_str_with_url(attributes_functions_str, request)
         return self.get_object_from_operation( request, self.remove_last_slash(attributes_functions_str) )
 
+    def windowed_operation_names(self):
+        return [self.operation_controller.window_operation_name, self.operation_controller.bbox_operation_name,
+                self.operation_controller.tiles_operation_name]
+
+    def is_windowed_operation(self, attributes_functions_str):
+        # these operations read only a part of the raster, it is never loaded as a whole
+        if self.is_simple_path(attributes_functions_str):
+            return False
+        return self.path_segments(attributes_functions_str)[0].lower() in self.windowed_operation_names()
+
+    def window_operation_parameters(self, attributes_functions_str):
+        '''
+        window/<column>&<row>&<width>&<height>[/<overview level>] answers (column, row, width, height, overview level),
+        the window is in pixels of the raster and each overview level halves its resolution
+        '''
+        parameters = self.path_segments(attributes_functions_str)[1:]
+        if len(parameters) == 0 or len(parameters) > 2:
+            raise ValueError('"' + attributes_functions_str + '" must have a pixel window and may have an overview level')
+
+        column, row, width, height = [int(value) for value in parameters[0].split(PARAM_SEPARATOR)]
+        overview_level = int(parameters[1]) if len(parameters) > 1 else 0
+        return column, row, width, height, overview_level
+
+    def window_operation_sintax_is_ok(self, attributes_functions_str):
+        try:
+            column, row, width, height, overview_level = self.window_operation_parameters(attributes_functions_str)
+        except ValueError:
+            return False
+        return column >= 0 and row >= 0 and width > 0 and height > 0 and 0 <= overview_level <= RASTER_MAX_OVERVIEW_LEVEL and \
+               self.overview_size(width, overview_level) <= RASTER_WINDOW_MAX_SIZE and \
+               self.overview_size(height, overview_level) <= RASTER_WINDOW_MAX_SIZE
+
+    def overview_size(self, size, overview_level):
+        return int(math.ceil(size / 2.0 ** overview_level))
+
+    def bbox_operation_parameters(self, attributes_functions_str):
+        '''
+        bbox/<minx>,<miny>,<maxx>,<maxy>[/<width>&<height>[/<srid>]] answers (bbox, size, srid),
+        the bbox is in the srid coordinates (the raster srid by default), without a size the raster resolution is kept
+        '''
+        parameters = self.path_segments(attributes_functions_str)[1:]
+        if len(parameters) == 0 or len(parameters) > 3:
+            raise ValueError('"' + attributes_functions_str + '" must have a bbox and may have a size and a srid')
+
+        bbox = tuple(float(coordinate) for coordinate in parameters[0].split(','))
+        size = None
+        if len(parameters) > 1:
+            width, height = [int(value) for value in parameters[1].split(PARAM_SEPARATOR)]
+            size = (width, height)
+        srid = int(parameters[2]) if len(parameters) > 2 else None
+        return bbox, size, srid
+
+    def bbox_operation_sintax_is_ok(self, attributes_functions_str):
+        try:
+            bbox, size, srid = self.bbox_operation_parameters(attributes_functions_str)
+        except ValueError:
+            return False
+        if len(bbox) != 4 or bbox[0] >= bbox[2] or bbox[1] >= bbox[3]:
+            return False
+        return size is None or (0 < size[0] <= RASTER_WINDOW_MAX_SIZE and 0 < size[1] <= RASTER_WINDOW_MAX_SIZE)
+
+    def tiles_operation_parameters(self, attributes_functions_str):
+        z, x, y = [int(param) for param in self.path_segments(attributes_functions_str)[1:]]
+        return z, x, y
+
+    def tiles_operation_sintax_is_ok(self, attributes_functions_str):
+        try:
+            z, x, y = self.tiles_operation_parameters(attributes_functions_str)
+        except ValueError:
+            return False
+        return tile_is_valid(z, x, y)
+
+    def pixel_to_world(self, metadata, column, row):
+        return (metadata.upper_left_x + column * metadata.scale_x + row * metadata.skew_x,
+                metadata.upper_left_y + column * metadata.skew_y + row * metadata.scale_y)
+
+    def pixel_window_bbox(self, metadata, column, row, width, height, inset=0.0):
+        corners = [self.pixel_to_world(metadata, a_column, a_row) for a_column in (column + inset, column + width - inset)
+                   for a_row in (row + inset, row + height - inset)]
+        xs, ys = zip(*corners)
+        return min(xs), min(ys), max(xs), max(ys)
+
+    def raster_extent(self, metadata):
+        extent = Polygon.from_bbox(self.pixel_window_bbox(metadata, 0, 0, metadata.width, metadata.height))
+        extent.srid = metadata.srid
+        return extent
+
+    def required_object_for_raster_not_found(self):
+        return RequiredObject({}, CONTENT_TYPE_JSON, self.object_model, 404)
+
+    def required_object_for_clip(self, bbox, metadata, size=None):
+        '''
+        Answers the pixels of the raster inside 'bbox' (in the raster srid), resampled to 'size' (width, height) if any
+        '''
+        raster_expression = "ST_Clip({raster}, ST_MakeEnvelope(%s, %s, %s, %s, %s), true)"
+        params = list(bbox) + [metadata.srid]
+        if size is not None:
+            raster_expression = "ST_Resize(" + raster_expression + ", %s, %s, %s)"
+            params += [size[0], size[1], RASTER_RESAMPLING_ALGORITHM]
+
+        raster_bytes = BaseModel().get_raster_bytes(self, self.object_model.pk, raster_expression, params)
+        if raster_bytes is None:
+            return self.required_object_for_raster_not_found()
+        return RequiredObject(raster_bytes, CONTENT_TYPE_IMAGE_TIFF, self.object_model, 200)
+
+    def required_object_for_window_operation(self, request, attributes_functions_str):
+        if not self.window_operation_sintax_is_ok(attributes_functions_str):
+            return self.required_object_for_invalid_sintax(attributes_functions_str)
+
+        metadata = BaseModel().get_raster_metadata(self, self.object_model.pk)
+        if metadata is None:
+            return self.required_object_for_raster_not_found()
+
+        column, row, width, height, overview_level = self.window_operation_parameters(attributes_functions_str)
+        width, height = min(width, metadata.width - column), min(height, metadata.height - row)
+        if width <= 0 or height <= 0:
+            return self.required_object_for_invalid_sintax(attributes_functions_str)
+
+        # the envelope is inset a quarter of pixel, so the pixels around the window do not touch it
+        bbox = self.pixel_window_bbox(metadata, column, row, width, height, inset=0.25)
+        size = None
+        if overview_level > 0:
+            size = (self.overview_size(width, overview_level), self.overview_size(height, overview_level))
+        return self.required_object_for_clip(bbox, metadata, size)
+
+    def required_object_for_bbox_operation(self, request, attributes_functions_str):
+        if not self.bbox_operation_sintax_is_ok(attributes_functions_str):
+            return self.required_object_for_invalid_sintax(attributes_functions_str)
+
+        metadata = BaseModel().get_raster_metadata(self, self.object_model.pk)
+        if metadata is None:
+            return self.required_object_for_raster_not_found()
+
+        bbox, size, srid = self.bbox_operation_parameters(attributes_functions_str)
+        envelope = Polygon.from_bbox(bbox)
+        envelope.srid = srid or metadata.srid
+        if envelope.srid != metadata.srid:
+            envelope.transform(metadata.srid)
+        raster_extent = self.raster_extent(metadata)
+        if not envelope.intersects(raster_extent):
+            return self.required_object_for_raster_not_found()
+
+        if size is None:
+            xmin, ymin, xmax, ymax = envelope.intersection(raster_extent).extent
+            pixels = max((xmax - xmin) / abs(metadata.scale_x), (ymax - ymin) / abs(metadata.scale_y))
+            # a larger window must be asked with a size, it is reduced by the database
+            if pixels > RASTER_WINDOW_MAX_SIZE:
+                return self.required_object_for_invalid_sintax(attributes_functions_str)
+        return self.required_object_for_clip(envelope.extent, metadata, size)
+
+    def required_object_for_tiles_operation(self, request, attributes_functions_str):
+        if not self.tiles_operation_sintax_is_ok(attributes_functions_str):
+            return self.required_object_for_invalid_sintax(attributes_functions_str)
+
+        metadata = BaseModel().get_raster_metadata(self, self.object_model.pk)
+        if metadata is None:
+            return self.required_object_for_raster_not_found()
+
+        z, x, y = self.tiles_operation_parameters(attributes_functions_str)
+        xmin, ymin, xmax, ymax = tile_bounds(z, x, y)
+        resolution = (xmax - xmin) / RASTER_TILE_SIZE
+        margin = RASTER_TILE_BUFFER_PIXELS * resolution
+        envelope = Polygon.from_bbox((xmin - margin, ymin - margin, xmax + margin, ymax + margin))
+        envelope.srid = WEB_MERCATOR_SRID
+        envelope.transform(metadata.srid)
+        if not envelope.intersects(self.raster_extent(metadata)):
+            return self.required_object_for_raster_not_found()
+
+        # the database clips the source window and warps it to the tile grid, so a tile of a low zoom
+        # transfers the tile pixels and not the whole raster
+        raster_expression = "ST_Resample(ST_Clip({raster}, ST_MakeEnvelope(%s, %s, %s, %s, %s), true), " \
+                            "ST_MakeEmptyRaster(%s, %s, %s, %s, %s, %s, 0, 0, %s), %s)"
+        params = list(envelope.extent) + [metadata.srid, RASTER_TILE_SIZE, RASTER_TILE_SIZE, xmin, ymax, resolution, -resolution,
+                                          WEB_MERCATOR_SRID, RASTER_RESAMPLING_ALGORITHM]
+        raster_bytes = BaseModel().get_raster_bytes(self, self.object_model.pk, raster_expression, params)
+        if raster_bytes is None:
+            return self.required_object_for_raster_not_found()
+
+        # the resampled window is aligned to the tile grid, it is cropped (or padded with nodata) to the tile
+        tile = GDALRaster(raster_bytes).warp({'width': RASTER_TILE_SIZE, 'height': RASTER_TILE_SIZE, 'origin': [xmin, ymax],
+                                              'scale': [resolution, -resolution], 'srid': WEB_MERCATOR_SRID})
+        return RequiredObject(tile.vsi_buffer, CONTENT_TYPE_IMAGE_TIFF, self.object_model, 200)
+
     def get_object_from_transform_operation(self, request, attributes_functions_str):
-        srid = int( self.remove_last_slash(attributes_functions_str).split("/")[1] )
+        srid = int( self.path_segments(attributes_functions_str)[1] )
         return self.object_model.transform(srid)
 
     def get_object_from_operation(self, request, attributes_functions_str):
@@ -348,14 +556,21 @@ class TiffResource(RasterResource):
     def return_type_for_width_operation(self, attributes_functions_str):
         pass
 
+    def return_type_for_window_operation(self, attributes_functions_str):
+        return bytes
+
+    def return_type_for_bbox_operation(self, attributes_functions_str):
+        return bytes
+
+    def return_type_for_tiles_operation(self, attributes_functions_str):
+        return bytes
+
     def response_request_attributes_functions_str_with_url(self, attributes_functions_str, request=None):
         attributes_functions_str = re.sub(r':/+', '://', attributes_functions_str)
         arr_of_two_url_and_param = self.attributes_functions_splitted_by_url(attributes_functions_str)
-        resp = requests.get(arr_of_two_url_and_param[1])
-        if resp.status_code in[400, 401, 404]:
+        resp = self.http_get(arr_of_two_url_and_param[1])
+        if resp.status_code >= 400:
             return RequiredObject({},CONTENT_TYPE_JSON, self.object_model,  resp.status_code)
-        if resp.status_code == 500:
-            return RequiredObject({},CONTENT_TYPE_JSON, self.object_model,resp.status_code)
         j = resp.text
 
         if arr_of_two_url_and_param[2] is not None:
@@ -365,13 +580,16 @@ class TiffResource(RasterResource):
         return self.get_object_from_operation(request, attributes_functions_str)
 
     def basic_get(self, request, *args, **kwargs):
+        attributes_functions_str = kwargs.get(self.attributes_functions_name_template())
+
         self.object_model = self.model_class()()
-        baseModel = BaseModel()
-        self.object_model = baseModel.get_model_object_raster(self, kwargs)
+        if self.is_windowed_operation(attributes_functions_str):
+            # the operation reads its window from the database by the pk
+            setattr(self.object_model, self.pk_name(), kwargs['pk'])
+        else:
+            baseModel = BaseModel()
+            self.object_model = baseModel.get_model_object_raster(self, kwargs)
         self.set_basic_context_resource(request)
-        self.e_tag = str(hash(self.object_model))
-
-        attributes_functions_str = kwargs.get(self.attributes_functions_name_template())
 
         if self.is_simple_path(attributes_functions_str):
             return self.required_object_for_simple_path(request)
@@ -425,12 +643,25 @@ class TiffResource(RasterResource):
         resource_hash = resource_hash + "." + self.content_type_by_accept(request)
         return resource_hash
 
+    def response_for_tiff(self, request, required_object):
+        '''
+        A large tiff is written in the content addressed store and sent from its file. The final bytes of a raster
+        differ from a encoding to another, so the Etag is the digest of the body sent, not of the raster,
+        and the cached body is the one answered to the byte ranges requested later (If-Range)
+        '''
+        body = self.stored_body_for(required_object.representation_object)
+        entry = self.rendered_entry(self.body_e_tag(request, body), body, required_object.content_type)
+        entry = self.set_entry_in_cache(self.get_key_cache(request, a_content_type=required_object.content_type), entry)
+
+        response = self.response_for_rendered_entry(request, entry)
+        response['Content-Disposition'] = 'attachment; filename=' + self.default_file_name()
+        return response
+
     def response_base_get(self, request, *args, **kwargs):
         if self.resource_in_cache(request):
             return self.response_base_object_in_cache(request)
 
         req_obj = self.basic_get(request, *args, **kwargs)
-        self.inject_e_tag(request, req_obj.representation_object)
 
         if req_obj.status_code in [400, 401, 404]:
             return Response(req_obj.representation_object, status=req_obj.status_code)
@@ -438,10 +669,9 @@ class TiffResource(RasterResource):
             return Response({'Error ': 'The server can not process this request. Status:' + str(status)}, status=req_obj.status_code)
 
         if req_obj.content_type == CONTENT_TYPE_IMAGE_TIFF:
-            response = HttpResponse(req_obj.representation_object, req_obj.content_type)
-            self.set_etag_in_header(response, self.e_tag)
-            response['Content-Disposition'] = 'attachment; filename=' + self.default_file_name()
-            return response
+            return self.response_for_tiff(request, req_obj)
+
+        self.inject_e_tag(request, req_obj.representation_object)
 
         if self.is_binary_content_type(req_obj):
             response = self.response_base_get_binary(request, req_obj)
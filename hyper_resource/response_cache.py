@@ -0,0 +1,148 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+LOCAL_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# entries bigger than this would evict most of the local cache, they stay only in the shared cache
+LOCAL_CACHE_MAX_ENTRY_BYTES = 8 * 1024 * 1024
+COMPUTING_LOCK_KEY_PREFIX = 'computing:'
+COMPUTING_LOCK_SECONDS = 60
+COMPUTING_WAIT_SECONDS = 30
+COMPUTING_POLL_SECONDS = 0.05
+
+
+class LRUCache(object):
+    """
+    Bounded, thread safe, least recently used cache of bytes.
+    The bound is the sum of the bytes of the values, not the number of entries
+    """
+    def __init__(self, max_bytes=LOCAL_CACHE_MAX_BYTES, max_entry_bytes=LOCAL_CACHE_MAX_ENTRY_BYTES):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.current_bytes = 0
+        self.entries = OrderedDict() # key => (value, expires_at)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+
+            if entry[1] is not None and entry[1] < time.time():
+                self._remove(key)
+                return None
+
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, seconds=None):
+        if len(value) > self.max_entry_bytes:
+            self.delete(key)
+            return
+
+        expires_at = None if seconds is None else time.time() + seconds
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = (value, expires_at)
+            self.current_bytes += len(value)
+
+            while self.current_bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+
+    def delete(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= len(entry[0])
+
+
+class TieredCache(object):
+    """
+    Two levels cache: a per process LRUCache in front of the Django cache shared by every worker (Redis).
+    Values are pickled once, when they are set, and kept as bytes in both levels
+    """
+    _instance = None
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(TieredCache, cls).__new__(cls, *args, **kwargs)
+            cls._instance.initialize()
+        return cls._instance
+
+    def initialize(self):
+        self.local_cache = LRUCache(getattr(settings, 'HYPER_RESOURCE_LOCAL_CACHE_MAX_BYTES', LOCAL_CACHE_MAX_BYTES))
+        self.locks_by_key = {}
+        self.locks_lock = threading.Lock()
+
+    def get(self, key):
+        value_as_bytes = self.local_cache.get(key)
+
+        if value_as_bytes is None:
+            value_as_bytes = cache.get(key)
+            if value_as_bytes is None:
+                return None
+            # the shared cache does not tell the remaining time, the local copy lives at most the default timeout
+            self.local_cache.set(key, value_as_bytes, cache.default_timeout)
+
+        return pickle.loads(value_as_bytes)
+
+    def set(self, key, value, seconds=None):
+        value_as_bytes = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        cache.set(key, value_as_bytes, seconds)
+        self.local_cache.set(key, value_as_bytes, seconds)
+
+    def delete(self, key):
+        cache.delete(key)
+        self.local_cache.delete(key)
+
+    def _lock_for(self, key):
+        with self.locks_lock:
+            if key not in self.locks_by_key:
+                self.locks_by_key[key] = [threading.Lock(), 0]
+            lock_and_waiters = self.locks_by_key[key]
+            lock_and_waiters[1] += 1
+            return lock_and_waiters
+
+    def _release_lock_for(self, key, lock_and_waiters):
+        lock_and_waiters[0].release()
+        with self.locks_lock:
+            lock_and_waiters[1] -= 1
+            if lock_and_waiters[1] == 0:
+                self.locks_by_key.pop(key, None)
+
+    @contextmanager
+    def computing(self, key):
+        '''
+        Coalesces concurrent misses of 'key': only one thread of the process and, as far as possible,
+        only one process computes the value, the others wait and should look for it in the cache again
+        '''
+        lock_and_waiters = self._lock_for(key)
+        lock_and_waiters[0].acquire()
+        shared_lock_key = COMPUTING_LOCK_KEY_PREFIX + key
+        has_shared_lock = False
+
+        try:
+            waiting_until = time.time() + COMPUTING_WAIT_SECONDS
+            # cache.add is atomic, the worker that adds the key is the one that computes
+            has_shared_lock = cache.add(shared_lock_key, 1, COMPUTING_LOCK_SECONDS)
+            while not has_shared_lock and time.time() < waiting_until and cache.get(key) is None:
+                time.sleep(COMPUTING_POLL_SECONDS)
+                has_shared_lock = cache.add(shared_lock_key, 1, COMPUTING_LOCK_SECONDS)
+            yield
+        finally:
+            if has_shared_lock:
+                cache.delete(shared_lock_key)
+            self._release_lock_for(key, lock_and_waiters)
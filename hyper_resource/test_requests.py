@@ -46,6 +46,9 @@ arr_get_for_collection = [
     RequestTest('api/bcim/aldeias-indigenas/within/' + SERVER + 'api/bcim/unidades-federativas/PA', 200),
     RequestTest('api/bcim/aldeias-indigenas/collect/nome&geom/buffer/0.5', 200),
     RequestTest('api/bcim/unidades-federativas/filter/sigla/in/RJ&ES/*collect/nome&geom/buffer/0.2', 200),
+    RequestTest('api/bcim/unidades-federativas/collect/nome&geom/convex_hull', 200),
+    RequestTest('api/bcim/unidades-federativas/collect/nome&geom/simplify/0.1', 200),
+    RequestTest('api/bcim/unidades-federativas/collect/nome&geom/transform/3857', 200),
     RequestTest('api/bcim/aldeias-indigenas/offset-limit/0&2/nome,geom,nomeabrev/*collect/nome&geom/buffer/0.5', 400), # WRONG SINTAX (SERVER EXECUTE ONLY api/bcim/aldeias-indigenas/offset-limit/0/2/ and ignore the rest - act as offset-limit operation)
     RequestTest('api/bcim/aldeias-indigenas/offset-limit/0&2/nome,geom/*collect/geom/buffer/0.5', 400), # WRONG SINTAX (SERVER EXECUTE ONLY api/bcim/aldeias-indigenas/offset-limit/0/2/ and ignore the rest - act as offset-limit operation)
 ]
@@ -54,6 +57,8 @@ arr_get_for_spatial_operations = [
     RequestTest("api/bcim/unidades-federativas/ES/area", 200),
     RequestTest("api/bcim/unidades-federativas/ES/boundary", 200),
     RequestTest("api/bcim/unidades-federativas/ES/buffer/0.2", 200),
+    RequestTest("api/bcim/unidades-federativas/ES/buffer/0.2/convex_hull/area", 200),
+    RequestTest("api/bcim/unidades-federativas/ES/transform/3857/centroid", 200),
     RequestTest("api/bcim/unidades-federativas/ES/centroid", 200),
     RequestTest("api/bcim/unidades-federativas/ES/contains/" + SERVER + "api/bcim/aldeias-indigenas/587/", 200),
     RequestTest("api/bcim/unidades-federativas/ES/convex_hull", 200),
@@ -139,6 +144,13 @@ arr_get_for_projection = [
     RequestTest("api/bcim/unidades-federativas/projection/geocodigo,sigla/offset-limit/0&2/", 200),
     RequestTest("api/bcim/unidades-federativas/projection/geocodigo,sigla/offset-limit/0&2/sigla,geocodigo/", 400),
     RequestTest("api/bcim/unidades-federativas/projection/geocodigo,sigla/offset-limit/0&2/nome,geocodigo,sigla/", 400), # WRONG SINTAX (SERVER EXECUTE ONLY api/bcim/unidades-federativas/projection/geocodigo,sigla/offset-limit/0/2/ and ignore the rest - act as offset-limit operation)
+    # cursor_limit
+    RequestTest("api/bcim/unidades-federativas/cursor-limit/2/", 200),
+    RequestTest("api/bcim/unidades-federativas/projection/geocodigo,sigla/cursor-limit/2/", 200),
+    RequestTest("api/bcim/unidades-federativas/cursor-limit/geom&2/", 400),
+    RequestTest("api/bcim/unidades-federativas/cursor-limit/not-a-cursor&2/", 400),
+    RequestTest("api/bcim/unidades-federativas/cursor-limit/2/collect/sigla&geom/buffer/0.8", 200),
+    RequestTest("api/bcim/unidades-federativas/filter/sigla/in/RJ&ES&MG/*cursor-limit/2", 200),
     # distinct
     RequestTest("controle-list/usuario-list/distinct/email", 200),
     RequestTest("controle-list/usuario-list/distinct/id&nome&email", 200),
@@ -153,6 +165,16 @@ arr_get_for_projection = [
     RequestTest("api/bcim/unidades-federativas/projection/sigla,geom/offset-limit/5&2/sigla,geom/collect/sigla&geom/buffer/0.8", 400), # projection list == offset_limit list == collect list # WRONG SINTAX (SERVER EXECUTE ONLY api/bcim/unidades-federativas/projection/sigla,geom/offset-limit/5/2/ and ignore the rest - act as offset-limit operation)
 
     #FeatureCollection operations
+    RequestTest("api/bcim/unidades-federativas/tiles/4/5/8", 200),
+    RequestTest("api/bcim/aldeias-indigenas/tiles/0/0/0", 200),
+    RequestTest("api/bcim/unidades-federativas/tiles/2/5/1", 400),
+    RequestTest("api/bcim/unidades-federativas/tiles/4/5", 400),
+    RequestTest("api/bcim/unidades-federativas/map-image/-48,-24,-39,-14", 200),
+    RequestTest("api/bcim/unidades-federativas/map-image/-5343335,-2753408,-4341550,-1574216/256&256/3857", 200),
+    RequestTest("api/bcim/unidades-federativas/map-image/-39,-24,-48,-14", 400),
+    RequestTest("api/bcim/unidades-federativas/map-image/-48,-24,-39,-14/10000&10000", 400),
+    RequestTest("api/bcim/unidades-federativas/png-tiles/4/5/8", 200),
+    RequestTest("api/bcim/unidades-federativas/png-tiles/2/5/1", 400),
     RequestTest("api/bcim/aldeias-indigenas/within/" + SERVER + "api/bcim/unidades-federativas/ES/", 200),
     RequestTest("api/bcim/aldeias-indigenas/projection/nome,nomeabrev/within/" + SERVER + "api/bcim/unidades-federativas/ES/", 200),
     RequestTest("api/bcim/unidades-federativas/contains/" + SERVER + "api/bcim/aldeias-indigenas/623", 200),
@@ -339,6 +361,11 @@ arr_get_for_tiff_resource = [
     RequestTest('raster/imagem-exemplo-tile1-list/61/vsi_buffer', 200),
     RequestTest('raster/imagem-exemplo-tile1-list/61/warp', 200),
     RequestTest('raster/imagem-exemplo-tile1-list/61/width', 200),
+    RequestTest('raster/imagem-exemplo-tile1-list/61/window/0&0&256&256', 200),
+    RequestTest('raster/imagem-exemplo-tile1-list/61/window/0&0&1024&1024/2', 200),
+    RequestTest('raster/imagem-exemplo-tile1-list/61/window/0&0&10000&10000', 400),
+    RequestTest('raster/imagem-exemplo-tile1-list/61/tiles/0/0/0', 200),
+    RequestTest('raster/imagem-exemplo-tile1-list/61/tiles/2/5/1', 400),
 ]
 
 arr_options_for_tiff_resource = [
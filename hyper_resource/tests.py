@@ -1,4 +1,12 @@
 import copy
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+import urllib.request
+from decimal import Decimal
+from unittest import mock
 
 import django
 import rest_framework
@@ -9,11 +17,21 @@ import rest_framework
 # from rest_framework import permissions
 
 from django.contrib.gis.geos import Point
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import FileResponse
 from django.test import TestCase
 # Create your tests here.
 from django.contrib.gis.db import models
 
-from hyper_resource.models import FeatureModel, FactoryComplexQuery
+from hyper_resource.models import FeatureModel, FactoryComplexQuery, JoinOperation, LEFT_JOIN
+from hyper_resource.resolver import LocalIRIResolver
+from hyper_resource.http_client import HttpClient
+from hyper_resource.response_cache import LRUCache, TieredCache
+from hyper_resource.tile_store import DiskTileStore
+from image_generator.img_generator import MapPool, MAP_POOL_MAX_IDLE_MAPS, MAP_POOL_MAX_STYLES
+from hyper_resource.blob_store import ContentAddressedStore, byte_range
+from hyper_resource.tiles import metatile_of, metatile_bounds, tile_bounds, tile_range
+from hyper_resource.path_parser import parse_path, path_segments_with_url
 from hyper_resource.contexts import *
 from hyper_resource.utils import *
 from hyper_resource.resources.AbstractResource import AbstractResource
@@ -30,8 +48,12 @@ from hyper_resource.resources.SpatialResource import SpatialResource
 from hyper_resource.resources.StyleResource import StyleResource
 from hyper_resource.resources.TiffCollectionResource import TiffCollectionResource
 from hyper_resource.resources.TiffResource import TiffResource
+from hyper_resource.resources.BaseModel import RasterMetadata
 from django.contrib.gis.geos import GEOSGeometry
-from django.test import SimpleTestCase
+from django.core.cache import cache
+from django.db.utils import OperationalError, ProgrammingError
+from django.test import SimpleTestCase, override_settings
+from django.utils.http import http_date
 from controle.views import UsuarioList, UsuarioDetail
 from controle.models import Usuario
 import json
@@ -56,6 +78,7 @@ TEXT_HTML_ACCEPT_HEADER = {"Accept": "text/html"}
 IMAGE_TIFF_ACCEPT_HEADER = {"Accept": "image/tiff"}
 GEOJSON_ACCEPT_HEADER = {"Accept": "application/geo+json"}
 APPLICATION_JSON_ACCEPT_HEADER = {"Accept": "application/json"}
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'hyper_resource_tests'}}
 
 
 class NoDbTestRunner(DiscoverRunner):
@@ -222,6 +245,853 @@ class FactoryComplexQueryTest(SimpleTestCase):
         self.fcq.q_object_serialized_by_filter_operation(attribute_operation_str, model_class)
 
 
+class JoinOperationTestCase(SimpleTestCase):
+    def setUp(self):
+        self.left_data = [{'geocodigo': 1, 'nome': 'a'}, {'geocodigo': 2, 'nome': 'b'}, {'geocodigo': 3, 'nome': 'c'}]
+        self.right_data = [{'cod': 2, 'valor': 10}, {'cod': 1, 'valor': 20}, {'cod': 2, 'valor': 30}, {'cod': 9, 'valor': 40}]
+        self.left_value_of = lambda element: element['geocodigo']
+
+    def aux_joined_values(self, join_operation, left_data):
+        return [(element['nome'], [dicti['valor'] for dicti in dicts]) for element, dicts in join_operation.joined_pairs(left_data, self.left_value_of)]
+
+    def test_inner_join_indexing_right_side(self):
+        join_operation = JoinOperation(self.left_data, 'geocodigo', 'cod', self.right_data[:2])
+        self.assertEquals(self.aux_joined_values(join_operation, self.left_data), [('a', [20]), ('b', [10])])
+
+    def test_inner_join_indexing_left_side(self):
+        join_operation = JoinOperation(self.left_data, 'geocodigo', 'cod', self.right_data)
+        self.assertEquals(self.aux_joined_values(join_operation, self.left_data), [('a', [20]), ('b', [10, 30])])
+
+    def test_left_join_keeps_elements_without_matches(self):
+        join_operation = JoinOperation(self.left_data, 'geocodigo', 'cod', self.right_data, join_type=LEFT_JOIN)
+        self.assertEquals(self.aux_joined_values(join_operation, self.left_data), [('a', [20]), ('b', [10, 30]), ('c', [])])
+
+    def test_join_does_not_copy_joined_dicts(self):
+        join_operation = JoinOperation(self.left_data, 'geocodigo', 'cod', self.right_data)
+        first_element, first_dicts = next(join_operation.joined_pairs(self.left_data, self.left_value_of))
+        self.assertIs(first_element, self.left_data[0])
+        self.assertIs(first_dicts[0], self.right_data[1])
+
+
+class LocalIRIResolverTestCase(SimpleTestCase):
+    def setUp(self):
+        self.resolver = LocalIRIResolver()
+        self.resolver.set_served_host('LocalHost:8000')
+
+    def tearDown(self):
+        self.resolver.set_served_host(None)
+
+    def test_iri_with_host_of_served_request_is_local(self):
+        self.assertTrue(self.resolver.is_local('http://localhost:8000/api/bcim/unidades-federativas/ES'))
+        self.assertFalse(self.resolver.is_local('http://172.30.10.86/api/bcim/unidades-federativas/ES'))
+        self.assertFalse(self.resolver.is_local('/api/bcim/unidades-federativas/ES'))
+
+    def test_external_iri_is_not_resolved_in_process(self):
+        self.assertIsNone(self.resolver.required_object_for('http://172.30.10.86/api/bcim/unidades-federativas/ES'))
+
+    def test_data_from_streamed_representation(self):
+        required_object = RequiredObject((chunk for chunk in ['[{"a": ', '1}]']), CONTENT_TYPE_JSON, None, 200)
+        self.assertEquals(self.resolver.data_from(required_object), [{'a': 1}])
+
+    def test_geometry_from_feature_collection_representation(self):
+        feature_collection = {'type': 'FeatureCollection', 'features': [
+            {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [1, 2]}, 'properties': {}},
+            {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [3, 4]}, 'properties': {}},
+        ]}
+        geometry = self.resolver.geometry_from(RequiredObject(feature_collection, CONTENT_TYPE_GEOJSON, None, 200))
+        self.assertEquals(geometry.geom_type, 'GeometryCollection')
+        self.assertEquals(geometry.num_geom, 2)
+
+    def test_data_from_objects_is_json_data(self):
+        representation = {'area': Decimal('1.5'), 'data_criacao': datetime.date(2017, 3, 1)}
+        data = self.resolver.data_from(RequiredObject(representation, CONTENT_TYPE_JSON, None, 200))
+        self.assertEquals(data, {'area': 1.5, 'data_criacao': '2017-03-01'})
+
+    def test_error_of_local_iri_is_raised(self):
+        iri = 'http://localhost:8000/api/bcim/unidades-federativas/XX'
+        with mock.patch.object(self.resolver, 'required_object_for', return_value=RequiredObject({}, CONTENT_TYPE_JSON, None, 404)):
+            with self.assertRaises(requests.HTTPError) as context:
+                FeatureCollectionResource().data_from_iri(iri)
+        self.assertEquals(context.exception.response.status_code, 404)
+        self.assertEquals(FeatureCollectionResource().required_object_for_iri_error(context.exception).status_code, 404)
+
+
+class PathParserTestCase(SimpleTestCase):
+    def test_parse_path_with_projection_and_collect_stage(self):
+        parsed_path = parse_path('projection/nome,sigla/filter/sigla/eq/ES/*collect/nome/upper/')
+        self.assertEquals(parsed_path.path, 'projection/nome,sigla/filter/sigla/eq/ES/*collect/nome/upper')
+        self.assertEquals(parsed_path.projection, ('nome', 'sigla'))
+        self.assertEquals(parsed_path.operation_name, 'filter')
+        self.assertEquals(parsed_path.stages[1], ('*collect', 'nome', 'upper'))
+        self.assertFalse(parsed_path.has_url)
+
+    def test_parse_path_is_cached(self):
+        self.assertIs(parse_path('filter/sigla/eq/ES'), parse_path('filter/sigla/eq/ES'))
+
+    def test_path_segments_keep_url_in_one_segment(self):
+        segments = path_segments_with_url('within/http://localhost:8000/api/bcim/unidades-federativas/ES/*')
+        self.assertEquals(segments, ('within', 'http://localhost:8000/api/bcim/unidades-federativas/ES'))
+
+
+class OperationControllerRegistryTestCase(SimpleTestCase):
+    def test_operations_dict_is_built_once_and_read_only(self):
+        operations_dict = BaseOperationController().dict_all_operation_dict()
+        self.assertIs(operations_dict, BaseOperationController().dict_all_operation_dict())
+        with self.assertRaises(TypeError):
+            operations_dict['buffer'] = None
+
+    def test_subclass_extends_operations_of_superclass(self):
+        expression_operators = SpatialCollectionOperationController().expression_operators_dict()
+        self.assertIn('eq', expression_operators)
+        self.assertIn('bbcontains', expression_operators)
+        self.assertNotIn('bbcontains', CollectionResourceOperationController().expression_operators_dict())
+
+    def test_operations_for_type_resolved_by_mro(self):
+        class Name(str):
+            pass
+        self.assertIs(BaseOperationController().operations_for_type(Name), BaseOperationController().string_operations_dict())
+        self.assertTrue(BaseOperationController().is_operation(Name('rio'), 'upper'))
+        self.assertIsNone(BaseOperationController().operations_for_type(dict))
+
+
+class ModelFieldIndexTestCase(SimpleTestCase):
+    def test_index_is_built_once_per_model(self):
+        self.assertIs(FieldIndexRegistry().index_for(Ponto), FieldIndexRegistry().index_for(Ponto))
+        self.assertIsNot(FieldIndexRegistry().index_for(Ponto), FieldIndexRegistry().index_for(Linha))
+
+    def test_indexed_field_metadata(self):
+        field_index = FieldIndexRegistry().index_for(Ponto)
+        self.assertEquals(field_index.field_names, ('id_objeto', 'geom'))
+        geom = field_index.indexed_field('geom')
+        self.assertEquals(geom.type, models.PointField)
+        self.assertEquals(geom.srid, 4326)
+        self.assertTrue(geom.is_indexed)
+        self.assertEquals(field_index.indexed_field('id_objeto').converter('10'), 10)
+        self.assertIsNone(field_index.indexed_field('nome'))
+
+    def test_filter_expression_uses_field_index(self):
+        self.assertTrue(FactoryComplexQuery().is_attribute('geom', Ponto))
+        self.assertFalse(FactoryComplexQuery().is_attribute('nome', Ponto))
+        self.assertEquals(QObjectFactory(Ponto, 'id_objeto', 'eq', '10').q_object(), Q(id_objeto=10))
+
+
+class FilterExpressionCompilerTestCase(SimpleTestCase):
+    def q_object_for(self, path):
+        return FactoryComplexQuery().q_object_for_filter_expression(None, Ponto, path.split('/'))
+
+    def test_and_has_precedence_over_or(self):
+        self.assertEquals(self.q_object_for('id_objeto/eq/1/or/id_objeto/eq/2/and/id_objeto/eq/3'),
+                          Q(id_objeto=1) | (Q(id_objeto=2) & Q(id_objeto=3)))
+
+    def test_parentheses_group_terms(self):
+        self.assertEquals(self.q_object_for('(/id_objeto/eq/1/or/id_objeto/eq/2/)/and/id_objeto/eq/3/'),
+                          (Q(id_objeto=1) | Q(id_objeto=2)) & Q(id_objeto=3))
+        with self.assertRaises(InvalidFilterExpression):
+            self.q_object_for('(/id_objeto/eq/1/or/id_objeto/eq/2')
+
+    def test_unbalanced_parentheses_are_answered_as_bad_request(self):
+        resource = AbstractCollectionResource()
+        resource.kwargs = {'attributes_functions': 'filter/(/id_objeto/eq/1'}
+        with mock.patch.object(resource, 'model_class', return_value=Ponto), \
+             mock.patch.object(resource, 'set_basic_context_resource'), \
+             mock.patch.object(resource, 'path_has_only_attributes', return_value=False), \
+             mock.patch.object(resource, 'is_complex_request', return_value=False), \
+             mock.patch.object(resource, 'get_required_object_from_method_to_execute', side_effect=InvalidFilterExpression('unbalanced')):
+            self.assertEquals(resource.basic_get(mock.Mock()).status_code, 400)
+
+    def test_isnull_terms(self):
+        self.assertEquals(self.q_object_for('geom/isnotnull/*and/id_objeto/eq/1'), Q(geom__isnull=False) & Q(id_objeto=1))
+
+    def test_plan_is_compiled_once(self):
+        plan = FilterExpressionCompiler().plan_for(Ponto, ['id_objeto', 'in', '1&2', ''])
+        self.assertIs(plan, FilterExpressionCompiler().plan_for(Ponto, ['id_objeto', 'in', '1&2']))
+        self.assertIs(plan.q_object(), plan.q_object())
+
+
+class HttpClientTestCase(SimpleTestCase):
+    def response_for(self, status_code, headers, content=b''):
+        response = requests.models.Response()
+        response.status_code = status_code
+        response.headers = requests.structures.CaseInsensitiveDict(headers)
+        response._content = content
+        return response
+
+    def test_freshness_from_cache_control(self):
+        self.assertIsNone(HttpClient().freshness_seconds(self.response_for(200, {'Cache-Control': 'no-store'})))
+        self.assertEquals(HttpClient().freshness_seconds(self.response_for(200, {'Cache-Control': 'no-cache'})), 0)
+        self.assertEquals(HttpClient().freshness_seconds(self.response_for(200, {'Cache-Control': 'public, max-age=60'})), 60)
+        self.assertEquals(HttpClient().freshness_seconds(self.response_for(200, {'Cache-Control': 'max-age=60, s-maxage=10'})), 10)
+
+    def test_stale_response_is_revalidated(self):
+        url = 'http://remote.host/limites/1'
+        session = mock.Mock()
+        session.get.side_effect = [
+            self.response_for(200, {'ETag': '"v1"', 'Content-Type': CONTENT_TYPE_JSON}, b'{"type": "Point", "coordinates": [1, 2]}'),
+            self.response_for(304, {'ETag': '"v1"'}),
+        ]
+        with mock.patch.object(HttpClient(), 'session', return_value=session):
+            HttpClient().get(url)
+            response = HttpClient().get(url)
+        self.assertEquals(session.get.call_args[1]['headers']['If-None-Match'], '"v1"')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.json()['coordinates'], [1, 2])
+
+    def test_cookies_are_not_kept(self):
+        cookie = requests.cookies.create_cookie('sessionid', 'abc', domain='remote.host')
+        request = urllib.request.Request('http://remote.host/limites/1')
+        self.assertFalse(HttpClient().session().cookies.get_policy().set_ok(cookie, request))
+
+    def test_timeout_is_answered_as_gateway_timeout(self):
+        resource = FeatureCollectionResource()
+        with mock.patch.object(HttpClient(), 'get', side_effect=requests.Timeout()):
+            self.assertEquals(resource.http_get('http://remote.host/limites/1').status_code, 504)
+            with self.assertRaises(requests.HTTPError) as context:
+                resource.data_from_iri('http://remote.host/limites/1')
+        self.assertEquals(context.exception.response.status_code, 504)
+
+
+class PngTileStoreTestCase(SimpleTestCase):
+    def setUp(self):
+        self.store = DiskTileStore()
+        self.root = self.store.root
+        self.store.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.store.root, ignore_errors=True)
+        self.store.root = self.root
+
+    def test_metatile_of_tile(self):
+        self.assertEquals(metatile_of(4, 13, 6), (8, 0, 8))
+        self.assertEquals(metatile_of(1, 1, 0), (0, 0, 2))
+        self.assertEquals(metatile_bounds(4, 8, 0, 8)[0], tile_bounds(4, 8, 0)[0])
+        self.assertEquals(metatile_bounds(4, 8, 0, 8)[2], tile_bounds(4, 15, 7)[2])
+
+    def test_invalidate_removes_only_the_overlapped_tiles(self):
+        for x, y in [(0, 0), (3, 3)]:
+            self.store.set('lim_unidade_federacao_a', 'default', 2, x, y, b'png')
+        xmin, _, _, ymax = tile_bounds(2, 0, 0)
+        feature_bounds = (xmin + 1, ymax - 2, xmin + 2, ymax - 1)
+        self.assertEquals(tile_range(2, feature_bounds), (0, 0, 0, 0))
+        self.store.invalidate('lim_unidade_federacao_a', feature_bounds)
+        self.assertIsNone(self.store.get('lim_unidade_federacao_a', 'default', 2, 0, 0))
+        self.assertEquals(self.store.get('lim_unidade_federacao_a', 'default', 2, 3, 3), b'png')
+
+    def resource_for_tiles(self):
+        resource = FeatureCollectionResource()
+        patches = [mock.patch.object(resource, 'table_name', return_value='lim_unidade_federacao_a'),
+                   mock.patch.object(resource, 'tile_layer_name', return_value='unidades-federativas'),
+                   mock.patch.object(resource, 'table_version', return_value=1)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        return resource
+
+    def test_tiles_are_stored_by_table_name(self):
+        resource = self.resource_for_tiles()
+        self.store.set('lim_unidade_federacao_a', 'default', 2, 0, 0, b'png')
+        with mock.patch.object(resource, 'get_style_xml', return_value=None), \
+             mock.patch.object(resource, 'tiles_operation_parameters', return_value=(2, 0, 0)), \
+             mock.patch.object(resource, 'render_metatile') as render_metatile:
+            required_object = resource.required_object_for_png_tiles_operation(mock.Mock(), 'png-tiles/2/0/0')
+        render_metatile.assert_not_called()
+        self.assertEquals(required_object.representation_object.path, self.store.tile_path('lim_unidade_federacao_a', 'default', 2, 0, 0))
+
+    def test_tiles_rendered_before_a_write_are_not_stored(self):
+        resource = self.resource_for_tiles()
+        tiles = {(0, 0): b'png', (1, 0): b'png'}
+        with mock.patch.object(resource, 'table_written_since_read', return_value=True):
+            resource.store_metatile('default', 2, 0, 0, tiles)
+        self.assertFalse(self.store.has_tiles_for('lim_unidade_federacao_a'))
+
+        # written while they were stored, after the invalidation of the write may have run
+        with mock.patch.object(resource, 'table_written_since_read', side_effect=[False, True]):
+            resource.store_metatile('default', 2, 0, 0, tiles)
+        self.assertIsNone(self.store.get('lim_unidade_federacao_a', 'default', 2, 0, 0))
+        self.assertIsNone(self.store.get('lim_unidade_federacao_a', 'default', 2, 1, 0))
+
+        with mock.patch.object(resource, 'table_written_since_read', return_value=False):
+            resource.store_metatile('default', 2, 0, 0, tiles)
+        self.assertEquals(self.store.get('lim_unidade_federacao_a', 'default', 2, 1, 0), b'png')
+
+    def test_stored_tile_is_sent_from_its_file(self):
+        self.assertIsNone(self.store.stored_body('lim_unidade_federacao_a', 'default', 2, 0, 0))
+        self.store.set('lim_unidade_federacao_a', 'default', 2, 0, 0, b'png')
+        tile = self.store.stored_body('lim_unidade_federacao_a', 'default', 2, 0, 0)
+        self.assertEquals(tile.sha256(), hashlib.sha256(b'png').hexdigest())
+
+        response = FeatureCollectionResource().response_for_binary_body(mock.Mock(META={}), tile, CONTENT_TYPE_IMAGE_PNG, '"v1"')
+        self.assertIsInstance(response, FileResponse)
+        self.assertEquals(b''.join(response.streaming_content), b'png')
+        response.close()
+
+
+class TiffWindowTestCase(SimpleTestCase):
+    def setUp(self):
+        self.tiff_resource = TiffResource()
+        self.metadata = RasterMetadata(upper_left_x=-44.0, upper_left_y=-22.0, width=1000, height=500, scale_x=0.001,
+                                       scale_y=-0.001, skew_x=0.0, skew_y=0.0, srid=4326, num_bands=3)
+
+    def test_window_sintax(self):
+        self.assertTrue(self.tiff_resource.window_operation_sintax_is_ok('window/0&0&256&256'))
+        self.assertTrue(self.tiff_resource.window_operation_sintax_is_ok('window/0&0&8192&8192/1'))
+        self.assertFalse(self.tiff_resource.window_operation_sintax_is_ok('window/0&0&8192&8192'))
+        self.assertFalse(self.tiff_resource.window_operation_sintax_is_ok('window/0&0&256'))
+        self.assertFalse(self.tiff_resource.bbox_operation_sintax_is_ok('bbox/-43,-22,-44,-21'))
+
+    def test_pixel_window_bbox(self):
+        bbox = self.tiff_resource.pixel_window_bbox(self.metadata, 100, 50, 200, 100)
+        for coordinate, expected in zip(bbox, (-43.9, -22.15, -43.7, -22.05)):
+            self.assertAlmostEqual(coordinate, expected)
+        self.assertEquals(self.tiff_resource.raster_extent(self.metadata).extent, (-44.0, -22.5, -43.0, -22.0))
+
+
+class ByteRangeTestCase(SimpleTestCase):
+    def setUp(self):
+        self.store = ContentAddressedStore()
+        self.root = self.store.root
+        self.store.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.store.root, ignore_errors=True)
+        self.store.root = self.root
+
+    def test_byte_range(self):
+        self.assertIsNone(byte_range(None, 100))
+        self.assertEquals(byte_range('bytes=0-9', 100), (0, 9))
+        self.assertEquals(byte_range('bytes=90-', 100), (90, 99))
+        self.assertEquals(byte_range('bytes=-10', 100), (90, 99))
+        self.assertEquals(byte_range('bytes=50-500', 100), (50, 99))
+        self.assertIsNone(byte_range('bytes=0-1,5-9', 100))
+        self.assertRaises(ValueError, byte_range, 'bytes=100-', 100)
+
+    def test_partial_content_of_stored_body(self):
+        body = self.store.put(b'0123456789')
+        self.assertEquals(self.store.put(b'0123456789').path, body.path)
+
+        request = mock.Mock(META={HTTP_RANGE: 'bytes=2-4'})
+        response = FeatureCollectionResource().response_for_binary_body(request, body, CONTENT_TYPE_OCTET_STREAM, '"v1"')
+        self.assertEquals(response.status_code, 206)
+        self.assertEquals(response['Content-Range'], 'bytes 2-4/10')
+        self.assertEquals(b''.join(response.streaming_content), b'234')
+        response.close()
+
+        request = mock.Mock(META={HTTP_RANGE: 'bytes=2-4', HTTP_IF_RANGE: '"v0"'})
+        response = FeatureCollectionResource().response_for_binary_body(request, b'0123456789', CONTENT_TYPE_OCTET_STREAM, '"v1"')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.content, b'0123456789')
+
+    def response_for_tiff(self, raster_bytes, meta):
+        resource = TiffResource()
+        resource.request = mock.Mock()
+        with mock.patch.object(resource, 'cache_enabled', return_value=False), \
+             mock.patch.object(resource, 'content_type_by_accept', return_value=CONTENT_TYPE_IMAGE_TIFF), \
+             mock.patch.object(resource, 'default_file_name', return_value='raster.tiff'):
+            return resource.response_for_tiff(mock.Mock(META=meta), RequiredObject(raster_bytes, CONTENT_TYPE_IMAGE_TIFF, None, 200))
+
+    def test_tiff_is_sent_from_the_store_with_the_digest_of_its_bytes(self):
+        min_bytes, self.store.min_bytes = self.store.min_bytes, 4
+        self.addCleanup(setattr, self.store, 'min_bytes', min_bytes)
+
+        response = self.response_for_tiff(b'0123456789', {})
+        self.assertIsInstance(response, FileResponse)
+        self.assertEquals(b''.join(response.streaming_content), b'0123456789')
+        response.close()
+        e_tag = response[ETAG]
+        self.assertTrue(e_tag.startswith(hashlib.sha256(b'0123456789').hexdigest()))
+
+        # the same raster encoded with other final bytes is another body, its ranges can not be joined to the first one's
+        response = self.response_for_tiff(b'0123456780', {HTTP_RANGE: 'bytes=2-4', HTTP_IF_RANGE: e_tag})
+        self.assertEquals(response.status_code, 200)
+        self.assertNotEquals(response[ETAG], e_tag)
+        response.close()
+
+        response = self.response_for_tiff(b'0123456789', {HTTP_RANGE: 'bytes=2-4', HTTP_IF_RANGE: e_tag})
+        self.assertEquals(response.status_code, 206)
+        self.assertEquals(b''.join(response.streaming_content), b'234')
+        response.close()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TableVersionTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_version_is_stable_until_bumped(self):
+        version = TableVersion().version_of('lim_unidade_federacao_a')
+        self.assertEquals(TableVersion().version_of('lim_unidade_federacao_a'), version)
+        self.assertEquals(TableVersion().bump('lim_unidade_federacao_a', 33), version + 1)
+        self.assertEquals(TableVersion().version_of('lim_unidade_federacao_a'), version + 1)
+
+    def test_bump_changes_row_and_last_modified(self):
+        row_tag = TableVersion().row_key_for('lim_unidade_federacao_a', 33)
+        row_version = TableVersion().tag_versions([row_tag])[row_tag]
+        TableVersion().bump('lim_unidade_federacao_a', 33)
+        self.assertEquals(TableVersion().tag_versions([row_tag])[row_tag], row_version + 1)
+        self.assertIsInstance(TableVersion().last_modified_of('lim_unidade_federacao_a'), int)
+
+    def test_bump_of_a_table_never_read(self):
+        self.assertIsInstance(TableVersion().bump('lim_unidade_federacao_a'), int)
+
+    def test_versioned_e_tag_requires_a_shared_cache(self):
+        resource = FeatureResource()
+        resource.serializer_class = mock.Mock()
+        request = mock.Mock()
+        request.get_full_path.return_value = '/api/bcim/unidades-federativas/ES'
+        self.assertFalse(resource.versioned_e_tag_enabled(request))
+        with mock.patch.object(resource, 'cache_is_shared', return_value=True):
+            self.assertTrue(resource.versioned_e_tag_enabled(request))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TaggedCacheEntryTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        TieredCache().local_cache.clear()
+
+    def cached_entry_of_row(self, key, pk):
+        resource = FeatureResource()
+        resource.request = mock.Mock()
+        resource.object_model = mock.Mock(pk=pk)
+        entry = ('1-abc', CONTENT_TYPE_JSON, b'{}', None)
+        with mock.patch.object(resource, 'table_name', return_value='lim_unidade_federacao_a'), \
+             mock.patch.object(resource, 'cache_enabled', return_value=True), \
+             mock.patch.object(resource, 'versioned_e_tag_enabled', return_value=True):
+            resource.set_entry_in_cache(key, entry)
+        return resource
+
+    def test_write_purges_only_the_entries_of_its_row(self):
+        resource = self.cached_entry_of_row('ES', 32)
+        self.cached_entry_of_row('RJ', 33)
+        TableVersion().bump('lim_unidade_federacao_a', 33)
+        self.assertEquals(resource.valid_entry_in_cache('ES'), ('1-abc', CONTENT_TYPE_JSON, b'{}', None))
+        self.assertIsNone(resource.valid_entry_in_cache('RJ'))
+
+    def test_write_during_the_request_is_not_cached(self):
+        resource = FeatureResource()
+        resource.request = mock.Mock()
+        resource.object_model = mock.Mock(pk=33)
+        with mock.patch.object(resource, 'table_name', return_value='lim_unidade_federacao_a'), \
+             mock.patch.object(resource, 'cache_enabled', return_value=True), \
+             mock.patch.object(resource, 'versioned_e_tag_enabled', return_value=True):
+            resource.table_version()
+            TableVersion().bump('lim_unidade_federacao_a', 33)
+            resource.set_entry_in_cache('RJ', ('1-abc', CONTENT_TYPE_JSON, b'{}', None))
+        self.assertIsNone(TieredCache().get('RJ'))
+
+    def test_bump_of_a_tag_never_read(self):
+        tag = TableVersion().row_key_for('lim_unidade_federacao_a', 34)
+        version = TableVersion().bump_tag(tag)
+        self.assertEquals(TableVersion().tag_versions([tag])[tag], version)
+        self.assertEquals(TableVersion().bump_tag(tag), version + 1)
+
+
+class RenderedEntryTestCase(SimpleTestCase):
+    def setUp(self):
+        self.resource = FeatureCollectionResource()
+        self.body = b'{"type": "FeatureCollection", "features": []}' * 100
+
+    def test_large_text_body_is_gzipped(self):
+        e_tag, a_content_type, body, gzipped_body = self.resource.rendered_entry('1-abc', self.body, CONTENT_TYPE_GEOJSON)
+        self.assertEquals(gzip.decompress(gzipped_body), self.body)
+        self.assertIsNone(self.resource.rendered_entry('1-abc', b'{}', CONTENT_TYPE_GEOJSON)[3])
+        self.assertIsNone(self.resource.rendered_entry('1-abc', self.body, CONTENT_TYPE_IMAGE_PNG)[3])
+
+    def test_accept_gzip(self):
+        self.assertTrue(self.resource.accept_gzip(mock.Mock(META={HTTP_ACCEPT_ENCODING: 'gzip, deflate, br'})))
+        self.assertTrue(self.resource.accept_gzip(mock.Mock(META={HTTP_ACCEPT_ENCODING: 'br;q=1.0, *;q=0.5'})))
+        self.assertFalse(self.resource.accept_gzip(mock.Mock(META={HTTP_ACCEPT_ENCODING: 'gzip;q=0, deflate'})))
+        self.assertFalse(self.resource.accept_gzip(mock.Mock(META={HTTP_ACCEPT_ENCODING: 'br, *;q=0'})))
+        self.assertFalse(self.resource.accept_gzip(mock.Mock(META={})))
+
+    def test_response_varies_by_accept_encoding(self):
+        entry = self.resource.rendered_entry('1-abc', self.body, CONTENT_TYPE_GEOJSON)
+
+        response = self.resource.response_for_rendered_entry(mock.Mock(META={HTTP_ACCEPT_ENCODING: 'gzip'}), entry)
+        self.assertEquals(response['Content-Encoding'], 'gzip')
+        self.assertEquals(gzip.decompress(response.content), self.body)
+        self.assertEquals(response['Vary'], 'Accept-Encoding')
+
+        response = self.resource.response_for_rendered_entry(mock.Mock(META={HTTP_ACCEPT_ENCODING: 'gzip;q=0'}), entry)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEquals(response.content, self.body)
+        self.assertEquals(response['Vary'], 'Accept-Encoding')
+
+
+class OperationExpressionTestCase(SimpleTestCase):
+    def test_expression_is_compiled_once(self):
+        resource = FeatureResource()
+        request = mock.Mock(META={HTTP_ACCEPT: CONTENT_TYPE_JSON})
+        serve_operation = lambda request, attributes_functions_str: resource.required_object_for_spatial_operation(request, attributes_functions_str)
+        with mock.patch.object(resource, 'operation_expression_for_path', return_value='expression') as operation_expression_for_path, \
+             mock.patch.object(resource, 'is_image_content_type', return_value=False), \
+             mock.patch.object(resource, 'get_object_deferring_geometry'), \
+             mock.patch.object(resource, 'set_basic_context_resource'), \
+             mock.patch.object(resource, 'path_has_only_attributes', return_value=False), \
+             mock.patch.object(resource, 'get_required_object_from_method_to_execute', side_effect=serve_operation), \
+             mock.patch.object(resource, 'content_type_for_operation', return_value=CONTENT_TYPE_JSON), \
+             mock.patch.object(resource, 'get_object_from_operation_expression', return_value={'area': 1.5}) as get_object_from_operation_expression:
+            required_object = resource.basic_get(request, pk=33, attributes_functions='area')
+        self.assertEquals(required_object.representation_object, {'area': 1.5})
+        operation_expression_for_path.assert_called_once_with('area')
+        get_object_from_operation_expression.assert_called_once_with('expression')
+
+
+class CursorLimitLinkTestCase(SimpleTestCase):
+    def setUp(self):
+        self.acr = AbstractCollectionResource()
+        self.queryset = mock.Mock()
+        self.queryset.values_list.return_value = [('ES', 32), ('RJ', 33)]
+
+    def test_full_last_page_has_no_next_cursor(self):
+        self.assertIsNone(self.acr.next_cursor_for(self.queryset, 'sigla', 2))
+        self.assertEquals(self.acr.decode_cursor(self.acr.next_cursor_for(self.queryset, 'sigla', 1)), ('sigla', 'ES', 32))
+
+    def test_next_link_replaces_the_cursor_limit_snippet(self):
+        request = mock.Mock()
+        request.build_absolute_uri.return_value = 'http://localhost/api/bcim/unidades-federativas/cursor-limit/2/'
+        self.assertEquals(self.acr.cursor_limit_link(request, 'cursor-limit/2', 'abc'),
+                          'http://localhost/api/bcim/unidades-federativas/cursor-limit/abc&2')
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_next_link_is_cached_with_the_page(self):
+        cache.clear()
+        TieredCache().local_cache.clear()
+        self.acr.request = mock.Mock()
+        self.acr.representation_links['next'] = 'http://localhost/api/bcim/unidades-federativas/cursor-limit/abc&2'
+        with mock.patch.object(self.acr, 'table_name', return_value='lim_unidade_federacao_a'), \
+             mock.patch.object(self.acr, 'cache_enabled', return_value=True), \
+             mock.patch.object(self.acr, 'versioned_e_tag_enabled', return_value=True):
+            self.acr.set_entry_in_cache('page', ('1-abc', CONTENT_TYPE_JSON, b'[]', None))
+
+        resource = AbstractCollectionResource()
+        self.assertIsNotNone(resource.valid_entry_in_cache('page'))
+        self.assertEquals(resource.representation_links, self.acr.representation_links)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ETagIndexTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.iri = 'http://localhost/api/bcim/unidades-federativas/ES'
+
+    def test_validators_are_valid_while_the_table_version_is_the_same(self):
+        ETagIndex().index(self.iri, CONTENT_TYPE_JSON, '1-abc', 1500000000, 1)
+        self.assertEquals(ETagIndex().validators_for(self.iri, CONTENT_TYPE_JSON, 1), ('1-abc', 1500000000))
+        self.assertIsNone(ETagIndex().validators_for(self.iri, CONTENT_TYPE_JSON, 2))
+        self.assertIsNone(ETagIndex().validators_for(self.iri, CONTENT_TYPE_GEOJSON, 1))
+
+    def test_not_modified_by_index(self):
+        resource = FeatureCollectionResource()
+        with mock.patch.object(resource, 'indexed_validators', return_value=('1-abc', 1500000000)):
+            self.assertTrue(resource.not_modified_by_index(mock.Mock(META={HTTP_IF_NONE_MATCH: '"0-xyz", "1-abc"'})))
+            self.assertFalse(resource.not_modified_by_index(mock.Mock(META={HTTP_IF_NONE_MATCH: '"0-xyz"'})))
+            self.assertTrue(resource.not_modified_by_index(mock.Mock(META={HTTP_IF_MODIFIED_SINCE: http_date(1500000000)})))
+            self.assertFalse(resource.not_modified_by_index(mock.Mock(META={HTTP_IF_MODIFIED_SINCE: http_date(1400000000)})))
+        with mock.patch.object(resource, 'indexed_validators', return_value=None):
+            self.assertFalse(resource.not_modified_by_index(mock.Mock(META={HTTP_IF_NONE_MATCH: '"1-abc"'})))
+
+    def resource_for_index(self, cache_is_shared=True):
+        resource = FeatureResource()
+        resource.serializer_class = mock.Mock()
+        patches = [mock.patch.object(resource, 'cache_is_shared', return_value=cache_is_shared),
+                   mock.patch.object(resource, 'table_name', return_value='lim_unidade_federacao_a'),
+                   mock.patch.object(resource, 'content_type_by_accept', return_value=CONTENT_TYPE_JSON)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        return resource
+
+    def request_for_index(self):
+        request = mock.Mock(META={HTTP_IF_NONE_MATCH: '"1-abc"'})
+        request.get_full_path.return_value = '/api/bcim/unidades-federativas/ES'
+        request.build_absolute_uri.return_value = self.iri
+        return request
+
+    def test_write_in_another_worker_invalidates_the_indexed_validators(self):
+        resource = self.resource_for_index()
+        ETagIndex().index(self.iri, CONTENT_TYPE_JSON, '1-abc', 1500000000, resource.table_version())
+        self.assertTrue(resource.not_modified_by_index(self.request_for_index()))
+
+        # another cache instance (another worker) on the same storage, which is what a shared backend gives
+        other_worker_cache = LocMemCache(LOCMEM_CACHES['default']['LOCATION'], {})
+        other_worker_cache.incr(TableVersion().key_for('lim_unidade_federacao_a'))
+
+        resource = self.resource_for_index()
+        self.assertIsNone(resource.indexed_validators(self.request_for_index()))
+        self.assertFalse(resource.not_modified_by_index(self.request_for_index()))
+
+    def test_index_is_not_used_with_a_process_local_cache(self):
+        resource = self.resource_for_index(cache_is_shared=False)
+        ETagIndex().index(self.iri, CONTENT_TYPE_JSON, '1-abc', 1500000000, resource.table_version())
+        self.assertIsNone(resource.indexed_validators(self.request_for_index()))
+        self.assertFalse(resource.not_modified_by_index(self.request_for_index()))
+
+
+class LRUCacheTestCase(SimpleTestCase):
+    def test_bytes_are_accounted(self):
+        lru_cache = LRUCache(max_bytes=10, max_entry_bytes=8)
+        lru_cache.set('a', b'1234')
+        lru_cache.set('b', b'123')
+        lru_cache.set('a', b'12')
+        self.assertEquals(lru_cache.current_bytes, 5)
+        lru_cache.delete('b')
+        self.assertEquals(lru_cache.current_bytes, 2)
+
+    def test_least_recently_used_is_evicted(self):
+        lru_cache = LRUCache(max_bytes=10, max_entry_bytes=8)
+        lru_cache.set('a', b'1234')
+        lru_cache.set('b', b'1234')
+        lru_cache.get('a')
+        lru_cache.set('c', b'1234')
+        self.assertIsNone(lru_cache.get('b'))
+        self.assertEquals(lru_cache.get('a'), b'1234')
+        self.assertEquals(lru_cache.current_bytes, 8)
+
+    def test_entry_bigger_than_the_limit_is_not_kept(self):
+        lru_cache = LRUCache(max_bytes=10, max_entry_bytes=8)
+        lru_cache.set('a', b'1234')
+        lru_cache.set('a', b'123456789')
+        self.assertIsNone(lru_cache.get('a'))
+        self.assertEquals(lru_cache.current_bytes, 0)
+
+    def test_expired_entry_is_removed(self):
+        lru_cache = LRUCache()
+        lru_cache.set('a', b'1234', seconds=-1)
+        self.assertIsNone(lru_cache.get('a'))
+        self.assertEquals(lru_cache.current_bytes, 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TieredCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        TieredCache().local_cache.clear()
+
+    def test_set_and_get(self):
+        TieredCache().set('key', ('etag', CONTENT_TYPE_JSON, b'{}', None))
+        self.assertEquals(TieredCache().get('key'), ('etag', CONTENT_TYPE_JSON, b'{}', None))
+        TieredCache().delete('key')
+        self.assertIsNone(TieredCache().get('key'))
+
+    def test_value_of_another_worker_is_read_from_the_shared_cache(self):
+        TieredCache().set('key', {'a': 1})
+        TieredCache().local_cache.clear()
+        self.assertEquals(TieredCache().get('key'), {'a': 1})
+        self.assertIsNotNone(TieredCache().local_cache.get('key'))
+
+    def test_uncacheable_representation_is_not_coalesced(self):
+        resource = FeatureCollectionResource()
+        request = mock.Mock()
+        with mock.patch.object(resource, 'resource_in_cache', return_value=None), \
+             mock.patch.object(resource, 'representation_is_cacheable', return_value=False), \
+             mock.patch.object(resource, 'response_base_get_computed', return_value='response'), \
+             mock.patch.object(TieredCache(), 'computing') as computing:
+            self.assertEquals(resource.response_base_get(request), 'response')
+        computing.assert_not_called()
+
+
+class MapPoolTestCase(SimpleTestCase):
+    def setUp(self):
+        MapPool().initialize()
+        self.mapnik_patcher = mock.patch('image_generator.img_generator.mapnik', create=True)
+        self.mapnik = self.mapnik_patcher.start()
+        self.mapnik.Map.side_effect = lambda width, height: mock.MagicMock(srs='+init=epsg:4326', layers=[])
+
+    def tearDown(self):
+        self.mapnik_patcher.stop()
+        MapPool().initialize()
+
+    def test_release_after_the_style_was_evicted(self):
+        with MapPool().map_for('<Map/>', '.', 256, 256) as a_map:
+            a_map.srs = '+init=epsg:3857'
+            a_map.layers.append('layer')
+            for style_number in range(MAP_POOL_MAX_STYLES + 1):
+                with MapPool().map_for('<Map>' + str(style_number) + '</Map>', '.', 256, 256):
+                    pass
+        self.assertEquals(a_map.srs, '+init=epsg:4326')
+        self.assertEquals(a_map.layers, [])
+
+    def test_released_map_is_reused_resized(self):
+        with MapPool().map_for('<Map/>', '.', 256, 256) as a_map:
+            pass
+        with MapPool().map_for('<Map/>', '.', 512, 512) as reused_map:
+            pass
+        self.assertIs(reused_map, a_map)
+        a_map.resize.assert_called_once_with(512, 512)
+        self.assertEquals(self.mapnik.load_map_from_string.call_count, 1)
+
+    def test_idle_maps_of_a_style_are_capped(self):
+        key = MapPool().key_for('<Map/>')
+        pooled_maps = [MapPool().acquire(key, '<Map/>', '.', 256, 256) for _ in range(MAP_POOL_MAX_IDLE_MAPS + 1)]
+        for pooled_map in pooled_maps:
+            MapPool().release(key, pooled_map)
+        self.assertEquals(len(MapPool().idle_maps_by_key[key]), MAP_POOL_MAX_IDLE_MAPS)
+
+    def test_least_recently_used_style_is_evicted(self):
+        for style_number in range(MAP_POOL_MAX_STYLES):
+            with MapPool().map_for('<Map>' + str(style_number) + '</Map>', '.', 256, 256):
+                pass
+        with MapPool().map_for('<Map>0</Map>', '.', 256, 256):
+            pass
+        with MapPool().map_for('<Map>new</Map>', '.', 256, 256):
+            pass
+        self.assertEquals(len(MapPool().idle_maps_by_key), MAP_POOL_MAX_STYLES)
+        self.assertIn(MapPool().key_for('<Map>0</Map>'), MapPool().idle_maps_by_key)
+        self.assertNotIn(MapPool().key_for('<Map>1</Map>'), MapPool().idle_maps_by_key)
+
+
+class ContentAddressedStoreTestCase(SimpleTestCase):
+    def setUp(self):
+        self.store = ContentAddressedStore()
+        self.root, self.max_bytes = self.store.root, self.store.max_bytes
+        self.store.root, self.store.max_bytes = tempfile.mkdtemp(), 1000
+
+    def tearDown(self):
+        shutil.rmtree(self.store.root, ignore_errors=True)
+        self.store.root, self.store.max_bytes = self.root, self.max_bytes
+
+    def test_least_recently_used_bodies_are_pruned(self):
+        bodies = [self.store.put(str(number).encode() * 40) for number in range(3)]
+        for age, body in enumerate(reversed(bodies)):
+            os.utime(body.path, (1000 - age, 1000 - age))
+        self.store.max_bytes = 100
+        self.store.prune()
+        self.assertEquals([body.exists() for body in bodies], [False, True, True])
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_body_is_stored_only_when_it_is_cached(self):
+        resource = FeatureCollectionResource()
+        resource.request = mock.Mock()
+        entry = ('"v1"', CONTENT_TYPE_OCTET_STREAM, b'0' * 400, None)
+        with mock.patch.object(resource, 'cache_enabled', return_value=True), \
+             mock.patch.object(resource, 'versioned_e_tag_enabled', return_value=False):
+            self.assertEquals(resource.set_entry_in_cache('key', entry), entry)
+        self.assertEquals(os.listdir(self.store.root), [])
+
+
+class FeatureCollectionStreamTestCase(SimpleTestCase):
+    def setUp(self):
+        self.resource = FeatureCollectionResource()
+        serializer = mock.Mock()
+        serializer.to_representation.side_effect = lambda number: {'type': 'Feature', 'id': number, 'properties': {'area': Decimal('1.5')}}
+        self.resource.serializer_class = mock.Mock(return_value=serializer)
+
+    def streamed_collection(self, feature_count):
+        queryset = mock.Mock()
+        queryset.iterator.side_effect = lambda chunk_size: iter(range(feature_count))
+        with mock.patch.object(self.resource, 'streaming_chunk_size', return_value=2):
+            return json.loads(''.join(self.resource.feature_collection_stream(queryset, mock.Mock())))
+
+    def test_stream_is_a_feature_collection(self):
+        for feature_count in [0, 1, 2, 4, 5]:
+            collection = self.streamed_collection(feature_count)
+            self.assertEquals(collection['type'], 'FeatureCollection')
+            self.assertEquals([feature['id'] for feature in collection['features']], list(range(feature_count)))
+
+    def test_stream_encodes_decimals(self):
+        self.assertEquals(self.streamed_collection(1)['features'][0]['properties']['area'], 1.5)
+
+
+class DatabaseGeoJSONTestCase(SimpleTestCase):
+    def setUp(self):
+        self.resource = FeatureCollectionResource()
+        self.resource.object_model = mock.Mock()
+        self.resource.object_model.get_model_objects_geojson.return_value = '{"type": "FeatureCollection", "features": []}'
+        self.request = mock.Mock(META={HTTP_ACCEPT: CONTENT_TYPE_GEOJSON})
+        self.patchers = [mock.patch.object(self.resource, 'database_geojson_enabled', return_value=True),
+                         mock.patch.object(self.resource, 'geometry_field_name', return_value='geom')]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+
+    def test_geojson_is_encoded_by_the_database(self):
+        required_object = self.resource.required_object_for_database_geojson(self.request, mock.Mock(), ['geom', 'nome'])
+        self.assertEquals(required_object.representation_object, b'{"type": "FeatureCollection", "features": []}')
+        self.assertEquals(required_object.content_type, CONTENT_TYPE_GEOJSON)
+
+    def test_projection_without_geometry_falls_back(self):
+        self.assertIsNone(self.resource.required_object_for_database_geojson(self.request, mock.Mock(), ['nome']))
+        self.assertIsNone(self.resource.required_object_for_database_geojson(self.request, mock.Mock(), ['geom']))
+
+    def test_database_failure_falls_back(self):
+        self.resource.object_model.get_model_objects_geojson.side_effect = ProgrammingError('relationship')
+        self.assertIsNone(self.resource.required_object_for_database_geojson(self.request, mock.Mock()))
+
+    def test_disabled_or_not_json_falls_back(self):
+        self.assertIsNone(self.resource.required_object_for_database_geojson(mock.Mock(META={HTTP_ACCEPT: CONTENT_TYPE_IMAGE_PNG}), mock.Mock()))
+        with mock.patch.object(self.resource, 'database_geojson_enabled', return_value=False):
+            self.assertIsNone(self.resource.required_object_for_database_geojson(self.request, mock.Mock()))
+
+
+class DatabaseCapabilitiesTestCase(SimpleTestCase):
+    def setUp(self):
+        DatabaseCapabilities().reset()
+        self.cursor = mock.MagicMock()
+        self.cursor.fetchall.return_value = [('st_asmvt',), ('st_asgeobuf',)]
+        self.cursor.fetchone.side_effect = [(100000,), (2,)]
+        self.connection = mock.MagicMock(vendor='postgresql')
+        self.connection.cursor.return_value.__enter__.return_value = self.cursor
+
+    def tearDown(self):
+        DatabaseCapabilities().reset()
+
+    def test_capabilities_are_probed_once(self):
+        with mock.patch('hyper_resource.models.connections', {'default': self.connection}):
+            self.assertTrue(DatabaseCapabilities().has_st_asmvt('default'))
+            self.assertTrue(DatabaseCapabilities().has_st_asgeobuf('default'))
+            self.assertFalse(DatabaseCapabilities().has_st_asflatgeobuf('default'))
+            self.assertTrue(DatabaseCapabilities().has_parallel_aggregates('default'))
+        self.assertEquals(self.connection.cursor.call_count, 1)
+
+    def test_connection_failure_is_not_kept(self):
+        self.cursor.execute.side_effect = [OperationalError('connection refused'), None, None, None]
+        with mock.patch('hyper_resource.models.connections', {'default': self.connection}):
+            self.assertFalse(DatabaseCapabilities().has_st_asmvt('default'))
+            self.assertTrue(DatabaseCapabilities().has_st_asmvt('default'))
+
+    def test_database_without_postgis(self):
+        self.connection.vendor = 'sqlite'
+        with mock.patch('hyper_resource.models.connections', {'default': self.connection}):
+            self.assertFalse(DatabaseCapabilities().has_st_asmvt('default'))
+        self.connection.cursor.assert_not_called()
+
+
+class ContextCacheTestCase(SimpleTestCase):
+    def test_context_is_built_once(self):
+        built_contexts = []
+        def build_context():
+            built_contexts.append(True)
+            return {"@context": {"nome": {"@id": "https://schema.org/name"}}, "hydra:iriTemplate": None}
+        key = ('ContextCacheTestCase', 'test_context_is_built_once')
+        ContextCache().context_for(key, build_context)
+        ContextCache().context_for(key, build_context)
+        self.assertEquals(len(built_contexts), 1)
+
+    def test_each_caller_gets_its_own_copy(self):
+        key = ('ContextCacheTestCase', 'test_each_caller_gets_its_own_copy')
+        a_context = ContextCache().context_for(key, lambda: {"@context": {"nome": {"@id": "https://schema.org/name"}}})
+        a_context["@context"]["nome"]["@type"] = "@id"
+        self.assertNotIn("@type", ContextCache().context_for(key, lambda: {})["@context"]["nome"])
+
+    def test_vocabulary_is_built_once_and_read_only(self):
+        self.assertIs(vocabularyDict(), vocabularyDict())
+        self.assertEquals(vocabulary(str), "https://schema.org/Text")
+        self.assertIsNone(vocabulary('not-a-term'))
+        with self.assertRaises(TypeError):
+            vocabularyDict()[str] = None
+
+    def test_context_is_compiled_once(self):
+        context_resource = ContextResource()
+        with mock.patch.object(context_resource, 'compiled_context', return_value={"@context": {}}) as compiled_context:
+            a_context = context_resource.context(FeatureCollection)
+        compiled_context.assert_called_once_with(FeatureCollection)
+        a_context["@context"]["nome"] = "https://schema.org/name"
+        self.assertEquals(context_resource.dict_context, {"@context": {}})
+
+
 class AbstractCollectionResourceTestCase(SimpleTestCase):
     def setUp(self):
         self.attributes_functions = ['filter/sigla/in/rj,es,go/',
@@ -652,21 +1522,21 @@ class AbstractOptionsRequestTest(AbstractRequestTest):
 
         self.spatial_collection_operation_names = ['bbcontains', 'bboverlaps', 'collect', 'contained', 'contains',
                                                    'contains-properly', 'count-resource',
-                                                   'covers', 'covers-by', 'crosses', 'disjoint', 'distance-gt',
+                                                   'covers', 'covers-by', 'crosses', 'cursor-limit', 'disjoint', 'distance-gt',
                                                    'distance-gte', 'distance-lt', 'distance-lte',
                                                    'distinct', 'dwithin', 'envelope', 'extent', 'filter', 'group-by-count',
                                                    'group-by-sum', 'intersects', 'isvalid', 'join', 'left',
-                                                   'make-line', 'offset-limit', 'overlaps', 'overlaps-above',
-                                                   'overlaps-below', 'overlaps-left', 'overlaps-right', 'projection',
-                                                   'relate', 'right', 'strictly-above', 'strictly-below', 'touches',
-                                                   'union', 'within']
+                                                   'make-line', 'map-image', 'offset-limit', 'overlaps', 'overlaps-above',
+                                                   'overlaps-below', 'overlaps-left', 'overlaps-right', 'png-tiles', 'projection',
+                                                   'relate', 'right', 'strictly-above', 'strictly-below', 'tiles',
+                                                   'touches', 'union', 'within']
 
-        self.collection_operation_names = ['collect', 'count-resource', 'distinct', 'filter', 'group-by-count',
+        self.collection_operation_names = ['collect', 'count-resource', 'cursor-limit', 'distinct', 'filter', 'group-by-count',
                                            'group-by-sum', 'join', 'offset-limit', 'projection']
 
-        self.raster_operation_names = ['bands', 'destructor', 'driver', 'extent', 'geotransform', 'height', 'info',
+        self.raster_operation_names = ['bands', 'bbox', 'destructor', 'driver', 'extent', 'geotransform', 'height', 'info',
                                        'metadata', 'name', 'origin', 'projection', 'ptr', 'ptr_type', 'scale', 'skew',
-                                       'srid', 'srs', 'transform', 'vsi_buffer', 'warp', 'width']
+                                       'srid', 'srs', 'tiles', 'transform', 'vsi_buffer', 'warp', 'width', 'window']
 
         self.entrypoint_operation_names = ["collect", "count-resource", "filter", "offset-limit", "projection"]
 
@@ -915,6 +1785,15 @@ class CollectOperationTest(AbstractGetRequestTest):
         first_element_keys = self.aux_get_first_element_keys_from_response_list(response)
         self.assertEquals(first_element_keys, ["area", "nome"])
 
+    def test_collect_operation_computed_in_database_with_geometry_return(self):
+        # 'transform/3857' is computed by the database, the geometry keeps the attribute name as in python
+        response = requests.get(self.bcim_base_uri + "unidades-federativas/collect/nome&geom/transform/3857")
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.headers['content-type'], CONTENT_TYPE_GEOJSON)
+
+        first_feature_properties_keys = self.aux_get_first_feature_properties_keys(response)
+        self.assertEquals(first_feature_properties_keys, ['nome'])
+
     def test_collect_operation_with_spatial_operation_and_float_return_accept_header(self):
         response = requests.get(self.bcim_base_uri + "aldeias-indigenas/collect/nome&geom/area",
                                 headers=OCTET_STREAM_ACCEPT_HEADER)
@@ -3883,6 +4762,16 @@ class FeatureCollectionTest(AbstractGetRequestTest):
         g = GEOSGeometry(json.dumps(feature_dict))
         self.assertTrue(g.valid)
 
+    def test_feature_collection_tiles_operation(self):
+        response = requests.get(self.bcim_base_uri + "unidades-federativas/tiles/4/5/8")
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.headers['content-type'], CONTENT_TYPE_MVT)
+        # a vector tile is a protobuf message whose first field is a layer (field 3, length delimited)
+        self.assertEquals(response.content[0], 0x1a)
+
+        response = requests.get(self.bcim_base_uri + "unidades-federativas/tiles/4/16/8")
+        self.assertEquals(response.status_code, 400)
+
 
 # python manage.py test hyper_resource.tests.OptionsFeatureCollectionTest --testrunner=hyper_resource.tests.NoDbTestRunner
 class OptionsFeatureCollectionTest(AbstractOptionsRequestTest):
@@ -6087,6 +6976,22 @@ class FeatureResourceTest(AbstractGetRequestTest):
         feature_keys = self.aux_get_first_feature_keys(response)
         self.assertListEqual(feature_keys, ['coordinates', 'type'])
 
+    def test_feature_resource_buffer_and_convex_hull_and_area_operations(self):
+        response = requests.get(self.bcim_base_uri + 'unidades-federativas/ES/buffer/1.2/convex_hull/area')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.headers["content-type"], CONTENT_TYPE_JSON)
+
+        feature_keys = self.aux_get_first_feature_keys(response)
+        self.assertListEqual(feature_keys, ['area'])
+
+    def test_feature_resource_buffer_and_envelope_operations(self):
+        response = requests.get(self.bcim_base_uri + 'unidades-federativas/ES/buffer/1.2/envelope')
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.headers["content-type"], CONTENT_TYPE_GEOJSON)
+
+        feature_keys = self.aux_get_first_feature_keys(response)
+        self.assertListEqual(feature_keys, ['coordinates', 'type'])
+
 
     def test_feature_resource_centroid_operation(self):
         response = requests.get(self.bcim_base_uri + 'unidades-federativas/ES/centroid')
@@ -11808,6 +12713,22 @@ class PaginationTest(AbstractHeadRequestTest):
         next_hypermidia_control = self.aux_get_hypermidia_control_from_link_header(response, 'next')
         self.assertEquals(next_hypermidia_control, "<" + self.controle_base_uri + "gasto-list/offset-limit/2001&1000>")
 
+    def test_collection_pagination_with_cursor_limit_operation(self):
+        response = requests.get(self.controle_base_uri + "gasto-list/cursor-limit/2")
+        self.assertEquals(response.status_code, 200)
+        first_page = json.loads(response.text)
+        self.assertEquals(len(first_page), 2)
+
+        next_hypermidia_control = self.aux_get_hypermidia_control_from_link_header(response, 'next')
+        self.assertTrue(next_hypermidia_control.startswith("<" + self.controle_base_uri + "gasto-list/cursor-limit/"))
+        self.assertTrue(next_hypermidia_control.endswith("&2>"))
+
+        response = requests.get(next_hypermidia_control[1:-1])
+        self.assertEquals(response.status_code, 200)
+        second_page = json.loads(response.text)
+        self.assertEquals(len(second_page), 2)
+        self.assertNotIn(second_page[0], first_page)
+
     """
     # Pagination for feature collection must be specific for each case
     # In this specific "aldeias-indigenas" case we are dealing with Poits and don't make sense paginate about 200 Points
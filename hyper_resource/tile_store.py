@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import threading
+
+from django.conf import settings
+
+from hyper_resource.blob_store import StoredBody
+from hyper_resource.tiles import tile_range, PNG_TILE_BUFFER_PIXELS
+
+PNG_TILE_EXTENSION = '.png'
+
+
+class DiskTileStore(object):
+    """
+    Rendered png tiles on local disk: <root>/<layer>/<style key>/<z>/<x>/<y>.png
+    The root is settings.HYPER_RESOURCE_TILE_STORE_DIR, a directory in the temporary directory by default
+    """
+    _instance = None
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(DiskTileStore, cls).__new__(cls, *args, **kwargs)
+            cls._instance.initialize()
+        return cls._instance
+
+    def initialize(self):
+        self.root = getattr(settings, 'HYPER_RESOURCE_TILE_STORE_DIR', os.path.join(tempfile.gettempdir(), 'hyper_resource_tiles'))
+
+    def layer_path(self, layer):
+        return os.path.join(self.root, layer)
+
+    def tile_path(self, layer, style_key, z, x, y):
+        return os.path.join(self.layer_path(layer), style_key, str(z), str(x), str(y) + PNG_TILE_EXTENSION)
+
+    def has_tiles_for(self, layer):
+        return os.path.isdir(self.layer_path(layer))
+
+    def get(self, layer, style_key, z, x, y):
+        try:
+            with open(self.tile_path(layer, style_key, z, x, y), 'rb') as tile_file:
+                return tile_file.read()
+        except FileNotFoundError:
+            return None
+
+    # Answers the StoredBody of the tile, so it is sent from its file, or None
+    def stored_body(self, layer, style_key, z, x, y):
+        path = self.tile_path(layer, style_key, z, x, y)
+        try:
+            return StoredBody(path, os.path.getsize(path))
+        except FileNotFoundError:
+            return None
+
+    def set(self, layer, style_key, z, x, y, tile):
+        path = self.tile_path(layer, style_key, z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # readers never see a half written tile: it is written aside and renamed
+        temporary_path = '{0}.{1}.{2}.tmp'.format(path, os.getpid(), threading.get_ident())
+        with open(temporary_path, 'wb') as tile_file:
+            tile_file.write(tile)
+        os.replace(temporary_path, path)
+
+    def invalidate(self, layer, bounds):
+        '''
+        Removes the tiles of 'layer', of every style and zoom, that overlap 'bounds' (xmin, ymin, xmax, ymax) in web mercator.
+        Only the directories of stored tiles are visited, so the cost does not grow with the zoom
+        '''
+        for style_key in self.directory_names(self.layer_path(layer)):
+            style_path = os.path.join(self.layer_path(layer), style_key)
+            for z_name in self.directory_names(style_path):
+                if not z_name.isdigit():
+                    continue
+                x_first, y_first, x_last, y_last = tile_range(int(z_name), bounds, PNG_TILE_BUFFER_PIXELS)
+                for x_name in self.directory_names(os.path.join(style_path, z_name)):
+                    if not x_name.isdigit() or not x_first <= int(x_name) <= x_last:
+                        continue
+                    x_path = os.path.join(style_path, z_name, x_name)
+                    for y_file_name in self.directory_names(x_path):
+                        y_name = y_file_name[:-len(PNG_TILE_EXTENSION)]
+                        if y_file_name.endswith(PNG_TILE_EXTENSION) and y_name.isdigit() and y_first <= int(y_name) <= y_last:
+                            self.remove(os.path.join(x_path, y_file_name))
+
+    def invalidate_layer(self, layer):
+        shutil.rmtree(self.layer_path(layer), ignore_errors=True)
+
+    def directory_names(self, path):
+        try:
+            return os.listdir(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return []
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
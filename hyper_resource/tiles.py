@@ -0,0 +1,306 @@
+import struct
+from decimal import Decimal
+
+from django.contrib.gis.geos import Polygon
+from django.contrib.gis.geos.error import GEOSException
+
+WEB_MERCATOR_SRID = 3857
+# half of the width of the world in web mercator (EPSG:3857) meters
+WEB_MERCATOR_HALF_WIDTH = 20037508.342789244
+TILE_MAX_ZOOM = 24
+
+PNG_TILE_SIZE = 256
+# png tiles are rendered in blocks of METATILE_SIZE x METATILE_SIZE tiles, then sliced
+METATILE_SIZE = 8
+# markers and line widths are drawn beyond the geometry, features this close (in pixels) to a tile are drawn in it
+PNG_TILE_BUFFER_PIXELS = 32
+
+MVT_EXTENT = 4096
+MVT_BUFFER = 64
+MVT_VERSION = 2
+
+MVT_POINT = 1
+MVT_LINESTRING = 2
+MVT_POLYGON = 3
+
+MVT_MOVE_TO = 1
+MVT_LINE_TO = 2
+MVT_CLOSE_PATH = 7
+
+# protobuf wire types
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_LENGTH_DELIMITED = 2
+
+
+def tile_is_valid(z, x, y):
+    return 0 <= z <= TILE_MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def tile_bounds(z, x, y):
+    '''
+    Answers (xmin, ymin, xmax, ymax) in web mercator of the tile z/x/y of the XYZ scheme (y grows southwards)
+    '''
+    tile_width = 2 * WEB_MERCATOR_HALF_WIDTH / 2 ** z
+    xmin = -WEB_MERCATOR_HALF_WIDTH + x * tile_width
+    ymax = WEB_MERCATOR_HALF_WIDTH - y * tile_width
+    return xmin, ymax - tile_width, xmin + tile_width, ymax
+
+
+def tile_range(z, bounds, margin_pixels=0):
+    '''
+    Answers (x_first, y_first, x_last, y_last) of the tiles of zoom z that overlap 'bounds' (xmin, ymin, xmax, ymax)
+    in web mercator, enlarged by 'margin_pixels' png tile pixels in each side
+    '''
+    tile_width = 2 * WEB_MERCATOR_HALF_WIDTH / 2 ** z
+    margin = margin_pixels * tile_width / PNG_TILE_SIZE
+    last_tile = 2 ** z - 1
+
+    def tile_index(distance):
+        return min(max(int(distance // tile_width), 0), last_tile)
+
+    return (tile_index(bounds[0] - margin + WEB_MERCATOR_HALF_WIDTH), tile_index(WEB_MERCATOR_HALF_WIDTH - bounds[3] - margin),
+            tile_index(bounds[2] + margin + WEB_MERCATOR_HALF_WIDTH), tile_index(WEB_MERCATOR_HALF_WIDTH - bounds[1] + margin))
+
+
+def metatile_of(z, x, y, metatile_size=METATILE_SIZE):
+    '''
+    Answers (x, y, size) of the first tile and of the number of tiles by side of the metatile that contains the tile z/x/y.
+    'metatile_size' is a power of 2, in the first zoom levels the metatile is the whole world
+    '''
+    size = min(metatile_size, 2 ** z)
+    return x - x % size, y - y % size, size
+
+
+def metatile_bounds(z, x, y, size):
+    xmin, _, _, ymax = tile_bounds(z, x, y)
+    _, ymin, xmax, _ = tile_bounds(z, x + size - 1, y + size - 1)
+    return xmin, ymin, xmax, ymax
+
+
+def tile_envelope(z, x, y, margin=0.0):
+    '''
+    Answers the tile bounds as a web mercator Polygon, enlarged by 'margin' (a fraction of the tile width) in each side
+    '''
+    xmin, ymin, xmax, ymax = tile_bounds(z, x, y)
+    enlargement = (xmax - xmin) * margin
+    envelope = Polygon.from_bbox((xmin - enlargement, ymin - enlargement, xmax + enlargement, ymax + enlargement))
+    envelope.srid = WEB_MERCATOR_SRID
+    return envelope
+
+
+class ProtobufWriter(object):
+    """
+    Minimal protocol buffers encoder, only what the vector tile messages need
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def varint(self, value):
+        chunk = bytearray()
+        while value > 0x7f:
+            chunk.append((value & 0x7f) | 0x80)
+            value >>= 7
+        chunk.append(value)
+        self.chunks.append(bytes(chunk))
+
+    def key(self, field_number, wire_type):
+        self.varint((field_number << 3) | wire_type)
+
+    def uint_field(self, field_number, value):
+        self.key(field_number, WIRE_VARINT)
+        self.varint(value)
+
+    def sint_field(self, field_number, value):
+        self.key(field_number, WIRE_VARINT)
+        self.varint(zigzag(value))
+
+    def bool_field(self, field_number, value):
+        self.uint_field(field_number, 1 if value else 0)
+
+    def double_field(self, field_number, value):
+        self.key(field_number, WIRE_FIXED64)
+        self.chunks.append(struct.pack('<d', value))
+
+    def bytes_field(self, field_number, value):
+        self.key(field_number, WIRE_LENGTH_DELIMITED)
+        self.varint(len(value))
+        self.chunks.append(value)
+
+    def string_field(self, field_number, value):
+        self.bytes_field(field_number, value.encode('utf-8'))
+
+    def packed_uint_field(self, field_number, values):
+        packed = ProtobufWriter()
+        for value in values:
+            packed.varint(value)
+        self.bytes_field(field_number, packed.to_bytes())
+
+    def to_bytes(self):
+        return b''.join(self.chunks)
+
+
+def zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def command(command_id, count):
+    return (command_id & 0x7) | (count << 3)
+
+
+class VectorTileEncoder(object):
+    """
+    Pure python encoder of Mapbox Vector Tiles (version 2), used when the database has no ST_AsMVT.
+    Geometries must be in web mercator, they are simplified to the tile resolution, clipped to the
+    tile buffer and snapped to the integer grid of the tile extent
+    """
+    def __init__(self, z, x, y, extent=MVT_EXTENT, buffer=MVT_BUFFER):
+        self.bounds = tile_bounds(z, x, y)
+        self.extent = extent
+        self.clip_envelope = tile_envelope(z, x, y, float(buffer) / extent)
+        self.resolution = (self.bounds[2] - self.bounds[0]) / extent
+
+    def encode(self, layer_name, features):
+        '''
+        Answers the tile, as bytes, with one layer whose features are the tuples (id, geometry, properties_dict)
+        '''
+        layer = ProtobufWriter()
+        layer.uint_field(15, MVT_VERSION)
+        layer.string_field(1, layer_name)
+        keys, values = {}, {}
+
+        for feature_id, geometry, properties in features:
+            mvt_type, geometry_commands = self.geometry_commands(geometry)
+            if not geometry_commands:
+                continue
+
+            feature = ProtobufWriter()
+            if isinstance(feature_id, int) and feature_id >= 0:
+                feature.uint_field(1, feature_id)
+            tags = []
+            for name, value in properties.items():
+                if value is None:
+                    continue
+                if isinstance(value, Decimal):
+                    value = float(value)
+                value_key = (type(value), value) if isinstance(value, (bool, int, float)) else (str, str(value))
+                tags.append(keys.setdefault(name, len(keys)))
+                tags.append(values.setdefault(value_key, len(values)))
+            if tags:
+                feature.packed_uint_field(2, tags)
+            feature.uint_field(3, mvt_type)
+            feature.packed_uint_field(4, geometry_commands)
+            layer.bytes_field(2, feature.to_bytes())
+
+        for name in keys:
+            layer.string_field(3, name)
+        for value_type, value in values:
+            layer.bytes_field(4, self.encoded_value(value_type, value))
+        layer.uint_field(5, self.extent)
+
+        tile = ProtobufWriter()
+        tile.bytes_field(3, layer.to_bytes())
+        return tile.to_bytes()
+
+    def encoded_value(self, value_type, value):
+        encoded = ProtobufWriter()
+        if value_type is bool:
+            encoded.bool_field(7, value)
+        elif value_type is int:
+            encoded.sint_field(6, value)
+        elif value_type is float:
+            encoded.double_field(3, value)
+        else:
+            encoded.string_field(1, value)
+        return encoded.to_bytes()
+
+    def tile_coordinates(self, coordinates):
+        # the tile y axis grows downwards
+        points = []
+        for coordinate in coordinates:
+            point = (int(round((coordinate[0] - self.bounds[0]) / self.resolution)),
+                     int(round((self.bounds[3] - coordinate[1]) / self.resolution)))
+            if not points or points[-1] != point:
+                points.append(point)
+        return points
+
+    def ring_tile_coordinates(self, coordinates):
+        # the closing point is implicit in the ClosePath command
+        points = self.tile_coordinates(coordinates)
+        return points[:-1] if len(points) > 1 and points[0] == points[-1] else points
+
+    def simple_geometries(self, geometry):
+        if geometry.geom_type in ('MultiPoint', 'MultiLineString', 'MultiPolygon', 'GeometryCollection'):
+            return [simple for part in geometry for simple in self.simple_geometries(part)]
+        return [geometry]
+
+    def geometry_commands(self, geometry):
+        '''
+        Answers (mvt geometry type, commands) of the geometry clipped to the tile, commands are empty when nothing is left
+        '''
+        if geometry is None or geometry.empty:
+            return None, []
+
+        dimension = geometry.dims
+        try:
+            if dimension > 0:
+                geometry = geometry.simplify(self.resolution, preserve_topology=True)
+            geometry = geometry.intersection(self.clip_envelope)
+        except GEOSException:
+            # invalid geometries are left out of the tile, as they are by ST_AsMVTGeom
+            return None, []
+
+        parts = [part for part in self.simple_geometries(geometry) if not part.empty and part.dims == dimension]
+        cursor = [0, 0]
+        commands = []
+
+        if dimension == 0:
+            points = [point for part in parts for point in self.tile_coordinates([part.coords])]
+            if points:
+                commands.append(command(MVT_MOVE_TO, len(points)))
+                for point in points:
+                    commands.extend(self.delta(cursor, point))
+            return MVT_POINT, commands
+
+        if dimension == 1:
+            for part in parts:
+                points = self.tile_coordinates(part.coords)
+                if len(points) >= 2:
+                    self.append_path(commands, cursor, points, close=False)
+            return MVT_LINESTRING, commands
+
+        for part in parts:
+            rings = [self.ring_tile_coordinates(ring.coords) for ring in part]
+            if len(rings[0]) < 3 or ring_area(rings[0]) == 0:
+                continue
+            for idx, points in enumerate(rings):
+                if len(points) < 3 or ring_area(points) == 0:
+                    continue
+                # exterior rings have positive area in tile coordinates, interior rings negative area
+                if (ring_area(points) > 0) != (idx == 0):
+                    points.reverse()
+                self.append_path(commands, cursor, points, close=True)
+        return MVT_POLYGON, commands
+
+    def append_path(self, commands, cursor, points, close):
+        commands.append(command(MVT_MOVE_TO, 1))
+        commands.extend(self.delta(cursor, points[0]))
+        commands.append(command(MVT_LINE_TO, len(points) - 1))
+        for point in points[1:]:
+            commands.extend(self.delta(cursor, point))
+        if close:
+            commands.append(command(MVT_CLOSE_PATH, 1))
+
+    def delta(self, cursor, point):
+        dx, dy = point[0] - cursor[0], point[1] - cursor[1]
+        cursor[0], cursor[1] = point
+        return [zigzag(dx), zigzag(dy)]
+
+
+def ring_area(points):
+    area = 0
+    for idx in range(len(points)):
+        x1, y1 = points[idx - 1]
+        x2, y2 = points[idx]
+        area += x1 * y2 - x2 * y1
+    return area
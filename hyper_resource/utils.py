@@ -7,6 +7,9 @@ HTTP_IF_MATCH = 'HTTP_IF_MATCH'
 HTTP_IF_UNMODIFIED_SINCE = 'HTTP_IF_UNMODIFIED_SINCE'
 HTTP_IF_MODIFIED_SINCE = 'HTTP_IF_MODIFIED_SINCE'
 HTTP_ACCEPT = 'HTTP_ACCEPT'
+HTTP_ACCEPT_ENCODING = 'HTTP_ACCEPT_ENCODING'
+HTTP_RANGE = 'HTTP_RANGE'
+HTTP_IF_RANGE = 'HTTP_IF_RANGE'
 CONTENT_TYPE = 'CONTENT_TYPE'
 ETAG = 'Etag'
 CONTENT_TYPE_GEOJSON = "application/geo+json"
@@ -15,12 +18,13 @@ CONTENT_TYPE_LD_JSON = "application/ld+json"
 CONTENT_TYPE_OCTET_STREAM = "application/octet-stream"
 CONTENT_TYPE_IMAGE_PNG = "image/png"
 CONTENT_TYPE_IMAGE_TIFF = "image/tiff"
+CONTENT_TYPE_MVT = "application/vnd.mapbox-vector-tile"
 
 HYPER_RESOURCE_CONTEXT = 'http://www.w3.org/ns/json-hr#context'
 HYPER_RESOURCE_CONTENT_TYPE = 'application/hr+json'
 HYPER_RESOURCE_EXTENSION = '.jsonhr'
 
-SUPPORTED_CONTENT_TYPES = (CONTENT_TYPE_GEOJSON, CONTENT_TYPE_JSON,CONTENT_TYPE_LD_JSON, CONTENT_TYPE_OCTET_STREAM, CONTENT_TYPE_IMAGE_PNG, CONTENT_TYPE_IMAGE_TIFF, HYPER_RESOURCE_CONTENT_TYPE)
+SUPPORTED_CONTENT_TYPES = (CONTENT_TYPE_GEOJSON, CONTENT_TYPE_JSON,CONTENT_TYPE_LD_JSON, CONTENT_TYPE_OCTET_STREAM, CONTENT_TYPE_IMAGE_PNG, CONTENT_TYPE_IMAGE_TIFF, CONTENT_TYPE_MVT, HYPER_RESOURCE_CONTENT_TYPE)
 
 IMAGE_RESOURCE_TYPE = "Image"
 
@@ -28,6 +32,15 @@ SAFE_METHODS = ['GET', 'HEAD', 'OPTIONS']
 LIST_METHODS = ['GET', 'HEAD', 'OPTIONS', 'POST']
 ELEMENT_METHODS = ['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE']
 
+# Cache backends that are not shared between processes: invalidations done by a worker are not seen by the others
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Smaller bodies are not worth being gzipped
+GZIP_MIN_BYTES = 1024
+
 CORS_ALLOW_HEADERS = (
     'accept',
     'accept-encoding',
@@ -96,6 +109,10 @@ def get_url_arr_from_arr_of_tuples(arr_of_tuples):
 class OperationNotRecognized(Exception):
     pass
 
+# A filter expression that can not be parsed, like one with unbalanced parentheses
+class InvalidFilterExpression(ValueError):
+    pass
+
 def operation_with_url_splitted_by_slash(operation_str):
     att_functions_str_url = operation_str
     exp = r'(?=https{0,1}:.+?\*)(https{0,1}:.+?\*)|(https{0,1}:.+?\/?$)'
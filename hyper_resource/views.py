@@ -1828,7 +1828,7 @@ class AbstractCollectionResource(AbstractResource):
         return collection_operations_array
 
     def _dict_all_operation_dict(self):
-        operations_dict = self.operation_controller.internal_collection_operations_dict()
+        operations_dict = dict(self.operation_controller.internal_collection_operations_dict())
         operations_dict.update(self.operation_controller.dict_all_operation_dict())
         return operations_dict
 
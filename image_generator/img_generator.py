@@ -1,6 +1,10 @@
+import hashlib
 import sys
-import random
 import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
 
 try:
     import mapnik
@@ -14,6 +18,75 @@ installed successfully before running this script. **')
     #sys.exit(1)
 
 STYLE_XML = 'image_generator/style.xml'
+# idle maps kept by style and the number of styles kept, in each worker process
+MAP_POOL_MAX_IDLE_MAPS = 4
+MAP_POOL_MAX_STYLES = 16
+
+@lru_cache(maxsize=MAP_POOL_MAX_STYLES)
+def style_xml_from_file(style_file_name):
+    with open(style_file_name, encoding='utf-8-sig') as style_file:
+        return style_file.read()
+
+class MapPool:
+    """
+    Maps with the style already loaded, by style hash. Parsing the style XML costs more than
+    rendering a small layer, so a map is loaded once, resized and reused by the next requests
+    """
+    _instance = None
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(MapPool, cls).__new__(cls, *args, **kwargs)
+            cls._instance.initialize()
+        return cls._instance
+
+    def initialize(self):
+        self.lock = threading.Lock()
+        self.idle_maps_by_key = OrderedDict() # style hash => [(mapnik.Map, srs of the style)]
+
+    def key_for(self, style_xml):
+        return hashlib.sha1(style_xml.encode('utf-8')).hexdigest()
+
+    def acquire(self, key, style_xml, base_path, width, height):
+        '''
+        Answers a (map, srs of the style) pair, the map is width x height and has the style loaded
+        '''
+        pooled_map = None
+        with self.lock:
+            idle_maps = self.idle_maps_by_key.get(key)
+            if idle_maps:
+                self.idle_maps_by_key.move_to_end(key)
+                pooled_map = idle_maps.pop()
+
+        if pooled_map is None:
+            a_map = mapnik.Map(width, height)
+            mapnik.load_map_from_string(a_map, style_xml, False, base_path)
+            # the srs goes with the map, the key of its style can be evicted while it is rendering
+            return a_map, a_map.srs
+
+        pooled_map[0].resize(width, height)
+        return pooled_map
+
+    def release(self, key, pooled_map):
+        # the styles stay loaded, only the layers and the srs of the request are undone
+        a_map, style_srs = pooled_map
+        del a_map.layers[:]
+        a_map.srs = style_srs
+        with self.lock:
+            idle_maps = self.idle_maps_by_key.setdefault(key, [])
+            self.idle_maps_by_key.move_to_end(key)
+            if len(idle_maps) < MAP_POOL_MAX_IDLE_MAPS:
+                idle_maps.append(pooled_map)
+            while len(self.idle_maps_by_key) > MAP_POOL_MAX_STYLES:
+                self.idle_maps_by_key.popitem(last=False)
+
+    @contextmanager
+    def map_for(self, style_xml, base_path, width, height):
+        key = self.key_for(style_xml)
+        pooled_map = self.acquire(key, style_xml, base_path, width, height)
+        try:
+            yield pooled_map[0]
+        finally:
+            self.release(key, pooled_map)
 
 class IBuilderImage:
     spatialReference = {
@@ -23,11 +96,15 @@ class IBuilderImage:
         9999: "+proj=lcc +ellps=GRS80 +lat_0=49 +lon_0=-95 +lat+1=49 +lat_2=77 +datum=NAD83 +units=m +no_defs"
     }
 
-    def __init__(self, layer, bbox=0, srs=4326, width=800, height=600, length_name=16):
+    def __init__(self, layer, bbox=0, srs=4326, width=800, height=600):
         #self.geometry = layer['geometry']
         #self.geojsonfile = layer['geojson']
         #self.table_name = layer['table_name']
-        self.wkt = layer['wkt']
+        # 'wkbs' is a list of WKB geometries, 'wkt' one geometry (or collection) as WKT
+        self.wkt = layer.get('wkt')
+        self.wkbs = layer.get('wkbs')
+        # 'style_xml' is the style itself, 'style' the name of a style file
+        self.style_xml = layer.get('style_xml')
         if 'style' in layer:
             self.style = layer['style']
         else:
@@ -48,9 +125,6 @@ class IBuilderImage:
         self.width = width
         self.height = height
         self.imgType = None
-        self.mapnikObj = mapnik.Map(width, height)
-        self.mapnikImg = mapnik.Image(width, height)
-        self.image_name = ''.join([random.choice('0123456789ABCDEF') for i in range(length_name)])
 
     def _transform_to_basic_geom_type(self, geom_type):
         basic_geom_type = "polygon"
@@ -61,6 +135,29 @@ class IBuilderImage:
                 break
         return basic_geom_type
 
+    def proj4_srs(self):
+        return self.spatialReference.get(self.srs, '+init=epsg:' + str(self.srs))
+
+    def style_xml_and_base_path(self):
+        # relative paths of a style (markers, fonts) are resolved like load_map does for a style file
+        if self.style_xml is not None:
+            return self.style_xml, os.getcwd()
+        return style_xml_from_file(self.style), os.path.dirname(os.path.abspath(self.style))
+
+    def geometries(self):
+        if self.wkbs is not None:
+            return [mapnik.Geometry.from_wkb(wkb) for wkb in self.wkbs]
+        return [mapnik.Geometry.from_wkt(self.wkt)]
+
+    def memory_datasource(self):
+        datasource = mapnik.MemoryDatasource()
+        context = mapnik.Context()
+        for feature_id, geometry in enumerate(self.geometries(), 1):
+            feature = mapnik.Feature(context, feature_id)
+            feature.geometry = geometry
+            datasource.add_feature(feature)
+        return datasource
+
     def generate(self):
         pass
 
@@ -68,15 +165,42 @@ class IBuilderImage:
 
 class BuilderPNG(IBuilderImage):
     def __init__(self, layer, bbox=0, srs=4326, width=800, height=600):
-        IBuilderImage.__init__(self, layer)
+        IBuilderImage.__init__(self, layer, bbox, srs, width, height)
         self.imgType = "png"
 
     def generate(self):
-        mapnik.load_map(self.mapnikObj, self.style)
+        style_xml, base_path = self.style_xml_and_base_path()
+        with MapPool().map_for(style_xml, base_path, self.width, self.height) as mapnik_map:
+            image_out = self.render(mapnik_map)
+
+        if self.deleteStyle:
+            os.remove(self.style)
+
+        return image_out
+
+    def generate_tiles(self, tile_size):
+        '''
+        Renders the image once and answers it sliced in tiles of tile_size x tile_size pixels, by (column, row)
+        '''
+        style_xml, base_path = self.style_xml_and_base_path()
+        with MapPool().map_for(style_xml, base_path, self.width, self.height) as mapnik_map:
+            mapnik_image = self.render_image(mapnik_map)
+
+        tiles = {}
+        for column in range(self.width // tile_size):
+            for row in range(self.height // tile_size):
+                tile_view = mapnik_image.view(column * tile_size, row * tile_size, tile_size, tile_size)
+                tiles[(column, row)] = tile_view.tostring(self.imgType)
+        return tiles
+
+    def render(self, mapnik_map):
+        return self.render_image(mapnik_map).tostring(self.imgType)  # true-colour RGBA
+
+    def render_image(self, mapnik_map):
         self.layer = mapnik.Layer('Provinces')
-        self.layer.srs =self.spatialReference[self.srs]
+        self.layer.srs = self.proj4_srs()
         #sym = mapnik.PointSymbolizer("imgs/marker-icon.png", "png", 16, 16)
-        self.layer.datasource = mapnik.CSV(inline='wkt\n"'+self.wkt+'"', filesize_max=500)
+        self.layer.datasource = self.memory_datasource()
 
         # to use other datasources. The GeoJSON as datasource doesn't generate the image and we don't know why.
         #self.layer.datasource = mapnik.PostGIS(
@@ -90,23 +214,16 @@ class BuilderPNG(IBuilderImage):
         #self.layer.datasource = mapnik.Shapefile(file=self.geometry, encoding='latin1')
 
         self.layer.styles.append(self.geom_type)
-        self.mapnikObj.layers.append(self.layer)
+        mapnik_map.layers.append(self.layer)
 
         if self.bbox == 0:
-            self.mapnikObj.zoom_all()
+            mapnik_map.zoom_all()
+        else:
+            # the bbox is in the srs of the layer, nothing outside of it is rendered
+            mapnik_map.srs = self.layer.srs
+            mapnik_map.zoom_to_box(mapnik.Box2d(*self.bbox))
 
         # Render map
-        mapnik.render(self.mapnikObj, self.mapnikImg)
-
-        # Save image to files
-        image_complete_name = self.image_name+'.'+self.imgType
-        self.mapnikImg.save(image_complete_name, self.imgType)  # true-colour RGBA
-        image_file = open(image_complete_name, 'rb')
-        image_out = image_file.read()
-        image_file.close()
-
-        os.remove(image_complete_name)
-        if self.deleteStyle:
-            os.remove(self.style)
-
-        return image_out
\ No newline at end of file
+        mapnik_image = mapnik.Image(self.width, self.height)
+        mapnik.render(mapnik_map, mapnik_image)
+        return mapnik_image